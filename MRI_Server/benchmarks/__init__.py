@@ -0,0 +1 @@
+"""Benchmarks of the workout ingestion & analytics pipeline."""
@@ -0,0 +1,26 @@
+"""Benchmarks of the export & overview endpoints against the seeded database."""
+from tumsm_server.patient.lib import get_patient_xlsx
+from tumsm_server.patient.models import Patient
+
+
+def test_get_patient_xlsx(benchmark, db):
+    """Export of all workouts of a patient."""
+    patientId = Patient.query.first().id
+
+    def export():
+        db.session.remove()
+        return get_patient_xlsx(Patient.query.get(patientId), None, None)
+
+    assert benchmark(export)
+
+
+def test_workout_overviews(benchmark, testapp_patient):
+    """Workout overviews of a patient."""
+    resp = benchmark(testapp_patient.get, "/api/v1/workout/overviews")
+    assert len(resp.json["workouts"]) > 0
+
+
+def test_patient_overviews(benchmark, testapp_trainer):
+    """Overviews of all patients."""
+    resp = benchmark(testapp_trainer.get, "/api/v1/patient/overviews")
+    assert len(resp.json) > 0
@@ -0,0 +1,206 @@
+"""Benchmarks of the processing of uploaded healthkit workouts."""
+import datetime as dt
+import types
+
+import pytest
+
+from tests.helpers import health_kit_payload
+from tumsm_server.caching import ObjectLRU
+from tumsm_server.utils import dateTimeFormat, parse_date_time
+from tumsm_server.workout.downsampling import (
+    build_pyramid,
+    decode_pyramid,
+    encode_pyramid,
+    select_level,
+)
+from tumsm_server.workout.healthkitDataProcessor import process_health_kit_data
+from tumsm_server.workout.lib import (
+    get_combined_profile,
+    get_profile_columns,
+    get_splits,
+    get_training_zones,
+)
+from tumsm_server.workout.segmentIndex import SegmentIndex
+
+DURATIONS = [10 * 60, 60 * 60, 4 * 60 * 60]
+SENSOR_MIXES = {
+    "all": ("locations", "heartRate", "distance"),
+    "withoutLocations": ("heartRate", "distance"),
+    "heartRateOnly": ("heartRate",),
+}
+DEVICE_MIXES = {
+    "iPhoneAndWatch": ("iPhone", "Watch"),
+    "iPhone": ("iPhone",),
+}
+HEART_RATE_ZONES = types.SimpleNamespace(
+    upper0Bound=110, upper1Bound=130, upper2Bound=150, upper3Bound=170
+)
+
+PARSERS = {
+    "parse_date_time": parse_date_time,
+    "strptime": lambda timestamp: dt.datetime.strptime(timestamp, dateTimeFormat),
+}
+
+
+def combined_profile(duration, sample_period=10):
+    """Combined profile of a synthetic workout, as it is calculated when the workout is uploaded"""
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    return get_combined_profile(
+        sample_period,
+        startTime=result[2],
+        endTime=result[3],
+        heart_rate_profile=result[15],
+        speed_profile=result[16],
+        altitude_profile=result[17],
+        distance_profile=result[18],
+    )
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_process_health_kit_data(benchmark, duration):
+    """Processing of workouts of increasing length."""
+    payload = health_kit_payload(duration=duration)
+    assert benchmark(process_health_kit_data, payload) is not None
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_parse_timestamps(benchmark, parser):
+    """Parsing the timestamps of a 50k sample workout, compared with strptime."""
+    start = dt.datetime(2021, 11, 18, 8, 0, 0, 250000)
+    timestamps = [
+        (start + dt.timedelta(seconds=second)).strftime(dateTimeFormat)
+        for second in range(50000)
+    ]
+    parse = PARSERS[parser]
+    parsed = benchmark(lambda: [parse(timestamp) for timestamp in timestamps])
+    assert parsed[-1] == start + dt.timedelta(seconds=49999)
+
+
+@pytest.mark.parametrize("sensors", SENSOR_MIXES)
+@pytest.mark.parametrize("devices", DEVICE_MIXES)
+def test_process_health_kit_data_mix(benchmark, sensors, devices):
+    """Processing of one hour workouts recorded by different sensors & devices."""
+    payload = health_kit_payload(
+        duration=60 * 60, sensors=SENSOR_MIXES[sensors], devices=DEVICE_MIXES[devices]
+    )
+    assert benchmark(process_health_kit_data, payload) is not None
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+@pytest.mark.parametrize("sample_period", [1, 10])
+def test_get_combined_profile(benchmark, duration, sample_period):
+    """Resampling of the profiles of a workout."""
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    benchmark(
+        get_combined_profile,
+        sample_period,
+        startTime=result[2],
+        endTime=result[3],
+        heart_rate_profile=result[15],
+        speed_profile=result[16],
+        altitude_profile=result[17],
+        distance_profile=result[18],
+    )
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+@pytest.mark.parametrize("split_length", [100, 1000])
+def test_get_splits(benchmark, duration, split_length):
+    """Splits of a workout, from its distance, heart rate & speed samples."""
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    splits, _, _ = benchmark(
+        get_splits,
+        get_profile_columns(result[18], "distance"),
+        get_profile_columns(result[15], "heartRate"),
+        get_profile_columns(result[16], "speed"),
+        split_length,
+    )
+    assert len(splits) > 0
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_get_training_zones(benchmark, duration):
+    """Training zone histogram of a workout."""
+    profile = combined_profile(duration)
+    zones = benchmark(get_training_zones, HEART_RATE_ZONES, profile, 37, "heartRate")
+    assert zones["total"] == len(profile)
+
+
+def segment_index(duration):
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    return SegmentIndex(
+        get_profile_columns(result[15], "heartRate"),
+        get_profile_columns(result[16], "speed"),
+        get_profile_columns(result[17], "altitude"),
+        (110, 130, 150, 170),
+    )
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_build_segment_index(benchmark, duration):
+    """Building the segment index of a workout."""
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    benchmark(
+        SegmentIndex,
+        get_profile_columns(result[15], "heartRate"),
+        get_profile_columns(result[16], "speed"),
+        get_profile_columns(result[17], "altitude"),
+        (110, 130, 150, 170),
+    )
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_segment_query(benchmark, duration):
+    """Statistics of a segment spanning the middle half of a workout."""
+    index = segment_index(duration)
+    segment = benchmark(index.segment, duration / 4, duration * 3 / 4)
+    assert segment["heartRate"]["samples"] > 0
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_cached_segment_query(benchmark, duration):
+    """Statistics of a segment of a workout whose index is cached."""
+    indexes = ObjectLRU()
+    indexes.set("workout", segment_index(duration))
+
+    def cached_segment():
+        return indexes.get("workout").segment(duration / 4, duration * 3 / 4)
+
+    assert benchmark(cached_segment)["heartRate"]["samples"] > 0
+
+
+def sample_columns(duration):
+    result = process_health_kit_data(health_kit_payload(duration=duration))
+    return {
+        "heartRate": get_profile_columns(result[15], "heartRate"),
+        "speed": get_profile_columns(result[16], "speed"),
+        "altitude": get_profile_columns(result[17], "altitude"),
+    }
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_encode_pyramid(benchmark, duration):
+    """Building & encoding the downsampling pyramid of a workout, as it is done on upload."""
+    benchmark(encode_pyramid, sample_columns(duration))
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+@pytest.mark.parametrize("max_points", [300, 1000])
+def test_select_level(benchmark, duration, max_points):
+    """Decoding a stored pyramid & selecting the levels of a chart."""
+    blob = encode_pyramid(sample_columns(duration))
+
+    def downsampled_profiles():
+        return {
+            value_key: select_level(levels, max_points)
+            for value_key, levels in decode_pyramid(blob).items()
+        }
+
+    profiles = benchmark(downsampled_profiles)
+    assert all(len(values) <= max_points for _, values in profiles.values())
+
+
+@pytest.mark.parametrize("duration", DURATIONS)
+def test_build_pyramid_on_the_fly(benchmark, duration):
+    """Downsampling the heart rate samples of a workout stored without a pyramid."""
+    benchmark(build_pyramid, *sample_columns(duration)["heartRate"])
@@ -0,0 +1,66 @@
+"""Defines the seeded database the benchmarks run against."""
+
+import logging
+import types
+
+import pytest
+from webtest import TestApp
+
+import tests.settings
+from tests.helpers import authorize
+from tumsm_server.app import create_app
+from tumsm_server.database import db as _db
+from tumsm_server.patient.models import Patient
+from tumsm_server.trainer.models import Trainer
+
+from .seeding import seed
+
+PATIENTS = 5
+WORKOUTS_PER_PATIENT = 20
+WORKOUT_DURATION = 3600
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """Create application with a seeded SQLite database file.
+
+    A study group of PATIENTS patients with WORKOUTS_PER_PATIENT workouts each.
+    """
+    settings = types.SimpleNamespace(
+        **{key: getattr(tests.settings, key) for key in dir(tests.settings)}
+    )
+    databaseFile = tmp_path_factory.mktemp("benchmarks") / "seeded.db"
+    settings.SQLALCHEMY_DATABASE_URI = f"sqlite:///{databaseFile}"
+    _app = create_app(settings)
+    _app.logger.setLevel(logging.CRITICAL)
+    with _app.app_context():
+        _db.create_all()
+        seed(
+            patientsPerGroup=PATIENTS,
+            workoutsPerPatient=WORKOUTS_PER_PATIENT,
+            workoutDuration=WORKOUT_DURATION,
+        )
+        _db.session.remove()
+    return _app
+
+
+@pytest.fixture
+def db(app):
+    """Database session of a single benchmark, the seeded data is shared by all benchmarks."""
+    with app.app_context():
+        yield _db
+        _db.session.remove()
+
+
+@pytest.fixture
+def testapp_trainer(app):
+    """Create Webtest app, authorized as trainer."""
+    with app.app_context():
+        return authorize(TestApp(app), Trainer.query.first().account)
+
+
+@pytest.fixture
+def testapp_patient(app):
+    """Create Webtest app, authorized as the first patient."""
+    with app.app_context():
+        return authorize(TestApp(app), Patient.query.first().account)
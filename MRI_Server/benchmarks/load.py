@@ -0,0 +1,304 @@
+"""Load generator, which replays mixed patient & trainer traffic against a running server.
+
+Seed the database of the server, then replay the traffic and report the latency percentiles per route:
+
+    python -m benchmarks.load seed
+    python -m benchmarks.load run --url http://localhost:5000 --duration 60 --rate upload=5
+"""
+import base64
+import datetime as dt
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+import requests
+import xlsxwriter
+
+from tests.helpers import health_kit_payload
+from tumsm_server.app import create_app
+from tumsm_server.planning.lib import (
+    dateKey,
+    minDistanceKey,
+    minDurationKey,
+    typeKey,
+)
+
+from . import seeding
+
+defaultRates = {
+    "upload": 1,
+    "workout": 2,
+    "workoutOverviews": 2,
+    "patientOverviews": 0.5,
+    "sync": 2,
+    "export": 0.1,
+    "import": 0.1,
+}
+percentiles = [50, 90, 95, 99]
+
+
+class Traffic:
+    """Requests of the seeded trainer & patients, authorized against the server"""
+
+    def __init__(self, url, prefix, workoutDuration):
+        self.url = url.rstrip("/") + "/api/v1"
+        self.sessions = threading.local()
+        self.trainer = self.authorize(f"{prefix}Trainer")
+        usernames = [
+            account["username"]
+            for account in self.get(self.trainer, "/account/overviews").json()
+            if account["username"].startswith(f"{prefix}Patient")
+        ]
+        if not usernames:
+            raise click.ClickException(f"No patients named {prefix}Patient<n> found")
+        self.patients = []
+        for username in usernames:
+            patient = self.authorize(username)
+            patient["workoutIds"] = [
+                workout["id"]
+                for workout in self.get(patient, "/sync").json()["workouts"]["updated"]
+            ]
+            self.patients.append(patient)
+        # Uploads only differ in their appleUUID, so the client doesn't have to generate each workout
+        self.uploadTemplate = json.dumps(health_kit_payload(duration=workoutDuration))
+        self.uploadUUID = health_kit_payload(duration=0)["appleUUID"]
+        self.plan = planning_xlsx()
+
+    @property
+    def session(self):
+        """Session of the current thread, to reuse its connections"""
+        if not hasattr(self.sessions, "session"):
+            self.sessions.session = requests.Session()
+        return self.sessions.session
+
+    def authorize(self, username):
+        resp = self.session.post(
+            self.url + "/account/auth",
+            json={"username": username, "password": seeding.password},
+        )
+        if resp.status_code != 200:
+            raise click.ClickException(f"Could not authorize {username}: {resp.text}")
+        return {
+            "headers": {"Authorization": f"Bearer {resp.json()['token']}"},
+            "patientId": resp.json().get("patientId"),
+        }
+
+    def get(self, account, path, **params):
+        return self.session.get(
+            self.url + path, params=params, headers=account["headers"], timeout=120
+        )
+
+    def post(self, account, path, body):
+        return self.session.post(
+            self.url + path, json=body, headers=account["headers"], timeout=120
+        )
+
+    def request(self, route, rng):
+        """Send one request of the route as a random patient, return the response"""
+        patient = rng.choice(self.patients)
+        if route == "upload":
+            payload = self.uploadTemplate.replace(
+                self.uploadUUID, str(uuid.uuid4()).upper()
+            )
+            return self.post(patient, "/workout", {"healthJsonData": payload})
+        if route == "workout":
+            if not patient["workoutIds"]:
+                return self.get(patient, "/workout/overviews")
+            return self.get(
+                patient,
+                "/workout",
+                id=rng.choice(patient["workoutIds"]),
+                sampleRate=10,
+            )
+        if route == "workoutOverviews":
+            return self.get(
+                self.trainer, "/workout/overviews", patientId=patient["patientId"]
+            )
+        if route == "patientOverviews":
+            return self.get(self.trainer, "/patient/overviews")
+        if route == "sync":
+            return self.get(patient, "/sync")
+        if route == "export":
+            return self.get(
+                self.trainer, "/patient/export", patientIds=patient["patientId"]
+            )
+        if route == "import":
+            return self.post(
+                self.trainer,
+                "/planning/import",
+                {"patientId": patient["patientId"], "xlsxBase64": self.plan},
+            )
+        raise ValueError(f"Unknown route {route}")
+
+
+def planning_xlsx():
+    """Base64 encoded training plan of a week, as it is imported by trainers"""
+    file = io.BytesIO()
+    workbook = xlsxwriter.Workbook(file, {"in_memory": True})
+    sheet = workbook.add_worksheet()
+    dateFormat = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    sheet.write_row(0, 0, [dateKey, typeKey, minDurationKey, minDistanceKey])
+    for day in range(7):
+        sheet.write_datetime(
+            day + 1,
+            0,
+            dt.datetime.combine(dt.date.today() + dt.timedelta(days=day), dt.time()),
+            dateFormat,
+        )
+        sheet.write_row(day + 1, 1, ["Laufen", 30, 5000])
+    workbook.close()
+    return base64.b64encode(file.getvalue()).decode("UTF-8")
+
+
+def replay(traffic, rates, duration, concurrency):
+    """Send Poisson distributed requests of every route at its rate for the duration
+
+    The requests are scheduled independently of the responses (open loop), a request's latency includes the time it
+    waited for a free connection, so overload shows up as growing latencies instead of a lower request rate.
+    """
+    rates = {route: rate for route, rate in rates.items() if rate > 0}
+    results = {route: [] for route in rates}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def send(route, scheduled, rng):
+        try:
+            ok = traffic.request(route, rng).status_code < 400
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - scheduled
+        with lock:
+            results[route].append((latency, ok))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def schedule(route, rate, seed):
+            rng = random.Random(seed)
+            scheduled = started
+            while True:
+                scheduled += rng.expovariate(rate)
+                if scheduled - started > duration:
+                    return
+                time.sleep(max(0, scheduled - time.perf_counter()))
+                executor.submit(
+                    send, route, scheduled, random.Random(rng.getrandbits(32))
+                )
+
+        schedulers = [
+            threading.Thread(target=schedule, args=(route, rate, seed))
+            for seed, (route, rate) in enumerate(rates.items())
+        ]
+        for scheduler in schedulers:
+            scheduler.start()
+        for scheduler in schedulers:
+            scheduler.join()
+    return results, time.perf_counter() - started
+
+
+def report(results, elapsed):
+    """Latency percentiles (in ms), throughput & errors per route"""
+    rows = {}
+    for route, samples in results.items():
+        latencies = np.array([latency for latency, _ in samples]) * 1000
+        rows[route] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, ok in samples if not ok),
+            "throughput": len(samples) / elapsed,
+            **{
+                f"p{percentile}": float(np.percentile(latencies, percentile))
+                if len(latencies) > 0
+                else None
+                for percentile in percentiles
+            },
+            "max": float(latencies.max()) if len(latencies) > 0 else None,
+        }
+    return rows
+
+
+def format_report(rows):
+    columns = ["requests", "errors", "throughput"] + [
+        f"p{percentile}" for percentile in percentiles
+    ]
+    columns.append("max")
+    lines = [f"{'route':<18}" + "".join(f"{column:>12}" for column in columns)]
+    for route, row in rows.items():
+        cells = [
+            "-"
+            if row[column] is None
+            else f"{row[column]:.1f}"
+            if isinstance(row[column], float)
+            else str(row[column])
+            for column in columns
+        ]
+        lines.append(f"{route:<18}" + "".join(f"{cell:>12}" for cell in cells))
+    return "\n".join(lines)
+
+
+@click.group()
+def cli():
+    """Load test of a running server."""
+
+
+@cli.command()
+@click.option("--study-groups", default=3, help="Amount of study groups.")
+@click.option("--patients-per-group", default=10, help="Patients per study group.")
+@click.option("--workouts-per-patient", default=30, help="Workouts per patient.")
+@click.option("--workout-duration", default=3600, help="Mean workout length (s).")
+@click.option("--prefix", default="load", help="Prefix of the seeded usernames.")
+def seed(
+    study_groups, patients_per_group, workouts_per_patient, workout_duration, prefix
+):
+    """Seed the database of the app (DATABASE_URL) with a trainer, study groups & patients."""
+    with create_app().app_context():
+        seeding.seed(
+            studyGroups=study_groups,
+            patientsPerGroup=patients_per_group,
+            workoutsPerPatient=workouts_per_patient,
+            workoutDuration=workout_duration,
+            prefix=prefix,
+            end=dt.date.today(),
+        )
+    click.echo(
+        f"Seeded {study_groups * patients_per_group} patients, "
+        f"log in as {prefix}Trainer with password {seeding.password}"
+    )
+
+
+@cli.command()
+@click.option("--url", default="http://localhost:5000", help="Base url of the server.")
+@click.option("--duration", default=60.0, help="Duration of the replay (s).")
+@click.option(
+    "--rate",
+    "rateOptions",
+    multiple=True,
+    help="Requests per second of a route as route=rate, e.g. upload=5. "
+    f"Routes: {', '.join(defaultRates)}.",
+)
+@click.option("--concurrency", default=32, help="Maximal amount of open requests.")
+@click.option("--workout-duration", default=3600, help="Length of uploads (s).")
+@click.option("--prefix", default="load", help="Prefix of the seeded usernames.")
+@click.option("--output", type=click.File("w"), help="Write the report as JSON.")
+def run(url, duration, rateOptions, concurrency, workout_duration, prefix, output):
+    """Replay mixed traffic of the seeded accounts & report latency percentiles (ms) per route."""
+    rates = dict(defaultRates)
+    for option in rateOptions:
+        route, _, rate = option.partition("=")
+        if route not in defaultRates:
+            raise click.BadParameter(f"Unknown route {route}", param_hint="--rate")
+        rates[route] = float(rate)
+    traffic = Traffic(url, prefix, workout_duration)
+    results, elapsed = replay(traffic, rates, duration, concurrency)
+    rows = report(results, elapsed)
+    click.echo(format_report(rows))
+    if output is not None:
+        json.dump({"rates": rates, "concurrency": concurrency, "routes": rows}, output)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,77 @@
+"""Seeding of a database with study groups, patients & their workouts."""
+import datetime as dt
+import random
+
+from tests.helpers import health_kit_payload
+from tumsm_server.account.models import Account
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.patient.models import Patient
+from tumsm_server.studygroup.models import (
+    StudyGroup,
+    StudyGroupPatients,
+    StudyGroupTrainers,
+)
+from tumsm_server.trainer.models import Trainer
+from tumsm_server.workout.lib import create_workouts
+
+password = "myprecious"
+
+
+def create_account(username):
+    return Account.create(
+        username=username,
+        email=f"{username}@example.com",
+        password=password,
+        birthday=dt.date(1990, 1, 1),
+        firstName="Max",
+        lastName=username,
+        active=True,
+    )
+
+
+def seed(
+    studyGroups=1,
+    patientsPerGroup=5,
+    workoutsPerPatient=20,
+    workoutDuration=3600,
+    prefix="seeded",
+    end=dt.date(2021, 11, 30),
+):
+    """Seed a trainer and study groups of patients with training zones & workouts
+
+    The accounts are named {prefix}Trainer & {prefix}Patient{n}. Every patient has a workout every second day before
+    the end date, the workouts last between half and one and a half times the workout duration.
+    """
+    rng = random.Random(0)
+    trainer = Trainer.create(accountId=create_account(f"{prefix}Trainer").id)
+    for group in range(studyGroups):
+        studyGroup = StudyGroup.create(name=f"{prefix}Group{group}")
+        StudyGroupTrainers.create(studyGroupId=studyGroup.id, trainerId=trainer.id)
+        for member in range(patientsPerGroup):
+            account = create_account(
+                f"{prefix}Patient{group * patientsPerGroup + member}"
+            )
+            patient = Patient.create(
+                accountId=account.id,
+                treatmentStarted=end - dt.timedelta(days=2 * workoutsPerPatient),
+                treatmentFinished=end + dt.timedelta(days=90),
+                treatmentGoal="Run a marathon",
+            )
+            StudyGroupPatients.create(studyGroupId=studyGroup.id, patientId=patient.id)
+            create_patient_training_zones(
+                patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+            )
+            create_patient_training_zones(patient.id, 37, "SPEED", 6, 8, 10, 12)
+            payloads = [
+                health_kit_payload(
+                    duration=int(workoutDuration * rng.uniform(0.5, 1.5)),
+                    seed=day,
+                    start=dt.datetime.combine(
+                        end - dt.timedelta(days=2 * day), dt.time(8)
+                    )
+                    + dt.timedelta(minutes=rng.randrange(12 * 60)),
+                )
+                for day in range(workoutsPerPatient)
+            ]
+            create_workouts(payloads, patient.id)
+    return trainer
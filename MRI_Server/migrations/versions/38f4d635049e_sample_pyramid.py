@@ -0,0 +1,195 @@
+"""downsampled sample pyramids of workouts
+
+Revision ID: 38f4d635049e
+Revises: 8adaad706f09
+Create Date: 2022-02-14 11:02:37.418920
+
+"""
+import json
+import struct
+import zlib
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '38f4d635049e'
+down_revision = '8adaad706f09'
+branch_labels = None
+depends_on = None
+
+
+# A frozen copy of the pyramid (tumsm_server/workout/downsampling.py) & of version 1 of the sample encoding
+# (tumsm_server/workout/sampleEncoding.py), so later changes of either don't change what this migration writes
+PYRAMID_SIZES = (4096, 2048, 1024, 512, 256, 128)
+LENGTH = struct.Struct("<I")
+MAGIC = b"TSS"
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_DELTA_TIMES = 0x02
+HEADER = struct.Struct("<3sBBcBI")
+
+SAMPLE_COLUMNS = {
+    "heartRateSamples": "heartRate",
+    "speedSamples": "speed",
+    "altitudeSamples": "altitude",
+    "distanceSamples": "distance",
+}
+
+workouts_table = sa.table(
+    "workouts",
+    sa.column("id", sa.Integer),
+    sa.column("samplePyramid"),
+    *[sa.column(c) for c in SAMPLE_COLUMNS],
+)
+
+
+def encode_sample_columns(times, values, value_key):
+    times = np.asarray(times, dtype="<f8")
+    values = np.asarray(values, dtype="<f8")
+    flags = FLAG_ZLIB
+
+    microseconds = np.round(times * 1e6).astype("<i8")
+    if np.array_equal(microseconds / 1e6, times):
+        flags |= FLAG_DELTA_TIMES
+        times_bytes = np.diff(microseconds, prepend=0).astype("<i8").tobytes()
+    else:
+        times_bytes = times.tobytes()
+
+    single_values = values.astype("<f4")
+    if np.array_equal(single_values.astype("<f8"), values, equal_nan=True):
+        value_type = b"f"
+        values_bytes = single_values.tobytes()
+    else:
+        value_type = b"d"
+        values_bytes = values.tobytes()
+
+    key = value_key.encode()
+    header = HEADER.pack(MAGIC, VERSION, flags, value_type, len(key), len(values))
+    return header + key + zlib.compress(times_bytes + values_bytes)
+
+
+def decode_sample_columns(blob, value_key):
+    if blob is None:
+        return np.empty(0), np.empty(0)
+    if bytes(blob[: len(MAGIC)]) != MAGIC:
+        profile = json.loads(bytes(blob).decode()) or []
+        times = np.fromiter((sample["seconds_since_start"] for sample in profile), float, len(profile))
+        values = np.fromiter((sample[value_key] for sample in profile), float, len(profile))
+        return times, values
+    blob = bytes(blob)
+    _, _, flags, value_type, key_length, count = HEADER.unpack_from(blob)
+    payload = blob[HEADER.size + key_length:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & FLAG_DELTA_TIMES:
+        times = np.cumsum(np.frombuffer(payload, dtype="<i8", count=count)) / 1e6
+    else:
+        times = np.frombuffer(payload, dtype="<f8", count=count).astype(float)
+    values = np.frombuffer(
+        payload, dtype="<f4" if value_type == b"f" else "<f8", count=count, offset=count * 8
+    ).astype(float)
+    return times, values
+
+
+def lttb(times, values, threshold):
+    count = len(values)
+    if count <= threshold or count <= 2:
+        return times, values
+    if threshold < 3:
+        kept = [0, count - 1][:threshold]
+        return times[kept], values[kept]
+
+    bounds = np.linspace(1, count - 1, threshold - 1).astype(int)
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    time_sums = np.concatenate(([0.0], np.cumsum(times)))
+    bucket_sizes = np.diff(bounds)
+    next_times = np.append((time_sums[bounds[2:]] - time_sums[bounds[1:-1]]) / bucket_sizes[1:], times[-1])
+    next_values = np.append((value_sums[bounds[2:]] - value_sums[bounds[1:-1]]) / bucket_sizes[1:], values[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = count - 1
+    times_list = times.tolist()
+    values_list = values.tolist()
+    previous = 0
+    for bucket in range(threshold - 2):
+        previous_time = times_list[previous]
+        previous_value = values_list[previous]
+        time_span = next_times[bucket] - previous_time
+        value_span = next_values[bucket] - previous_value
+        largest = -1.0
+        for index in range(bounds[bucket], bounds[bucket + 1]):
+            area = abs(
+                time_span * (values_list[index] - previous_value)
+                - (times_list[index] - previous_time) * value_span
+            )
+            if area > largest:
+                largest = area
+                previous = index
+        selected[bucket + 1] = previous
+    return times[selected], values[selected]
+
+
+def build_pyramid(times, values):
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+    levels = []
+    for size in PYRAMID_SIZES:
+        times, values = lttb(times, values, size)
+        if len(levels) > 0 and len(values) == len(levels[-1][1]):
+            break
+        levels.append((times, values))
+    return levels
+
+
+def encode_pyramid(sample_columns):
+    blob = bytearray()
+    for value_key, (times, values) in sample_columns.items():
+        for level_times, level_values in build_pyramid(times, values):
+            column = encode_sample_columns(level_times, level_values, value_key)
+            blob += LENGTH.pack(len(column)) + column
+    return bytes(blob)
+
+
+def build_pyramid_batch(connection, after_id, batch_size=100):
+    rows = connection.execute(
+        sa.select(workouts_table)
+        .where(workouts_table.c.id > after_id, workouts_table.c.samplePyramid.is_(None))
+        .order_by(workouts_table.c.id)
+        .limit(batch_size)
+    ).fetchall()
+    for row in rows:
+        pyramid = encode_pyramid(
+            {
+                value_key: decode_sample_columns(row._mapping[column], value_key)
+                for column, value_key in SAMPLE_COLUMNS.items()
+            }
+        )
+        connection.execute(
+            workouts_table.update().where(workouts_table.c.id == row.id).values(samplePyramid=pyramid)
+        )
+    if len(rows) == 0:
+        return None
+    return rows[-1].id
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('workouts', sa.Column('samplePyramid', sa.LargeBinary(), nullable=True))
+    # ### end Alembic commands ###
+    connection = op.get_bind()
+    last_id = 0
+    while last_id is not None:
+        last_id = build_pyramid_batch(connection, last_id)
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_column('workouts', 'samplePyramid')
+    # ### end Alembic commands ###
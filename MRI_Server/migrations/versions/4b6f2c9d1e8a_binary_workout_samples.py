@@ -0,0 +1,134 @@
+"""encode workout sample columns as packed binary arrays
+
+Revision ID: 4b6f2c9d1e8a
+Revises: 17f1f59a7539
+Create Date: 2022-01-12 10:14:52.804113
+
+"""
+import json
+import struct
+import zlib
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b6f2c9d1e8a'
+down_revision = '17f1f59a7539'
+branch_labels = None
+depends_on = None
+
+
+# A frozen copy of version 1 of the sample encoding (tumsm_server/workout/sampleEncoding.py), so later changes of the
+# encoding don't change what this migration writes
+MAGIC = b"TSS"
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_DELTA_TIMES = 0x02
+HEADER = struct.Struct("<3sBBcBI")
+
+SAMPLE_COLUMNS = {
+    "heartRateSamples": "heartRate",
+    "speedSamples": "speed",
+    "altitudeSamples": "altitude",
+    "distanceSamples": "distance",
+}
+
+workouts_table = sa.table(
+    "workouts", sa.column("id", sa.Integer), *[sa.column(c) for c in SAMPLE_COLUMNS]
+)
+
+
+def is_encoded(blob):
+    return blob is not None and bytes(blob[: len(MAGIC)]) == MAGIC
+
+
+def encode_samples(profile, value_key):
+    times = np.fromiter((sample["seconds_since_start"] for sample in profile), float, len(profile))
+    values = np.fromiter((sample[value_key] for sample in profile), float, len(profile))
+    flags = FLAG_ZLIB
+
+    microseconds = np.round(times * 1e6).astype("<i8")
+    if np.array_equal(microseconds / 1e6, times):
+        flags |= FLAG_DELTA_TIMES
+        times_bytes = np.diff(microseconds, prepend=0).astype("<i8").tobytes()
+    else:
+        times_bytes = times.astype("<f8").tobytes()
+
+    single_values = values.astype("<f4")
+    if np.array_equal(single_values.astype("<f8"), values, equal_nan=True):
+        value_type = b"f"
+        values_bytes = single_values.tobytes()
+    else:
+        value_type = b"d"
+        values_bytes = values.astype("<f8").tobytes()
+
+    key = value_key.encode()
+    header = HEADER.pack(MAGIC, VERSION, flags, value_type, len(key), len(values))
+    return header + key + zlib.compress(times_bytes + values_bytes)
+
+
+def decode_samples(blob, value_key):
+    if not is_encoded(blob):
+        profile = json.loads(bytes(blob).decode())
+        return profile if profile is not None else []
+    blob = bytes(blob)
+    _, _, flags, value_type, key_length, count = HEADER.unpack_from(blob)
+    payload = blob[HEADER.size + key_length:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & FLAG_DELTA_TIMES:
+        times = np.cumsum(np.frombuffer(payload, dtype="<i8", count=count)) / 1e6
+    else:
+        times = np.frombuffer(payload, dtype="<f8", count=count)
+    values = np.frombuffer(
+        payload, dtype="<f4" if value_type == b"f" else "<f8", count=count, offset=count * 8
+    )
+    return [
+        {value_key: value, "seconds_since_start": seconds}
+        for value, seconds in zip(values.astype(float).tolist(), times.astype(float).tolist())
+    ]
+
+
+def reencode_sample_batch(connection, after_id, batch_size=100, binary=True):
+    rows = connection.execute(
+        sa.select(workouts_table)
+        .where(workouts_table.c.id > after_id)
+        .order_by(workouts_table.c.id)
+        .limit(batch_size)
+    ).fetchall()
+    for row in rows:
+        updated = {}
+        for column, value_key in SAMPLE_COLUMNS.items():
+            blob = row._mapping[column]
+            if blob is None or is_encoded(blob) == binary:
+                continue
+            profile = decode_samples(blob, value_key)
+            if binary:
+                updated[column] = encode_samples(profile, value_key)
+            else:
+                updated[column] = str.encode(json.dumps(profile))
+        if len(updated) > 0:
+            connection.execute(
+                workouts_table.update().where(workouts_table.c.id == row.id).values(**updated)
+            )
+    if len(rows) == 0:
+        return None
+    return rows[-1].id
+
+
+def convert_samples(binary):
+    connection = op.get_bind()
+    last_id = 0
+    while last_id is not None:
+        last_id = reencode_sample_batch(connection, last_id, binary=binary)
+
+
+def upgrade():
+    convert_samples(binary=True)
+
+
+def downgrade():
+    convert_samples(binary=False)
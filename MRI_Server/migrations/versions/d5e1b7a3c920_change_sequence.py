@@ -0,0 +1,36 @@
+"""change sequence
+
+Revision ID: d5e1b7a3c920
+Revises: 38f4d635049e
+Create Date: 2022-02-16 11:04:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e1b7a3c920'
+down_revision = '38f4d635049e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('patients', sa.Column('changeSequence', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('changes', sa.Column('sequence', sa.Integer(), server_default='0', nullable=False))
+    # The ids of the logged changes are the cursors clients already hold
+    op.execute('UPDATE changes SET sequence = id')
+    op.execute(
+        'UPDATE patients SET "changeSequence" = '
+        '(SELECT COALESCE(MAX(changes.id), 0) FROM changes WHERE changes."patientId" = patients.id)'
+    )
+    op.drop_index('ix_changes_patientId_id', table_name='changes')
+    op.create_index('ix_changes_patientId_sequence', 'changes', ['patientId', 'sequence'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_changes_patientId_sequence', table_name='changes')
+    op.create_index('ix_changes_patientId_id', 'changes', ['patientId', 'id'], unique=False)
+    op.drop_column('changes', 'sequence')
+    op.drop_column('patients', 'changeSequence')
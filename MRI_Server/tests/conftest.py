@@ -1,5 +1,6 @@
 """Defines fixtures available to all tests."""
 
+import datetime as dt
 import logging
 
 import pytest
@@ -7,8 +8,11 @@ from webtest import TestApp
 
 from tumsm_server.app import create_app
 from tumsm_server.database import db as _db
+from tumsm_server.patient.models import Patient
+from tumsm_server.trainer.models import Trainer
 
-from .factories import PatientFactory, UserFactory
+from .factories import AccountFactory, PatientFactory, UserFactory
+from .helpers import authorize
 
 
 @pytest.fixture
@@ -76,3 +80,36 @@ def patient(db):
     patient = PatientFactory(password="myprecious")
     db.session.commit()
     return patient
+
+
+@pytest.fixture
+def trainer(db):
+    """Create a trainer account for the tests."""
+    account = AccountFactory(password="myprecious")
+    db.session.commit()
+    return Trainer.create(accountId=account.id)
+
+
+@pytest.fixture
+def treated_patient(db):
+    """Create a patient with an account for the tests."""
+    account = AccountFactory(password="myprecious")
+    db.session.commit()
+    return Patient.create(
+        accountId=account.id,
+        treatmentStarted=dt.date(2021, 10, 1),
+        treatmentFinished=dt.date(2022, 3, 31),
+        treatmentGoal="Run a marathon",
+    )
+
+
+@pytest.fixture
+def testapp_trainer(testapp, trainer):
+    """Create Webtest app, authorized as trainer."""
+    return authorize(testapp, trainer.account)
+
+
+@pytest.fixture
+def testapp_patient(testapp, treated_patient):
+    """Create Webtest app, authorized as patient."""
+    return authorize(testapp, treated_patient.account)
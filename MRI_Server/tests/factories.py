@@ -1,7 +1,10 @@
 """Factories to help in tests."""
+import datetime as dt
+
 from factory import PostGenerationMethodCall, Sequence
 from factory.alchemy import SQLAlchemyModelFactory
 
+from tumsm_server.account.models import Account
 from tumsm_server.patient.models import Patient
 from tumsm_server.database import db
 from tumsm_server.user.models import User
@@ -43,3 +46,20 @@ class PatientFactory(BaseFactory):
         """Factory configuration."""
 
         model = Patient
+
+
+class AccountFactory(BaseFactory):
+    """Account factory."""
+
+    username = Sequence(lambda n: f"account{n}")
+    email = Sequence(lambda n: f"account{n}@example.com")
+    birthday = dt.date(1990, 1, 1)
+    firstName = "Max"
+    lastName = Sequence(lambda n: f"Mustermann{n}")
+    password = PostGenerationMethodCall("set_password", "example")
+    active = True
+
+    class Meta:
+        """Factory configuration."""
+
+        model = Account
@@ -1,5 +1,112 @@
+import datetime
+import random
+
+from sqlalchemy import event
+
+from tumsm_server.utils import format_date_time
+
+
 def get_patient_username(testapp):
     resp = testapp.get(f"/api/v1/patients")
     patients = [patient["username"] for patient in resp.json.values()]
     assert patients, "`patient` fixture should have provided at least one patient"
     return patients[0]
+
+
+def authorize(testapp, account):
+    """Authorizes all following requests of the test app as the given account"""
+    resp = testapp.post_json(
+        "/api/v1/account/auth",
+        {"username": account.username, "password": "myprecious"},
+    )
+    testapp.authorization = ("Bearer", resp.json["token"])
+    return testapp
+
+
+def health_kit_payload(
+    duration=3600,
+    location_period=1,
+    heart_rate_period=5,
+    distance_period=10,
+    seed=0,
+    sensors=("locations", "heartRate", "distance"),
+    devices=("iPhone", "Watch"),
+    start=datetime.datetime(2021, 11, 18, 8, 0, 0, 250000),
+):
+    """Generates a synthetic healthkit workout as it is uploaded by the iPhone app
+
+    The sensors select the recorded sample streams, the devices those which record distance samples.
+    """
+    rng = random.Random(seed)
+
+    def timestamp(seconds):
+        return format_date_time(start + datetime.timedelta(seconds=seconds))
+
+    deviceStrings = {
+        "iPhone": "Optional(<<HKDevice: 0x1>, name:iPhone, model:iPhone, hardware:iPhone12,1>)",
+        "Watch": "Optional(<<HKDevice: 0x2>, name:Apple Watch, model:Watch, hardware:Watch6,1>)",
+    }
+    altitude = 500.0
+    locations = []
+    for second in range(0, duration if "locations" in sensors else 0, location_period):
+        altitude += rng.uniform(-0.5, 0.5)
+        locations.append(
+            {
+                "timestamp": timestamp(second),
+                "altitude": altitude,
+                "speed": {"doubleValue": rng.uniform(2.5, 3.5)},
+            }
+        )
+    heart_rate_samples = [
+        {
+            "startTime": timestamp(second),
+            "endTime": timestamp(second + heart_rate_period),
+            "quantity": {"doubleValue": float(rng.randint(90, 180))},
+        }
+        for second in range(
+            0, duration if "heartRate" in sensors else 0, heart_rate_period
+        )
+    ]
+    distance_samples = []
+    for second in range(0, duration if "distance" in sensors else 0, distance_period):
+        for device in devices:
+            distance_samples.append(
+                {
+                    "startTime": timestamp(second),
+                    "endTime": timestamp(second + distance_period),
+                    "device": deviceStrings[device],
+                    "quantity": {"doubleValue": rng.uniform(25, 35)},
+                }
+            )
+    return {
+        "appleUUID": f"00000000-0000-0000-0000-{seed:012d}",
+        "activityType": 37,
+        "startDate": timestamp(0),
+        "endDate": timestamp(duration),
+        "duration": {"doubleValue": float(duration)},
+        "totalDistance": {"doubleValue": 3.0 * duration},
+        "totalCalories": {"doubleValue": duration / 6},
+        "workoutEvents": [],
+        "heartRateSamples": heart_rate_samples,
+        "locations": locations,
+        "distanceWalkingRunningSamples": distance_samples,
+    }
+
+
+class StatementRecorder:
+    """Records the statements which are sent to the database."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            self.statements.append((statement, parameters))
@@ -7,6 +7,8 @@ BCRYPT_LOG_ROUNDS = (
     4  # For faster tests; needs at least 4 to avoid "ValueError: Invalid rounds"
 )
 DEBUG_TB_ENABLED = False
-CACHE_TYPE = "simple"  # Can be "memcached", "redis", etc.
+CACHE_TYPE = "tumsm_server.caching.LRUCache"  # Can be "memcached", "redis", etc.
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 WTF_CSRF_ENABLED = False  # Allows form testing
+RECOMPUTE_PROCESSES = 1
+RECOMPUTE_BATCH_SIZE = 100
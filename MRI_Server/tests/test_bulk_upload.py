@@ -0,0 +1,81 @@
+"""Bulk workout upload tests."""
+import json
+
+import pytest
+from sqlalchemy import event
+
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import RawWorkout, Workout
+
+from .helpers import StatementRecorder, health_kit_payload
+
+
+@pytest.mark.usefixtures("db")
+class TestBulkUpload:
+    """Multiple workouts are uploaded in one request."""
+
+    def test_statuses(self, treated_patient, testapp_patient):
+        """Every workout gets its own status."""
+        existing = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        broken = health_kit_payload(duration=60, seed=3)
+        del broken["locations"]
+        resp = testapp_patient.post_json(
+            "/api/v1/workout/bulk",
+            {
+                "workouts": [
+                    health_kit_payload(duration=60),
+                    json.dumps(health_kit_payload(duration=60, seed=1)),
+                    health_kit_payload(duration=60, seed=2),
+                    health_kit_payload(duration=60, seed=2),
+                    broken,
+                    "{",
+                ]
+            },
+        )
+        statuses = resp.json["workouts"]
+        assert [status["status"] for status in statuses] == [
+            "exists",
+            "created",
+            "created",
+            "exists",
+            "invalid",
+            "invalid",
+        ]
+        assert statuses[0]["workout"] == existing.id
+        assert statuses[2]["workout"] == statuses[3]["workout"]
+        assert Workout.query.count() == RawWorkout.query.count() == 3
+        created = Workout.query.get(statuses[1]["workout"])
+        assert created.appleUUID == health_kit_payload(seed=1)["appleUUID"]
+        assert created.summary is not None
+
+    def test_single_transaction(self, db, treated_patient, testapp_patient):
+        """The workouts are deduplicated with one query & committed once."""
+        payloads = [health_kit_payload(duration=60, seed=seed) for seed in range(5)]
+        commits = []
+
+        def count_commit(conn):
+            commits.append(conn)
+
+        event.listen(db.engine, "commit", count_commit)
+        try:
+            with StatementRecorder(db.engine) as recorder:
+                testapp_patient.post_json(
+                    "/api/v1/workout/bulk", {"workouts": payloads}
+                )
+        finally:
+            event.remove(db.engine, "commit", count_commit)
+        assert len(commits) == 1
+        dedup_statements = [
+            statement
+            for statement, _ in recorder.statements
+            if 'workouts."appleUUID" IN' in statement
+        ]
+        assert len(dedup_statements) == 1
+        assert Workout.query.count() == 5
+
+    def test_limits(self, testapp_patient):
+        """Malformed & oversized batches are rejected."""
+        testapp_patient.post_json("/api/v1/workout/bulk", {"workouts": {}}, status=400)
+        testapp_patient.post_json(
+            "/api/v1/workout/bulk", {"workouts": [{}] * 51}, status=413
+        )
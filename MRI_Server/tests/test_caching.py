@@ -0,0 +1,160 @@
+"""Cache tests."""
+import pickle
+
+import pytest
+from flask_caching import Cache
+
+from tumsm_server.caching import LRUCache, ObjectLRU
+from tumsm_server.extensions import cache
+from tumsm_server.workout.lib import combined_profile_cache_key, create_workout
+from tumsm_server.workout.sampleEncoding import SAMPLE_COLUMNS
+
+from .helpers import StatementRecorder, authorize, health_kit_payload
+
+
+class TestLRUCache:
+    """The least recently used items are evicted."""
+
+    def test_eviction(self):
+        """Reading an item keeps it in a full cache."""
+        lru = LRUCache(threshold=3)
+        for key in "abc":
+            lru.set(key, key)
+        assert lru.get("a") == "a"
+        lru.set("d", "d")
+        assert [lru.get(key) for key in "abcd"] == ["a", None, "c", "d"]
+
+    def test_copies(self):
+        """Cached values aren't changed by their callers."""
+        lru = LRUCache()
+        value = [{"heartRate": 100}]
+        lru.set("profile", value)
+        value[0]["heartRate"] = 120
+        lru.get("profile")[0]["heartRate"] = 140
+        assert lru.get("profile") == [{"heartRate": 100}]
+
+    def test_add_and_delete(self):
+        """Items are only added if they don't exist yet."""
+        lru = LRUCache(threshold=2)
+        assert lru.add("a", 1)
+        assert not lru.add("a", 2)
+        assert lru.get("a") == 1
+        assert lru.delete("a")
+        assert not lru.has("a")
+        lru.set("b", 2)
+        assert lru.clear() is True
+        assert not lru.has("b")
+
+    def test_byte_bound(self):
+        """The least recently used items are evicted beyond the pickled bytes, larger items aren't cached."""
+        size = len(pickle.dumps("a" * 100, pickle.HIGHEST_PROTOCOL))
+        lru = LRUCache(max_bytes=3 * size)
+        for key in "abc":
+            lru.set(key, key * 100)
+        assert lru.nbytes == 3 * size
+        lru.get("a")
+        lru.set("d", "d" * 100)
+        assert [lru.has(key) for key in "abcd"] == [True, False, True, True]
+        assert not lru.set("e", "e" * 1000)
+        assert not lru.has("e") and lru.nbytes == 3 * size
+        lru.delete("a")
+        assert lru.nbytes == 2 * size
+
+    def test_configured_bytes(self, app):
+        """The byte bound is configured by CACHE_MAX_BYTES."""
+        configured = Cache(
+            app,
+            config={
+                "CACHE_TYPE": "tumsm_server.caching.LRUCache",
+                "CACHE_THRESHOLD": 10,
+                "CACHE_MAX_BYTES": 1000,
+            },
+        )
+        assert configured.cache.maxBytes == 1000
+        assert configured.cache._threshold == 10
+
+
+class Sized:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+class TestObjectLRU:
+    """Live objects are cached up to a number of items & bytes."""
+
+    def test_live_objects(self):
+        """Hits return the cached object itself."""
+        lru = ObjectLRU()
+        value = Sized(10)
+        lru.set("a", value)
+        assert lru.get("a") is value
+        assert lru.delete("a")
+        assert lru.get("a") is None and lru.nbytes == 0
+
+    def test_eviction(self):
+        """The least recently used objects are evicted beyond either bound."""
+        lru = ObjectLRU(maxItems=3, maxBytes=100)
+        for key in "abc":
+            lru.set(key, Sized(10))
+        lru.get("a")
+        lru.set("d", Sized(10))
+        assert [lru.get(key) is not None for key in "abcd"] == [True, False, True, True]
+        lru.set("e", Sized(85))
+        assert [key for key in "acde" if lru.get(key) is not None] == ["d", "e"]
+        assert lru.nbytes == 95
+        assert not lru.set("f", Sized(101))
+        assert lru.get("f") is None and lru.nbytes == 95
+
+
+@pytest.mark.usefixtures("db")
+class TestCombinedProfileCache:
+    """Combined profiles are cached per workout revision & sample rate."""
+
+    def get_profile(self, testapp, workoutId, sample_rate=10):
+        return testapp.get(
+            f"/api/v1/workout?id={workoutId}&sampleRate={sample_rate}"
+        ).json["combinedProfiles"]
+
+    def test_cached(self, db, treated_patient, testapp_patient):
+        """Cached profiles are served without loading the samples."""
+        workout = create_workout(health_kit_payload(duration=120), treated_patient.id)
+        profile = self.get_profile(testapp_patient, workout.id)
+        db.session.expire_all()
+        with StatementRecorder(db.engine) as recorder:
+            assert self.get_profile(testapp_patient, workout.id) == profile
+            assert len(self.get_profile(testapp_patient, workout.id, 20)) < len(profile)
+        sample_statements = [
+            statement
+            for statement, _ in recorder.statements
+            if any(column in statement for column in SAMPLE_COLUMNS)
+        ]
+        assert len(sample_statements) == 1
+
+    def test_invalidated_by_patch(self, treated_patient, testapp):
+        """Patching a workout replaces its cached profiles."""
+        authorize(testapp, treated_patient.account)
+        workoutId = testapp.post_json(
+            "/api/v1/workout", {"healthJsonData": health_kit_payload(duration=120)}
+        ).json["workout"]
+        short = self.get_profile(testapp, workoutId)
+        testapp.patch_json(
+            "/api/v1/workout", {"healthJsonData": health_kit_payload(duration=240)}
+        )
+        assert len(self.get_profile(testapp, workoutId)) > len(short)
+
+    def test_recreated_workout(self, treated_patient, testapp_patient):
+        """A workout reusing the id of a deleted workout isn't served its cached profiles."""
+        workout = create_workout(health_kit_payload(duration=120), treated_patient.id)
+        workoutId = workout.id
+        short = self.get_profile(testapp_patient, workoutId)
+        testapp_patient.delete(f"/api/v1/workout?id={workoutId}")
+        recreated = create_workout(health_kit_payload(duration=240), treated_patient.id)
+        assert (recreated.id, recreated.revision) == (workoutId, 1)
+        assert len(self.get_profile(testapp_patient, workoutId)) > len(short)
+
+    def test_keys_without_index(self, treated_patient, testapp_patient):
+        """Cached profiles are found by their key alone, there is no list of keys per workout."""
+        workout = create_workout(health_kit_payload(duration=120), treated_patient.id)
+        profile = self.get_profile(testapp_patient, workout.id)
+        assert cache.get(combined_profile_cache_key(workout, 10)) == profile
+        assert len(cache.cache._cache) == 1
@@ -0,0 +1,182 @@
+"""Combined profile tests, comparing the vectorized resampling to the iterative implementation."""
+import datetime
+import math
+import random
+import time
+
+import pytest
+
+from tumsm_server.workout.lib import get_combined_profile, get_value_for_interval
+
+START = datetime.datetime(2021, 11, 18, 8, 0, 0)
+KEYS = ("heartRate", "speed", "altitude", "distance")
+
+
+def iterative_combined_profile(sample_period, profiles, startTime, endTime):
+    """Reference implementation, advancing get_value_for_interval interval by interval"""
+    pointers = {key: 0 for key in KEYS}
+    result = []
+    total_samples = math.ceil((endTime - startTime).seconds / sample_period)
+    first_sample_time_offset = 0
+    distance_profile = profiles["distance"]
+    if len(distance_profile) > 0 and distance_profile[0]["distance"] < 200:
+        first_sample_time_offset = distance_profile[0]["seconds_since_start"]
+    current_lower_bound = first_sample_time_offset
+    for i in range(total_samples - 1):
+        current_upper_bound = current_lower_bound + sample_period
+        sample = {}
+        for key in KEYS:
+            sample[key] = None
+            if len(profiles[key]) > 0:
+                sample[key], pointers[key] = get_value_for_interval(
+                    profiles[key],
+                    pointers[key],
+                    key,
+                    current_lower_bound,
+                    current_upper_bound,
+                )
+        sample["secondsSinceStart"] = current_lower_bound - first_sample_time_offset
+        result.append(sample)
+        current_lower_bound = current_upper_bound
+    return result
+
+
+def random_profile(rng, key, duration, mean_gap, integer_times=False, cumulative=False):
+    """Random samples with (optionally integer) gaps, so samples land on interval bounds as well"""
+    profile = []
+    seconds = rng.uniform(0, mean_gap)
+    value = 0.0
+    while seconds < duration:
+        if integer_times:
+            seconds = float(round(seconds))
+        value = value + rng.uniform(0, 30) if cumulative else rng.uniform(80, 180)
+        profile.append({key: value, "seconds_since_start": seconds})
+        seconds += rng.expovariate(1 / mean_gap)
+    return profile
+
+
+def random_profiles(seed, duration, integer_times=False):
+    rng = random.Random(seed)
+    return {
+        "heartRate": random_profile(rng, "heartRate", duration, 5, integer_times),
+        "speed": random_profile(rng, "speed", duration, 1, integer_times),
+        "altitude": random_profile(rng, "altitude", duration, 30, integer_times),
+        "distance": random_profile(
+            rng, "distance", duration, 10, integer_times, cumulative=True
+        ),
+    }
+
+
+def combined_profile(sample_period, profiles, duration):
+    return get_combined_profile(
+        sample_period,
+        heart_rate_profile=profiles["heartRate"],
+        speed_profile=profiles["speed"],
+        altitude_profile=profiles["altitude"],
+        distance_profile=profiles["distance"],
+        startTime=START,
+        endTime=START + datetime.timedelta(seconds=duration),
+    )
+
+
+def assert_equivalent(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_sample, expected_sample in zip(actual, expected):
+        assert actual_sample.keys() == expected_sample.keys()
+        for key, expected_value in expected_sample.items():
+            if expected_value is None:
+                assert actual_sample[key] is None
+            else:
+                assert actual_sample[key] == pytest.approx(expected_value, rel=1e-9)
+
+
+class TestCombinedProfile:
+    """Vectorized resampling yields the same profile as the iterative implementation."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("sample_period", [1, 3, 10, 60])
+    def test_random_profiles(self, seed, sample_period):
+        """Averaging, interpolation & repetition of the last sample."""
+        duration = 900
+        profiles = random_profiles(seed, duration)
+        assert_equivalent(
+            combined_profile(sample_period, profiles, duration),
+            iterative_combined_profile(
+                sample_period,
+                profiles,
+                START,
+                START + datetime.timedelta(seconds=duration),
+            ),
+        )
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("sample_period", [1, 2, 5, 10])
+    def test_samples_on_interval_bounds(self, seed, sample_period):
+        """Samples lying exactly on interval bounds are handled like before."""
+        duration = 600
+        profiles = random_profiles(seed, duration, integer_times=True)
+        assert_equivalent(
+            combined_profile(sample_period, profiles, duration),
+            iterative_combined_profile(
+                sample_period,
+                profiles,
+                START,
+                START + datetime.timedelta(seconds=duration),
+            ),
+        )
+
+    def test_duplicate_timestamps_on_bounds(self):
+        """Several samples sharing one timestamp on an interval bound."""
+        heart_rate = [
+            {"heartRate": value, "seconds_since_start": seconds}
+            for value, seconds in [(100, 0), (110, 5), (130, 5), (90, 5), (120, 12)]
+        ]
+        profiles = {
+            "heartRate": heart_rate,
+            "speed": [],
+            "altitude": [],
+            "distance": [],
+        }
+        assert_equivalent(
+            combined_profile(1, profiles, 20),
+            iterative_combined_profile(
+                1, profiles, START, START + datetime.timedelta(seconds=20)
+            ),
+        )
+
+    def test_first_sample_offset(self):
+        """The profile starts with the first distance sample if it is below 200m."""
+        profiles = random_profiles(1, 300)
+        profiles["distance"][0]["distance"] = 150.0
+        profiles["distance"][0]["seconds_since_start"] = 7.5
+        result = combined_profile(10, profiles, 300)
+        assert result[0]["secondsSinceStart"] == 0
+        assert_equivalent(
+            result,
+            iterative_combined_profile(
+                10, profiles, START, START + datetime.timedelta(seconds=300)
+            ),
+        )
+
+    def test_missing_and_unsorted_profiles(self):
+        """Missing streams stay None, unsorted samples are still resampled."""
+        profiles = random_profiles(2, 300)
+        profiles["altitude"] = []
+        profiles["heartRate"] = list(reversed(profiles["heartRate"]))
+        result = combined_profile(10, profiles, 300)
+        assert all(sample["altitude"] is None for sample in result)
+        assert_equivalent(
+            result,
+            iterative_combined_profile(
+                10, profiles, START, START + datetime.timedelta(seconds=300)
+            ),
+        )
+
+    def test_long_ride(self):
+        """A four hour ride resampled with a one second sample rate."""
+        duration = 4 * 60 * 60
+        profiles = random_profiles(3, duration)
+        started = time.perf_counter()
+        result = combined_profile(1, profiles, duration)
+        assert time.perf_counter() - started < 0.5
+        assert len(result) == duration - 1
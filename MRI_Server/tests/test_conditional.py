@@ -0,0 +1,112 @@
+"""Conditional request tests."""
+import datetime as dt
+
+import pytest
+
+from tumsm_server.account.models import Account
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import Steps, WorkoutRating
+from tumsm_server.workout.sampleEncoding import SAMPLE_COLUMNS
+
+from .helpers import StatementRecorder, authorize, health_kit_payload
+
+
+def assert_revalidated(testapp, url, status):
+    """Request the url again with the ETag of its current response"""
+    etag = testapp.get(url).headers["ETag"]
+    return testapp.get(url, headers={"If-None-Match": etag}, status=status)
+
+
+@pytest.mark.usefixtures("db")
+class TestRevisions:
+    """Revisions are incremented by changes of records."""
+
+    def test_workout_revision(self, treated_patient):
+        """Workouts are revised when they are patched or rated."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        patient_revision = treated_patient.revision
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        assert workout.revision == 1
+        assert treated_patient.revision == patient_revision + 1
+        create_workout(health_kit_payload(duration=120), treated_patient.id, patch=True)
+        assert workout.revision == 2
+        rating = WorkoutRating.create(workoutId=workout.id, rating=1, intensity=2)
+        assert workout.revision == 3
+        rating.delete()
+        assert workout.revision == 4
+        assert treated_patient.revision == patient_revision + 4
+
+    def test_patient_revision(self, treated_patient):
+        """Patients are revised by their records & accounts."""
+        revision = treated_patient.revision
+        steps = Steps.create(
+            patientId=treated_patient.id, date=dt.date(2021, 11, 18), amount=10
+        )
+        steps.delete()
+        Account.query.get(treated_patient.accountId).update(firstName="Renamed")
+        treated_patient.update(comment="Revised")
+        assert treated_patient.revision == revision + 4
+
+
+@pytest.mark.usefixtures("db")
+class TestConditionalRequests:
+    """Unchanged responses are answered with 304 Not Modified."""
+
+    def test_workout(self, db, treated_patient, testapp_patient):
+        """The workout isn't resampled for a 304."""
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        url = f"/api/v1/workout?id={workout.id}&sampleRate=10"
+        etag = testapp_patient.get(url).headers["ETag"]
+        db.session.expire_all()
+        with StatementRecorder(db.engine) as recorder:
+            resp = testapp_patient.get(url, headers={"If-None-Match": etag}, status=304)
+        assert resp.headers["ETag"] == etag
+        assert resp.body == b""
+        for statement, _ in recorder.statements:
+            assert not any(column in statement for column in SAMPLE_COLUMNS)
+
+        testapp_patient.post_json(
+            "/api/v1/workout/rating",
+            {"workoutId": workout.id, "rating": 2, "intensity": 5},
+        )
+        resp = testapp_patient.get(url, headers={"If-None-Match": etag}, status=200)
+        assert resp.json["rating"] == 2
+        assert resp.headers["ETag"] != etag
+        assert_revalidated(testapp_patient, f"/api/v1/workout/raw?id={workout.id}", 304)
+
+    def test_workout_overviews(self, treated_patient, testapp):
+        """Workout overviews change with the records of the patient."""
+        authorize(testapp, treated_patient.account)
+        url = f"/api/v1/workout/overviews?patientId={treated_patient.id}"
+        etag = assert_revalidated(testapp, url, 304).headers["ETag"]
+        testapp.post_json("/api/v1/workout/steps", {"date": "2021-11-18", "amount": 5})
+        resp = testapp.get(url, headers={"If-None-Match": etag}, status=200)
+        assert resp.json["steps"][0]["amount"] == 5
+        testapp.get(
+            "/api/v1/workout/overviews?patientId=999",
+            headers={"If-None-Match": etag},
+            status=404,
+        )
+
+    def test_patient_overviews(self, treated_patient, testapp_trainer):
+        """Patient overviews change with every patient."""
+        url = "/api/v1/patient/overviews"
+        etag = assert_revalidated(testapp_trainer, url, 304).headers["ETag"]
+        treated_patient.account.update(lastName="Renamed")
+        resp = testapp_trainer.get(url, headers={"If-None-Match": etag}, status=200)
+        assert resp.json[0]["lastName"] == "Renamed"
+        etag = resp.headers["ETag"]
+        treated_patient.delete()
+        testapp_trainer.get(url, headers={"If-None-Match": etag}, status=200)
+
+    def test_weak_and_multiple_etags(self, treated_patient, testapp_trainer):
+        """Weak comparison is used & any of the given ETags can match."""
+        url = "/api/v1/patient/overviews"
+        etag = testapp_trainer.get(url).headers["ETag"]
+        testapp_trainer.get(
+            url, headers={"If-None-Match": f'"other", W/{etag}'}, status=304
+        )
+        testapp_trainer.get(url, headers={"If-None-Match": "*"}, status=304)
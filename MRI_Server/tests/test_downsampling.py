@@ -0,0 +1,157 @@
+"""Downsampling tests."""
+import numpy as np
+import pytest
+
+from tumsm_server.workout.downsampling import (
+    build_pyramid,
+    decode_pyramid,
+    encode_pyramid,
+    lttb,
+    select_level,
+)
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import Workout
+
+from .helpers import StatementRecorder, health_kit_payload
+
+
+def random_walk(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(length, dtype=float), np.cumsum(rng.normal(size=length))
+
+
+def sequential_lttb(times, values, threshold):
+    """Reference LTTB selecting one bucket after another"""
+    bounds = np.linspace(1, len(values) - 1, threshold - 1).astype(int)
+    selected = [0]
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        after = (
+            slice(end, bounds[bucket + 2])
+            if bucket < threshold - 3
+            else slice(-1, None)
+        )
+        next_time, next_value = times[after].mean(), values[after].mean()
+        previous = selected[-1]
+        areas = [
+            abs(
+                (next_time - times[previous]) * (values[index] - values[previous])
+                - (times[index] - times[previous]) * (next_value - values[previous])
+            )
+            for index in range(start, end)
+        ]
+        selected.append(start + int(np.argmax(areas)))
+    selected.append(len(values) - 1)
+    return selected
+
+
+class TestLTTB:
+    """Samples are downsampled to visually faithful points."""
+
+    def test_keeps_extremes(self):
+        """The first & last point and spikes are kept."""
+        times, values = random_walk(10000)
+        values[4321] = 1000
+        sampled_times, sampled_values = lttb(times, values, 100)
+        assert len(sampled_values) == 100
+        assert (sampled_times[0], sampled_times[-1]) == (0, 9999)
+        assert 1000 in sampled_values
+        assert np.all(np.diff(sampled_times) > 0)
+        assert set(sampled_times) <= set(times)
+
+    def test_sequential_selection(self):
+        """The buckets are selected as if one after another, also with ties & uneven buckets."""
+        for length, threshold in [(10000, 4096), (5003, 128), (700, 3)]:
+            times, values = random_walk(length, seed=length)
+            values = np.round(values)
+            selected = sequential_lttb(times, values, threshold)
+            assert np.array_equal(lttb(times, values, threshold)[0], times[selected])
+
+    def test_short_streams(self):
+        """Streams with fewer points than the threshold are kept."""
+        times, values = random_walk(50)
+        assert lttb(times, values, 100)[1] is values
+        assert len(lttb(times, values, 2)[1]) == 2
+
+
+class TestPyramid:
+    """The levels of each stream are stored & sliced."""
+
+    def test_levels(self):
+        """Every level halves the points, short streams have a single level."""
+        levels = build_pyramid(*random_walk(10000))
+        assert [len(values) for _, values in levels] == [
+            4096,
+            2048,
+            1024,
+            512,
+            256,
+            128,
+        ]
+        assert [len(values) for _, values in build_pyramid(*random_walk(50))] == [50]
+
+    def test_round_trip(self):
+        """The encoded pyramid decodes into the same levels per stream."""
+        columns = {"heartRate": random_walk(5000), "speed": random_walk(20, seed=1)}
+        pyramid = decode_pyramid(encode_pyramid(columns))
+        assert list(pyramid) == ["heartRate", "speed"]
+        for value_key, (times, values) in columns.items():
+            for (level_times, level_values), (
+                decoded_times,
+                decoded_values,
+            ) in zip(build_pyramid(times, values), pyramid[value_key]):
+                assert np.array_equal(level_times, decoded_times)
+                assert np.allclose(level_values, decoded_values)
+
+    def test_select_level(self):
+        """The most detailed level within the limit is used."""
+        levels = build_pyramid(*random_walk(10000))
+        assert len(select_level(levels, 3000)[1]) == 2048
+        assert len(select_level(levels, 100000)[1]) == 4096
+        assert len(select_level(levels, 100)[1]) == 100
+
+
+@pytest.mark.usefixtures("db")
+class TestDownsampledProfiles:
+    """Charts request at most a number of points per stream."""
+
+    def test_max_points(self, db, treated_patient, testapp_patient):
+        """The profiles are sliced from the stored pyramid without loading the samples."""
+        workout = create_workout(health_kit_payload(duration=3600), treated_patient.id)
+        assert workout.samplePyramid is not None
+        db.session.expire_all()
+        with StatementRecorder(db.engine) as recorder:
+            resp = testapp_patient.get(f"/api/v1/workout?id={workout.id}&maxPoints=500")
+        assert not any(
+            "heartRateSamples" in statement for statement, _ in recorder.statements
+        )
+        profiles = resp.json["downsampledProfiles"]
+        assert resp.json["combinedProfiles"] is None
+        assert sorted(profiles) == ["altitude", "distance", "heartRate", "speed"]
+        speed_times, _ = Workout.query.get(workout.id).speedSamples_columns
+        assert len(speed_times) > 500
+        assert 0 < len(profiles["speed"]["values"]) <= 500
+        assert len(profiles["speed"]["times"]) == len(profiles["speed"]["values"])
+        assert set(profiles["speed"]["times"]) <= set(speed_times.tolist())
+
+    def test_without_pyramid(self, treated_patient, testapp_patient):
+        """Workouts stored without a pyramid are downsampled on the fly."""
+        workout = create_workout(health_kit_payload(duration=3600), treated_patient.id)
+        stored = testapp_patient.get(f"/api/v1/workout?id={workout.id}&maxPoints=300")
+        workout.update(samplePyramid=None)
+        resp = testapp_patient.get(f"/api/v1/workout?id={workout.id}&maxPoints=300")
+        for value_key, profile in stored.json["downsampledProfiles"].items():
+            downsampled = resp.json["downsampledProfiles"][value_key]
+            assert downsampled["times"] == profile["times"]
+            assert downsampled["values"] == pytest.approx(profile["values"])
+
+    def test_parameters(self, treated_patient, testapp_patient):
+        """Either a sample rate or a number of points is required."""
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        url = f"/api/v1/workout?id={workout.id}"
+        testapp_patient.get(url, status=400)
+        testapp_patient.get(url + "&maxPoints=1", status=400)
+        testapp_patient.get(url + "&maxPoints=x", status=400)
+        resp = testapp_patient.get(url + "&sampleRate=10&maxPoints=100")
+        assert resp.json["combinedProfiles"] is not None
+        assert resp.json["downsampledProfiles"] is not None
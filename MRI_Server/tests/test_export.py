@@ -0,0 +1,72 @@
+"""Patient export tests."""
+import base64
+import io
+import re
+import zipfile
+
+import pytest
+
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.utils import format_date
+from tumsm_server.workout.lib import create_workout
+
+from .helpers import health_kit_payload
+
+
+def xlsx_sheets(data):
+    """Return the names & row counts of the sheets of a xlsx file."""
+    with zipfile.ZipFile(io.BytesIO(data)) as xlsx:
+        names = re.findall(
+            r'<sheet name="([^"]+)"', xlsx.read("xl/workbook.xml").decode()
+        )
+        return {
+            name: xlsx.read(f"xl/worksheets/sheet{index}.xml").decode().count("<row ")
+            for index, name in enumerate(names, start=1)
+        }
+
+
+@pytest.mark.usefixtures("db")
+class TestPatientExport:
+    """Exports contain an overview & one sheet per workout."""
+
+    @pytest.fixture
+    def workouts(self, treated_patient):
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        return [
+            create_workout(
+                health_kit_payload(duration=120, seed=seed), treated_patient.id
+            )
+            for seed in range(2)
+        ]
+
+    def test_zip_export(self, treated_patient, workouts, testapp_trainer):
+        """The zip export contains one xlsx file per patient."""
+        resp = testapp_trainer.get(
+            f"/api/v1/patient/export?patientIds={treated_patient.id}&format=zip"
+        )
+        assert resp.content_type == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(resp.body)) as archive:
+            assert archive.namelist() == [f"{treated_patient.id}.xlsx"]
+            sheets = xlsx_sheets(archive.read(f"{treated_patient.id}.xlsx"))
+        day = format_date(workouts[0].startTime)
+        samples = max(
+            len(workouts[0].altitudeSamples_data),
+            len(workouts[0].heartRateSamples_data),
+        )
+        assert sheets == {"Übersicht": 3, day: samples + 1, f"{day} 2": samples + 1}
+
+    def test_json_export(self, treated_patient, workouts, testapp_trainer):
+        """The JSON export contains the same xlsx file as base64 string."""
+        resp = testapp_trainer.get(
+            f"/api/v1/patient/export?patientIds={treated_patient.id}"
+        )
+        (dump,) = resp.json
+        assert dump["patientId"] == treated_patient.id
+        sheets = xlsx_sheets(base64.b64decode(dump["overview"]))
+        assert list(sheets) == [
+            "Übersicht",
+            format_date(workouts[0].startTime),
+            format_date(workouts[0].startTime) + " 2",
+        ]
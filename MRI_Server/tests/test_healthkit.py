@@ -0,0 +1,150 @@
+"""Healthkit data processor tests."""
+import json
+
+import pytest
+
+from tumsm_server.workout.healthkitDataProcessor import (
+    HealthKitPayload,
+    check_health_kit_data_structure,
+    process_health_kit_data,
+)
+from tumsm_server.workout.models import RawWorkout, Workout
+
+from .helpers import health_kit_payload
+
+
+class TestProcessHealthKitData:
+    """Parsing of uploaded healthkit workouts."""
+
+    def test_structure_check(self):
+        """Valid payloads pass the structural check, broken ones don't."""
+        payload = health_kit_payload(duration=60)
+        assert check_health_kit_data_structure(json.dumps(payload)) is True
+        del payload["locations"]
+        assert check_health_kit_data_structure(payload) is False
+
+    def test_profiles_share_location_timestamps(self):
+        """Speed & altitude profiles are decoded from the same location samples."""
+        payload = health_kit_payload(duration=120)
+        result = process_health_kit_data(json.dumps(payload))
+        speed_profile, altitude_profile = result[16], result[17]
+        assert len(speed_profile) == len(altitude_profile) == 120
+        assert speed_profile[0]["seconds_since_start"] == 0
+        assert altitude_profile[-1]["seconds_since_start"] == 119
+        assert speed_profile[5]["speed"] == (
+            payload["locations"][5]["speed"]["doubleValue"] * 3.6
+        )
+
+    def test_terrain_and_overview(self):
+        """Terrain deltas & heart rate stats match the raw samples."""
+        payload = health_kit_payload(duration=300)
+        result = process_health_kit_data(payload)
+        altitudes = [sample["altitude"] for sample in payload["locations"]]
+        heart_rates = [
+            sample["quantity"]["doubleValue"] for sample in payload["heartRateSamples"]
+        ]
+        terrain_up, terrain_down = result[7], result[8]
+        assert round(terrain_up - terrain_down, 6) == round(
+            altitudes[-1] - altitudes[0], 6
+        )
+        assert result[9] == sum(heart_rates) / len(heart_rates)
+        assert result[10] == min(heart_rates)
+        assert result[11] == max(heart_rates)
+
+    def test_distance_uses_watch_samples(self):
+        """Only samples of the prioritized device (the watch) are summed up."""
+        payload = health_kit_payload(duration=100)
+        result = process_health_kit_data(payload)
+        distance_profile = result[18]
+        watch_samples = [
+            sample
+            for sample in payload["distanceWalkingRunningSamples"]
+            if "Watch" in sample["device"]
+        ]
+        assert len(distance_profile) == len(watch_samples)
+        assert distance_profile[-1]["distance"] == sum(
+            sample["quantity"]["doubleValue"] for sample in watch_samples
+        )
+
+    def test_speed_without_locations(self):
+        """Without location data the speed is derived from the distance samples."""
+        payload = health_kit_payload(duration=100)
+        payload["locations"] = []
+        result = process_health_kit_data(payload)
+        speed_profile, altitude_profile = result[16], result[17]
+        assert altitude_profile == []
+        assert len(speed_profile) == 10
+        assert speed_profile[0]["seconds_since_start"] == 10
+
+
+class TestHealthKitPayload:
+    """Uploads are parsed & validated once."""
+
+    def test_parse(self):
+        """The original bytes are kept & semantically broken workouts are rejected."""
+        raw = json.dumps(health_kit_payload(duration=60), indent=2)
+        payload = HealthKitPayload.parse(raw)
+        assert payload.raw == raw.encode()
+        assert payload.endDate > payload.startDate
+        assert HealthKitPayload.parse(payload) is payload
+        assert HealthKitPayload.parse(raw.encode()).raw == raw.encode()
+        assert HealthKitPayload.parse("{") is None
+
+        reversed_dates = health_kit_payload(duration=60)
+        reversed_dates["startDate"], reversed_dates["endDate"] = (
+            reversed_dates["endDate"],
+            reversed_dates["startDate"],
+        )
+        assert HealthKitPayload.parse(reversed_dates) is None
+        negative_duration = health_kit_payload(duration=60)
+        negative_duration["duration"]["doubleValue"] = -1
+        assert HealthKitPayload.parse(negative_duration) is None
+        broken_samples = health_kit_payload(duration=60)
+        broken_samples["heartRateSamples"] = {}
+        assert HealthKitPayload.parse(broken_samples) is None
+
+    @pytest.mark.usefixtures("db")
+    def test_upload_without_samples(self, testapp_patient):
+        """Sample streams which weren't recorded (null) are uploaded as empty streams."""
+        payload = health_kit_payload(duration=60, sensors=("locations",))
+        payload["heartRateSamples"] = None
+        payload["distanceWalkingRunningSamples"] = None
+        assert check_health_kit_data_structure(payload) is True
+        resp = testapp_patient.post_json("/api/v1/workout", {"healthJsonData": payload})
+        workout = Workout.query.get(resp.json["workout"])
+        assert len(workout.heartRateSamples_columns[0]) == 0
+        assert len(workout.speedSamples_columns[0]) == 60
+        payload["appleUUID"] = "without-watch"
+        resp = testapp_patient.post_json(
+            "/api/v1/workout/bulk", {"workouts": [payload]}
+        )
+        assert resp.json["workouts"][0]["status"] == "created"
+
+    @pytest.mark.usefixtures("db")
+    def test_upload_parsed_once(self, monkeypatch, testapp_patient):
+        """The payload of an upload is parsed once & stored verbatim."""
+        parsed = []
+        init = HealthKitPayload.__init__
+
+        def counting_init(self, raw, data):
+            parsed.append(raw)
+            init(self, raw, data)
+
+        monkeypatch.setattr(HealthKitPayload, "__init__", counting_init)
+        raw = json.dumps(health_kit_payload(duration=60), indent=2)
+        resp = testapp_patient.post_json("/api/v1/workout", {"healthJsonData": raw})
+        assert len(parsed) == 1
+        workout = Workout.query.get(resp.json["workout"])
+        assert workout.rawJson[0].healthKitJson == raw.encode()
+        resp = testapp_patient.get(f"/api/v1/workout/raw?id={workout.id}")
+        assert resp.json["rawJson"] == json.loads(raw)
+
+    @pytest.mark.usefixtures("db")
+    def test_legacy_raw_workout(self, treated_patient, testapp_patient):
+        """Raw workouts stored as an encoded healthkit string are still returned as objects."""
+        payload = health_kit_payload(duration=60)
+        resp = testapp_patient.post_json("/api/v1/workout", {"healthJsonData": payload})
+        raw_workout = RawWorkout.query.filter_by(workoutId=resp.json["workout"]).one()
+        raw_workout.update(healthKitJson=str.encode(json.dumps(json.dumps(payload))))
+        resp = testapp_patient.get(f"/api/v1/workout/raw?id={raw_workout.workoutId}")
+        assert resp.json["rawJson"] == payload
@@ -0,0 +1,66 @@
+"""Request instrumentation tests."""
+import copy
+import re
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from tumsm_server.extensions import request_metrics
+
+
+@pytest.mark.usefixtures("db")
+class TestRequestMetrics:
+    """Requests are measured per endpoint."""
+
+    def test_server_timing(self, app, testapp_trainer):
+        """The Server-Timing header contains the app & database time."""
+        app.config["SERVER_TIMING"] = True
+        resp = testapp_trainer.get("/api/v1/patient/overviews")
+        timing = resp.headers["Server-Timing"]
+        assert re.fullmatch(
+            r'app;dur=[\d.]+, db;dur=[\d.]+;desc="(\d+) statements"', timing
+        )
+        assert int(re.search(r"(\d+) statements", timing).group(1)) > 0
+
+    def test_no_server_timing_by_default(self, testapp_trainer):
+        """The Server-Timing header is optional."""
+        resp = testapp_trainer.get("/api/v1/patient/overviews")
+        assert "Server-Timing" not in resp.headers
+
+    def test_endpoint_metrics(self, testapp_trainer):
+        """Statements & response sizes are summed up per endpoint."""
+        before = request_metrics.endpoints.get("api.patients")
+        before = (before.requests, before.statements) if before else (0, 0)
+        testapp_trainer.get("/api/v1/patient/overviews")
+        testapp_trainer.get("/api/v1/patient/overviews")
+        metrics = request_metrics.endpoints["api.patients"]
+        assert metrics.requests == before[0] + 2
+        assert metrics.statements > before[1]
+        assert metrics.responseBytes > 0
+        assert metrics.durationBuckets[-1] == metrics.requests
+
+    def test_failing_statement(self, app, db):
+        """A failing statement leaves nothing behind on the connection."""
+        with app.test_request_context(), db.engine.connect() as conn:
+            before = copy.deepcopy(conn.info)
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM missing_table")
+            conn.exec_driver_sql("SELECT 1")
+            assert conn.info == before
+
+    def test_prometheus_endpoint(self, app, testapp_trainer):
+        """The metrics are served in the Prometheus text format to the configured token."""
+        testapp_trainer.get("/metrics", status=404)
+        app.config["METRICS_TOKEN"] = "scraper"
+        testapp_trainer.get("/metrics", status=401)
+        testapp_trainer.get("/api/v1/patient/overviews")
+        testapp_trainer.authorization = ("Bearer", "scraper")
+        resp = testapp_trainer.get("/metrics")
+        assert resp.content_type == "text/plain"
+        assert "# TYPE tumsm_request_duration_seconds histogram" in resp.text
+        assert re.search(
+            r'^tumsm_request_statements_total\{endpoint="api.patients"\} [1-9]\d*$',
+            resp.text,
+            re.MULTILINE,
+        )
+        assert 'tumsm_function_calls_total{function="' in resp.text
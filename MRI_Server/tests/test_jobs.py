@@ -0,0 +1,105 @@
+"""Background job tests."""
+import io
+import zipfile
+
+import pytest
+
+import tumsm_server.planning.lib as planning_lib
+from tumsm_server.commands import run_jobs
+from tumsm_server.job.lib import claim_next_job, run_next_job, submit_job
+from tumsm_server.job.models import Job
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.workout.lib import create_workout
+
+from .helpers import authorize, health_kit_payload
+
+
+@pytest.fixture
+def job_results(app, tmp_path):
+    """Store job results in a temporary directory."""
+    app.config["JOB_RESULT_PATH"] = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def import_cache(monkeypatch, tmp_path):
+    """Write imported xlsx files to a temporary directory."""
+    monkeypatch.setattr(planning_lib, "importCachePath", f"{tmp_path}/import/")
+    return tmp_path / "import"
+
+
+@pytest.mark.usefixtures("db", "job_results")
+class TestJobs:
+    """Jobs are queued by the api & run by the worker."""
+
+    def test_patient_export(self, treated_patient, testapp_trainer):
+        """An export job is queued, run & its result downloaded."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        create_workout(health_kit_payload(duration=120), treated_patient.id)
+        resp = testapp_trainer.post_json(
+            "/api/v1/job/patientExport", {"patientIds": [treated_patient.id]}
+        )
+        assert resp.status_code == 202
+        jobId = resp.json["job"]
+        assert testapp_trainer.get(f"/api/v1/job?id={jobId}").json["status"] == "queued"
+        testapp_trainer.get(f"/api/v1/job/result?id={jobId}", status=409)
+
+        run_next_job()
+
+        status = testapp_trainer.get(f"/api/v1/job?id={jobId}").json
+        assert status["status"] == "finished"
+        assert status["error"] is None
+        resp = testapp_trainer.get(f"/api/v1/job/result?id={jobId}")
+        assert resp.content_type == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(resp.body)) as archive:
+            assert archive.namelist() == [f"{treated_patient.id}.xlsx"]
+
+        testapp_trainer.delete(f"/api/v1/job?id={jobId}")
+        assert Job.query.count() == 0
+
+    def test_failing_import(self, treated_patient, testapp_trainer, import_cache):
+        """A job which can't be completed is marked as failed."""
+        resp = testapp_trainer.post_json(
+            "/api/v1/job/planningImport",
+            {"patientId": treated_patient.id, "xlsxBase64": "bm8geGxzeA=="},
+        )
+        run_next_job()
+        status = testapp_trainer.get(f"/api/v1/job?id={resp.json['job']}").json
+        assert status["status"] == "failed"
+        assert status["error"] == "There was an error parsing the xlsx file"
+        assert (import_cache / f"{treated_patient.id}.xlsx").exists()
+
+    def test_only_own_jobs(self, treated_patient, trainer, testapp):
+        """Jobs can only be accessed by the account which submitted them."""
+        job = submit_job(trainer.account, "patientExport", {"patientIds": []})
+        authorize(testapp, treated_patient.account)
+        testapp.get(f"/api/v1/job?id={job.id}", status=403)
+        testapp.get(f"/api/v1/job/result?id={job.id}", status=403)
+        testapp.post_json(
+            "/api/v1/job/patientExport",
+            {"patientIds": [treated_patient.id]},
+            status=403,
+        )
+        testapp.post_json(
+            "/api/v1/job/planningImport",
+            {"patientId": treated_patient.id, "xlsxBase64": "bm8geGxzeA=="},
+            status=403,
+        )
+
+    def test_jobs_are_claimed_once(self, trainer):
+        """A queued job is only handed to one worker."""
+        first = submit_job(trainer.account, "patientExport", {"patientIds": []})
+        second = submit_job(trainer.account, "patientExport", {"patientIds": []})
+        assert claim_next_job().id == first.id
+        assert claim_next_job().id == second.id
+        assert claim_next_job() is None
+
+    def test_run_jobs_command(self, app, trainer):
+        """The worker command runs all queued jobs."""
+        for _ in range(2):
+            submit_job(trainer.account, "patientExport", {"patientIds": []})
+        result = app.test_cli_runner().invoke(run_jobs, ["--once"])
+        assert result.exit_code == 0, result.output
+        assert [job.status for job in Job.query.all()] == ["finished", "finished"]
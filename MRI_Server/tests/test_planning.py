@@ -0,0 +1,114 @@
+"""Planned workout tests."""
+import datetime as dt
+
+import pytest
+from sqlalchemy import event
+
+from tumsm_server.patient.lib import training_progress, training_progresses
+from tumsm_server.patient.models import Patient
+from tumsm_server.planning.models import PlannedWorkout
+from tumsm_server.workout.models import Workout
+
+from .factories import AccountFactory
+
+RUNNING = 37
+CYCLING = 13
+
+
+def add_workout(patient, start, type=RUNNING, duration=1800, distance=5000):
+    return Workout.create(
+        patientId=patient.id,
+        type=type,
+        startTime=start,
+        endTime=start + dt.timedelta(seconds=duration),
+        duration=duration,
+        kcal=300,
+        distance=distance,
+    )
+
+
+def plan(patient, date, type=RUNNING, **kwargs):
+    return PlannedWorkout.create(
+        patientId=patient.id, plannedDate=date, type=type, **kwargs
+    )
+
+
+@pytest.mark.usefixtures("db")
+class TestPlannedWorkoutCompletion:
+    """Planned workouts are completed by matching workouts."""
+
+    def test_completed_ids(self, treated_patient):
+        """Type, date & minimum distance / duration are respected."""
+        day = dt.date(2021, 11, 18)
+        add_workout(treated_patient, dt.datetime(2021, 11, 18, 18, 30))
+        done = plan(treated_patient, day)
+        too_short = plan(treated_patient, day, minDuration=3600)
+        too_close = plan(treated_patient, day, minDistance=10000)
+        long_enough = plan(treated_patient, day, minDuration=600, minDistance=1000)
+        other_type = plan(treated_patient, day, type=CYCLING)
+        other_day = plan(treated_patient, day + dt.timedelta(days=1))
+
+        assert PlannedWorkout.completed_ids(PlannedWorkout.query) == {
+            done.id,
+            long_enough.id,
+        }
+        assert done.complete
+        assert not too_short.complete
+        assert not too_close.complete
+        assert not other_type.complete
+        assert not other_day.complete
+
+    def test_training_progresses(self, db, treated_patient):
+        """Progress is counted per patient within the time frame."""
+        account = AccountFactory()
+        db.session.commit()
+        patient = Patient.create(
+            accountId=account.id,
+            treatmentStarted=dt.date(2021, 10, 1),
+            treatmentFinished=dt.date(2022, 3, 31),
+            treatmentGoal="Cycle to work",
+        )
+        for day in range(1, 4):
+            plan(treated_patient, dt.date(2021, 11, day))
+            plan(patient, dt.date(2021, 11, day))
+        add_workout(treated_patient, dt.datetime(2021, 11, 1, 9))
+        add_workout(treated_patient, dt.datetime(2021, 11, 1, 17))
+        add_workout(treated_patient, dt.datetime(2021, 11, 3, 9))
+        add_workout(patient, dt.datetime(2021, 11, 2, 9))
+
+        progresses = training_progresses(
+            [treated_patient.id, patient.id, 999], None, None
+        )
+        assert progresses == {
+            treated_patient.id: {"completed": 2, "total": 3},
+            patient.id: {"completed": 1, "total": 3},
+            999: {"completed": 0, "total": 0},
+        }
+        assert training_progress(treated_patient, dt.datetime(2021, 11, 2), None) == {
+            "completed": 1,
+            "total": 2,
+        }
+        assert training_progress(treated_patient, None, None, CYCLING) == {
+            "completed": 0,
+            "total": 0,
+        }
+
+    def test_constant_query_count(self, db, treated_patient):
+        """The number of queries doesn't grow with the number of planned workouts."""
+
+        def count_queries(planned_count):
+            for day in range(planned_count):
+                plan(treated_patient, dt.date(2021, 10, 1) + dt.timedelta(days=day))
+            statements = []
+
+            def listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                training_progresses([treated_patient.id], None, None)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+            return len(statements)
+
+        assert count_queries(2) == count_queries(50)
@@ -0,0 +1,96 @@
+"""Query plan tests."""
+import datetime as dt
+import re
+
+import pytest
+
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.planning.models import PlannedWorkout
+from tumsm_server.workout.models import Steps
+
+from .helpers import StatementRecorder, authorize, health_kit_payload
+
+# Tables which grow with every workout and must never be scanned by the API
+HOT_TABLES = {
+    "workouts",
+    "workoutRatings",
+    "workoutSummaries",
+    "steps",
+    "plannedWorkouts",
+    "patientTrainingZones",
+    "changes",
+}
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+?)(?:_\d+)?(?: |$)")
+
+
+def full_scans(engine, statement, parameters):
+    """Return the hot tables a statement scans instead of searching by an index."""
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        ).fetchall()
+    scans = set()
+    for row in plan:
+        match = SCAN.match(row[-1])
+        if match is not None and match.group(1) in HOT_TABLES:
+            scans.add(match.group(1))
+    return scans
+
+
+@pytest.mark.usefixtures("db")
+class TestQueryPlans:
+    """The queries of the API use the lookup indexes."""
+
+    def test_api_queries_use_indexes(self, db, testapp, treated_patient, trainer):
+        """No query issued by the main endpoints scans a hot table."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        PlannedWorkout.create(
+            patientId=treated_patient.id,
+            plannedDate=dt.date(2021, 11, 18),
+            type=37,
+        )
+        Steps.create(
+            patientId=treated_patient.id,
+            date=dt.date(2021, 11, 18),
+            amount=1000,
+        )
+
+        with StatementRecorder(db.engine) as recorder:
+            authorize(testapp, treated_patient.account)
+            payload = health_kit_payload(duration=300)
+            workoutId = testapp.post_json(
+                "/api/v1/workout", {"healthJsonData": payload}
+            ).json["workout"]
+            testapp.post_json(
+                "/api/v1/workout", {"healthJsonData": payload}
+            )  # Deduplicated by appleUUID
+            testapp.post_json(
+                "/api/v1/workout/rating",
+                {"workoutId": workoutId, "rating": 2, "intensity": 5},
+            )
+            authorize(testapp, trainer.account)
+            testapp.get(f"/api/v1/workout?id={workoutId}&sampleRate=10")
+            testapp.get(
+                f"/api/v1/workout?appleUUID={payload['appleUUID']}&sampleRate=10"
+            )
+            testapp.get(
+                f"/api/v1/workout/overviews?patientId={treated_patient.id}"
+                "&fromDate=2021-11-01&toDate=2021-12-01"
+            )
+            testapp.get(
+                "/api/v1/patient/overviews?fromDate=2021-11-01&toDate=2021-12-01"
+            )
+            testapp.get(f"/api/v1/patient/trainingZones?patientId={treated_patient.id}")
+            testapp.get(f"/api/v1/sync?patientId={treated_patient.id}")
+            testapp.get(f"/api/v1/sync?patientId={treated_patient.id}&cursor=1")
+
+        assert len(recorder.statements) > 0
+        regressions = {
+            statement: scans
+            for statement, parameters in recorder.statements
+            for scans in [full_scans(db.engine, statement, parameters)]
+            if len(scans) > 0
+        }
+        assert regressions == {}
@@ -0,0 +1,203 @@
+"""Workout recompute tests."""
+import datetime as dt
+import json
+
+import pytest
+
+import tumsm_server.workout.lib as workout_lib
+from tumsm_server.commands import run_jobs
+from tumsm_server.job.lib import claim_next_job, run_next_job, submit_job
+from tumsm_server.job.models import Job, runningJobStatus
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.studygroup.models import StudyGroup, StudyGroupPatients
+from tumsm_server.workout.lib import (
+    create_workout,
+    recompute_query,
+    recompute_workouts,
+)
+from tumsm_server.workout.models import Workout
+
+from .helpers import authorize, health_kit_payload
+
+
+@pytest.fixture
+def job_results(app, tmp_path):
+    """Store job results in a temporary directory."""
+    app.config["JOB_RESULT_PATH"] = str(tmp_path)
+    return tmp_path
+
+
+def create_workouts(patient, amount):
+    return [
+        create_workout(
+            health_kit_payload(
+                duration=300,
+                seed=day,
+                start=dt.datetime(2021, 11, 1 + day, 8),
+            ),
+            patient.id,
+        )
+        for day in range(amount)
+    ]
+
+
+def heart_rate_zones(workout):
+    return json.loads(Workout.query.get(workout.id).trainingZones)["heartRate"]
+
+
+@pytest.mark.usefixtures("db", "job_results")
+class TestWorkoutRecompute:
+    """The derived metrics of stored workouts are recomputed with the current training zones."""
+
+    def test_recompute_job(self, treated_patient, testapp_trainer):
+        """The job classifies the workouts with zones created after their upload."""
+        workouts = create_workouts(treated_patient, 3)
+        assert heart_rate_zones(workouts[0]) is None
+        kilometerPace = workouts[0].kilometerPace
+        revision = workouts[0].revision
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+
+        resp = testapp_trainer.post_json(
+            "/api/v1/job/workoutRecompute", {"patientIds": [treated_patient.id]}
+        )
+        assert resp.status_code == 202
+        run_next_job()
+
+        status = testapp_trainer.get(f"/api/v1/job?id={resp.json['job']}").json
+        assert status["status"] == "finished"
+        assert status["progress"] == {
+            "cursor": workouts[-1].id,
+            "total": 3,
+            "recomputed": 3,
+            "failed": 0,
+        }
+        result = testapp_trainer.get(f"/api/v1/job/result?id={resp.json['job']}")
+        assert result.json == {"recomputed": 3, "failed": 0}
+        workout = Workout.query.get(workouts[0].id)
+        assert heart_rate_zones(workout)["total"] > 0
+        assert workout.summary.heartRateZoneTotal == heart_rate_zones(workout)["total"]
+        assert workout.kilometerPace == kilometerPace
+        assert workout.revision > revision
+
+    def test_same_as_upload(self, treated_patient):
+        """Recomputing with unchanged zones reproduces the metrics of the upload."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        workout = create_workout(health_kit_payload(duration=1800), treated_patient.id)
+        uploaded = (workout.trainingZones, workout.kilometerPace, workout.paceMax)
+        assert recompute_workouts(recompute_query([treated_patient.id])) == (1, 0)
+        workout = Workout.query.get(workout.id)
+        assert (workout.trainingZones, workout.kilometerPace, workout.paceMax) == (
+            uploaded
+        )
+
+    def test_resumes_after_interruption(self, app, treated_patient, monkeypatch):
+        """An interrupted job is queued again & continues after the last committed batch."""
+        app.config["RECOMPUTE_BATCH_SIZE"] = 2
+        workouts = create_workouts(treated_patient, 5)
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        job = submit_job(
+            treated_patient.account,
+            "workoutRecompute",
+            {"patientIds": [treated_patient.id]},
+        )
+        recompute_derived_metrics = workout_lib.recompute_derived_metrics
+        calls = []
+
+        def interrupted(arguments):
+            calls.append(arguments)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return recompute_derived_metrics(arguments)
+
+        monkeypatch.setattr(workout_lib, "recompute_derived_metrics", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            run_next_job()
+        job = Job.query.get(job.id)
+        assert job.status == "queued"
+        assert job.progress_data["cursor"] == workouts[1].id
+        assert job.progress_data["recomputed"] == 2
+        assert heart_rate_zones(workouts[1]) is not None
+        assert heart_rate_zones(workouts[2]) is None
+
+        run_next_job()
+        job = Job.query.get(job.id)
+        assert job.status == "finished"
+        assert job.progress_data["recomputed"] == 5
+        assert len(calls) == 3 + 3
+        assert all(heart_rate_zones(workout) is not None for workout in workouts)
+
+    def test_selection(self, treated_patient, trainer, testapp_trainer):
+        """The workouts of a study group are selected, optionally in a date range."""
+        workouts = create_workouts(treated_patient, 4)
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        studyGroup = StudyGroup.create(name="Group")
+        StudyGroupPatients.create(
+            studyGroupId=studyGroup.id, patientId=treated_patient.id
+        )
+        testapp_trainer.post_json(
+            "/api/v1/job/workoutRecompute",
+            {
+                "studyGroupId": studyGroup.id,
+                "fromDate": "2021-11-02",
+                "toDate": "2021-11-03",
+            },
+        )
+        job = run_next_job()
+        assert job.progress_data["total"] == 2
+        assert [heart_rate_zones(workout) is not None for workout in workouts] == [
+            False,
+            True,
+            True,
+            False,
+        ]
+
+    def test_process_pool(self, treated_patient):
+        """The workouts are recomputed in a pool of processes like in the worker itself."""
+        workouts = create_workouts(treated_patient, 3)
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        query = recompute_query([treated_patient.id])
+        batches = []
+        assert recompute_workouts(
+            query,
+            batch_size=2,
+            processes=2,
+            on_batch=lambda *batch: batches.append(batch),
+        ) == (3, 0)
+        assert batches == [(workouts[1].id, 2, 0), (workouts[2].id, 1, 0)]
+        pooled = [heart_rate_zones(workout) for workout in workouts]
+        recompute_workouts(query)
+        assert [heart_rate_zones(workout) for workout in workouts] == pooled
+
+    def test_requeue(self, app, treated_patient, trainer):
+        """Jobs left running by a killed worker are run again."""
+        create_workouts(treated_patient, 1)
+        submit_job(trainer.account, "workoutRecompute", {"patientIds": []})
+        assert claim_next_job().status == runningJobStatus
+        result = app.test_cli_runner().invoke(run_jobs, ["--once", "--requeue"])
+        assert result.exit_code == 0, result.output
+        assert Job.query.one().status == "finished"
+
+    def test_access(self, treated_patient, trainer, testapp):
+        """Only trainers recompute workouts, invalid selections are rejected."""
+        url = "/api/v1/job/workoutRecompute"
+        authorize(testapp, treated_patient.account)
+        testapp.post_json(url, {"patientIds": [treated_patient.id]}, status=403)
+        testapp_trainer = authorize(testapp, trainer.account)
+        testapp_trainer.post_json(url, {}, status=400)
+        testapp_trainer.post_json(
+            url, {"patientIds": [treated_patient.id], "studyGroupId": 1}, status=400
+        )
+        testapp_trainer.post_json(url, {"studyGroupId": 999}, status=404)
+        testapp_trainer.post_json(
+            url, {"patientIds": [treated_patient.id], "fromDate": "x"}, status=400
+        )
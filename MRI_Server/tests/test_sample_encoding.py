@@ -0,0 +1,107 @@
+"""Sample encoding tests."""
+import json
+
+import pytest
+
+from tumsm_server.workout.healthkitDataProcessor import process_health_kit_data
+from tumsm_server.workout.sampleEncoding import (
+    SampleEncodingError,
+    decode_sample_columns,
+    decode_samples,
+    encode_samples,
+    is_encoded,
+    reencode_sample_batch,
+)
+
+from .helpers import health_kit_payload
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    result = process_health_kit_data(health_kit_payload(duration=1800))
+    return {
+        "heartRate": result[15],
+        "speed": result[16],
+        "altitude": result[17],
+        "distance": result[18],
+    }
+
+
+class TestSampleEncoding:
+    """Binary encoding of sample columns."""
+
+    @pytest.mark.parametrize(
+        "value_key", ["heartRate", "speed", "altitude", "distance"]
+    )
+    def test_round_trip(self, profiles, value_key):
+        """Decoding an encoded column yields exactly the original samples."""
+        blob = encode_samples(profiles[value_key], value_key)
+        assert is_encoded(blob)
+        assert decode_samples(blob, value_key) == profiles[value_key]
+
+    @pytest.mark.parametrize(
+        "value_key", ["heartRate", "speed", "altitude", "distance"]
+    )
+    def test_smaller_than_json(self, profiles, value_key):
+        """The encoded column is several times smaller than the JSON one."""
+        blob = encode_samples(profiles[value_key], value_key)
+        assert len(blob) * 3 < len(json.dumps(profiles[value_key]).encode())
+
+    def test_uncompressed_and_irregular_times(self):
+        """Times which aren't whole microseconds are stored as floats."""
+        profile = [
+            {"speed": 1.5, "seconds_since_start": 1 / 3},
+            {"speed": 2.25, "seconds_since_start": 2 / 3},
+        ]
+        blob = encode_samples(profile, "speed", compress=False)
+        assert decode_samples(blob, "speed") == profile
+
+    def test_empty_and_legacy_columns(self):
+        """Empty, missing & JSON encoded columns are decoded as well."""
+        assert decode_samples(encode_samples([], "speed"), "speed") == []
+        assert decode_samples(None, "speed") == []
+        legacy = [{"speed": 3.0, "seconds_since_start": 0.0}]
+        assert decode_samples(str.encode(json.dumps(legacy)), "speed") == legacy
+        times, values = decode_sample_columns(str.encode(json.dumps(legacy)), "speed")
+        assert times.tolist() == [0.0] and values.tolist() == [3.0]
+
+    def test_unknown_version(self, profiles):
+        """Columns of an unknown version are rejected."""
+        blob = bytearray(encode_samples(profiles["speed"], "speed"))
+        blob[3] = 99
+        with pytest.raises(SampleEncodingError):
+            decode_samples(bytes(blob), "speed")
+
+
+@pytest.mark.usefixtures("db")
+class TestReencodeSamples:
+    """Backfill of stored workouts."""
+
+    def test_reencode_batches(self, db, profiles):
+        """Legacy JSON columns are converted batch by batch and back."""
+        legacy = str.encode(json.dumps(profiles["heartRate"]))
+        with db.engine.begin() as connection:
+            for workout_id in range(1, 4):
+                connection.execute(
+                    "INSERT INTO workouts (id, appleUUID, patientId, type, startTime, endTime, duration, kcal, "
+                    "heartRateSamples) VALUES (?, '', 1, 37, '2021-11-18 08:00:00.000000', "
+                    "'2021-11-18 08:30:00.000000', 1800, 300, ?)",
+                    (workout_id, legacy),
+                )
+        with db.engine.begin() as connection:
+            assert reencode_sample_batch(connection, 0, batch_size=2) == 2
+            assert reencode_sample_batch(connection, 2, batch_size=2) == 3
+            assert reencode_sample_batch(connection, 3, batch_size=2) is None
+            blobs = [
+                row[0]
+                for row in connection.execute("SELECT heartRateSamples FROM workouts")
+            ]
+        assert all(is_encoded(blob) for blob in blobs)
+        assert decode_samples(blobs[0], "heartRate") == profiles["heartRate"]
+
+        with db.engine.begin() as connection:
+            reencode_sample_batch(connection, 0, batch_size=10, binary=False)
+            blob = connection.execute(
+                "SELECT heartRateSamples FROM workouts WHERE id = 1"
+            ).scalar()
+        assert json.loads(blob.decode()) == profiles["heartRate"]
@@ -0,0 +1,124 @@
+"""Workout segment tests."""
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import tumsm_server.workout.lib as workout_lib
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.segmentIndex import RangeExtrema, SampleIndex
+
+from .helpers import health_kit_payload
+
+
+class TestSegmentIndex:
+    """Statistics of time windows are answered from prefix sums & sparse tables."""
+
+    @pytest.mark.parametrize("length", [1, 31, 32, 33, 100, 1000])
+    def test_range_extrema(self, length):
+        """Minima & maxima of any range match a scan of the range."""
+        rng = np.random.default_rng(length)
+        values = rng.uniform(0, 100, length)
+        extrema = RangeExtrema(values)
+        for _ in range(200):
+            start = int(rng.integers(0, length))
+            end = int(rng.integers(start + 1, length + 1))
+            assert extrema.query(start, end) == (
+                values[start:end].min(),
+                values[start:end].max(),
+            )
+        assert extrema.query(3, 3) == (None, None)
+
+    def test_statistics(self):
+        """Samples in the half-open window are counted."""
+        index = SampleIndex(
+            np.array([0.0, 10, 20, 30]), np.array([100.0, 120, 90, 160])
+        )
+        assert index.statistics(5, 30) == {
+            "samples": 2,
+            "min": 90,
+            "max": 120,
+            "mean": 105,
+        }
+        assert index.statistics(31, 40)["mean"] is None
+        assert index.changes(0, 31) == (90, 30)
+        assert index.time_in_zones(0, 30) is None
+
+    def test_time_in_zones(self):
+        """A sample holds its value until the next one, windows cut the holds."""
+        index = SampleIndex(
+            np.array([0.0, 10, 20, 30]),
+            np.array([100.0, 120, 140, 160]),
+            (110, 130, 150, 170),
+        )
+        assert index.time_in_zones(5, 25) == {
+            "zone0": 5,
+            "zone1": 10,
+            "zone2": 5,
+            "zone3": 0,
+            "zone4": 0,
+        }
+        assert sum(index.time_in_zones(-10, 100).values()) == 30
+
+
+@pytest.mark.usefixtures("db")
+class TestSegmentEndpoint:
+    """Trainers & patients query arbitrary segments of a workout."""
+
+    def test_segment(self, treated_patient, testapp_patient):
+        """The statistics of a segment match the stored samples."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        workout = create_workout(health_kit_payload(duration=1800), treated_patient.id)
+        segment = testapp_patient.get(
+            f"/api/v1/workout/segment?id={workout.id}&start=720&end=1080"
+        ).json
+        times, values = workout.heartRateSamples_columns
+        inside = values[(times >= 720) & (times < 1080)]
+        assert segment["heartRate"]["samples"] == len(inside)
+        assert segment["heartRate"]["min"] == inside.min()
+        assert segment["heartRate"]["max"] == inside.max()
+        assert segment["heartRate"]["mean"] == pytest.approx(inside.mean())
+        assert sum(segment["heartRate"]["timeInZones"].values()) == pytest.approx(360)
+        assert segment["speed"]["timeInZones"] is None
+
+        whole = testapp_patient.get(f"/api/v1/workout/segment?id={workout.id}").json
+        assert (whole["start"], whole["end"]) == (0, 1800)
+        assert whole["altitude"]["gain"] == pytest.approx(workout.terrainUp)
+
+    def test_index_cached(self, treated_patient, testapp_patient, monkeypatch):
+        """The index is built once per workout revision & training zones."""
+        workout = create_workout(health_kit_payload(duration=600), treated_patient.id)
+        built = []
+        SegmentIndex = workout_lib.SegmentIndex
+
+        def counting_index(*args):
+            built.append(args)
+            return SegmentIndex(*args)
+
+        monkeypatch.setattr(workout_lib, "SegmentIndex", counting_index)
+        url = f"/api/v1/workout/segment?id={workout.id}&start=0&end=60"
+        for _ in range(3):
+            testapp_patient.get(url)
+        assert len(built) == 1
+        # The cached index isn't copied
+        assert workout_lib.get_cached_segment_index(
+            workout
+        ) is workout_lib.get_cached_segment_index(workout)
+        zones = create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        zones.update(creationDate=dt.date(2021, 1, 1))
+        assert testapp_patient.get(url).json["heartRate"]["timeInZones"] is not None
+        assert len(built) == 2
+
+    def test_invalid_windows(self, treated_patient, testapp_patient):
+        """Windows must be finite & not empty."""
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        url = f"/api/v1/workout/segment?id={workout.id}"
+        testapp_patient.get(url + "&start=30&end=30", status=400)
+        testapp_patient.get(url + "&start=x", status=400)
+        testapp_patient.get(url + "&end=inf", status=400)
+        testapp_patient.get("/api/v1/workout/segment?id=999", status=404)
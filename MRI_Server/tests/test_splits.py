@@ -0,0 +1,112 @@
+"""Workout split tests."""
+import json
+
+import numpy as np
+import pytest
+
+from tumsm_server.workout.lib import create_workout, get_splits
+
+from .helpers import health_kit_payload
+
+
+def columns(*samples):
+    return (
+        np.array([time for time, _ in samples], dtype=float),
+        np.array([value for _, value in samples], dtype=float),
+    )
+
+
+def pace(split):
+    return split["minutes"] * 60 + split["seconds"]
+
+
+class TestSplits:
+    """Splits are cut at the interpolated times the distance crosses their bounds."""
+
+    def test_interpolated_crossing(self):
+        """The crossing time is interpolated between distance samples, the last split holds the rest."""
+        distance = columns((10, 400), (20, 800), (30, 1600))
+        heart_rate = columns((5, 100), (15, 110), (25, 120), (30, 130))
+        splits, paceMin, paceMax = get_splits(distance, heart_rate, columns())
+        assert [split["kilometre"] for split in splits] == [1, 2]
+        assert pace(splits[0]) == pytest.approx(22.5)
+        # 600m in 7.5s
+        assert pace(splits[1]) == pytest.approx(12.5)
+        assert (paceMin, paceMax) == pytest.approx((12.5, 22.5))
+        assert (splits[0]["avgHeartRate"], splits[0]["maxHeartRate"]) == (105, 110)
+        assert (splits[1]["avgHeartRate"], splits[1]["maxHeartRate"]) == (125, 130)
+        assert splits[0]["avgSpeed"] is None and splits[0]["maxSpeed"] is None
+
+    def test_split_length(self):
+        """Splits have a configurable length."""
+        distance = columns(*[(second, second * 3.0) for second in range(1, 1001)])
+        splits, paceMin, paceMax = get_splits(distance, columns(), columns(), 250)
+        assert len(splits) == 12
+        assert paceMin == pytest.approx(1000 / 3)
+        assert paceMax == pytest.approx(1000 / 3)
+
+    def test_statistics(self):
+        """Averages & maxima per split match the samples recorded during the split."""
+        rng = np.random.default_rng(0)
+        times = np.cumsum(rng.uniform(1, 10, 500))
+        distance = (times, np.cumsum(rng.uniform(0, 40, 500)))
+        heart_rate = (
+            np.sort(rng.uniform(0, times[-1], 800)),
+            rng.uniform(80, 190, 800),
+        )
+        splits, _, _ = get_splits(distance, heart_rate, columns(), 300)
+        edges = [0.0]
+        for split in splits:
+            edges.append(edges[-1] + pace(split) * 0.3)
+        edges[-1] = times[-1]
+        for split, (start, end) in zip(splits[:-1], zip(edges, edges[1:])):
+            inside = heart_rate[1][(heart_rate[0] >= start) & (heart_rate[0] < end)]
+            if len(inside) == 0:
+                assert split["avgHeartRate"] is None
+            else:
+                assert split["avgHeartRate"] == pytest.approx(inside.mean())
+                assert split["maxHeartRate"] == inside.max()
+
+    def test_without_distance(self):
+        """Workouts without distance samples have no splits."""
+        assert get_splits(columns(), columns((1, 100)), columns()) == ([], 0, 0)
+        assert get_splits(columns((1, 0)), columns(), columns()) == ([], 0, 0)
+
+    def test_unsorted_samples(self):
+        """Samples which aren't ordered by time are sorted first."""
+        distance = columns((20, 800), (10, 400), (30, 1600))
+        heart_rate = columns((25, 120), (5, 100), (15, 110))
+        splits, _, _ = get_splits(distance, heart_rate, columns())
+        assert pace(splits[0]) == pytest.approx(22.5)
+        assert splits[0]["maxHeartRate"] == 110
+
+
+@pytest.mark.usefixtures("db")
+class TestWorkoutSplits:
+    """Splits of stored workouts."""
+
+    def test_uploaded_kilometre_splits(self, treated_patient):
+        """The kilometre splits of an upload are cut from its distance samples."""
+        workout = create_workout(health_kit_payload(duration=1800), treated_patient.id)
+        splits, paceMin, paceMax = get_splits(
+            workout.distanceSamples_columns,
+            workout.heartRateSamples_columns,
+            workout.speedSamples_columns,
+        )
+        assert json.loads(workout.kilometerPace) == splits
+        assert (workout.paceMin, workout.paceMax) == (paceMin, paceMax)
+
+    def test_splits_endpoint(self, treated_patient, testapp_patient):
+        """Splits of any length are requested, too short ones are rejected."""
+        workout = create_workout(health_kit_payload(duration=1800), treated_patient.id)
+        url = f"/api/v1/workout/splits?id={workout.id}"
+        kilometres = testapp_patient.get(url).json
+        assert kilometres["splits"] == workout.kilometerPace_data
+        halves = testapp_patient.get(url + "&splitLength=500").json
+        assert len(halves["splits"]) in (
+            2 * len(kilometres["splits"]) - 1,
+            2 * len(kilometres["splits"]),
+        )
+        testapp_patient.get(url + "&splitLength=10", status=400)
+        testapp_patient.get(url + "&splitLength=x", status=400)
+        testapp_patient.get("/api/v1/workout/splits?id=999", status=404)
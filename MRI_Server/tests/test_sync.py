@@ -0,0 +1,156 @@
+"""Incremental sync tests."""
+import datetime as dt
+import functools
+import threading
+
+import pytest
+import sqlalchemy as sa
+
+from tumsm_server.patient.models import Patient
+from tumsm_server.planning.models import PlannedWorkout
+from tumsm_server.sync.models import Change
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import Steps, WorkoutRating
+
+from .helpers import StatementRecorder, authorize, health_kit_payload
+
+
+def sync(testapp, cursor=None, **params):
+    if cursor is not None:
+        params["cursor"] = cursor
+    return testapp.get("/api/v1/sync", params).json
+
+
+@pytest.mark.usefixtures("db")
+class TestSync:
+    """Patients & trainers sync the records changed since their last sync."""
+
+    def test_full_sync(self, treated_patient, testapp_patient):
+        """Without a cursor all records are returned."""
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        WorkoutRating.create(workoutId=workout.id, rating=2, intensity=3)
+        result = sync(testapp_patient)
+        assert [w["id"] for w in result["workouts"]["updated"]] == [workout.id]
+        assert "heartRateSamples" not in result["workouts"]["updated"][0]
+        assert result["ratings"]["updated"][0]["rating"] == 2
+        assert result["cursor"] == Change.query.count()
+        assert sync(testapp_patient, result["cursor"])["workouts"] == {
+            "updated": [],
+            "deleted": [],
+        }
+
+    def test_changes_since_cursor(self, treated_patient, testapp_patient):
+        """Only created, updated & deleted records are returned."""
+        steps = Steps.create(
+            patientId=treated_patient.id, date=dt.date(2021, 11, 18), amount=10
+        )
+        planned = PlannedWorkout.create(
+            patientId=treated_patient.id, plannedDate=dt.date(2021, 11, 18), type=37
+        )
+        cursor = sync(testapp_patient)["cursor"]
+
+        steps.update(amount=20)
+        planned.delete()
+        later = Steps.create(
+            patientId=treated_patient.id, date=dt.date(2021, 11, 19), amount=5
+        )
+        result = sync(testapp_patient, cursor)
+        assert result["steps"]["updated"] == [
+            {**steps.asJson, "date": "Thu, 18 Nov 2021 00:00:00 GMT"},
+            {**later.asJson, "date": "Fri, 19 Nov 2021 00:00:00 GMT"},
+        ]
+        assert result["plannedWorkouts"] == {"updated": [], "deleted": [planned.id]}
+        assert result["cursor"] > cursor
+
+    def test_cascaded_tombstones(self, treated_patient, testapp_patient):
+        """Deleting a workout also deletes its ratings."""
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        rating = WorkoutRating.create(workoutId=workout.id, rating=2, intensity=3)
+        cursor = sync(testapp_patient)["cursor"]
+        testapp_patient.delete(f"/api/v1/workout?id={workout.id}")
+        result = sync(testapp_patient, cursor)
+        assert result["workouts"]["deleted"] == [workout.id]
+        assert result["ratings"]["deleted"] == [rating.id]
+
+    def test_work_proportional_to_changes(self, db, treated_patient, testapp_patient):
+        """An incremental sync doesn't load unchanged records."""
+        for day in range(20):
+            Steps.create(
+                patientId=treated_patient.id,
+                date=dt.date(2021, 11, 1) + dt.timedelta(days=day),
+                amount=day,
+            )
+        cursor = sync(testapp_patient)["cursor"]
+        Steps.create(patientId=treated_patient.id, date=dt.date(2021, 12, 1), amount=1)
+        with StatementRecorder(db.engine) as recorder:
+            result = sync(testapp_patient, cursor)
+        assert len(result["steps"]["updated"]) == 1
+        steps_statements = [
+            statement
+            for statement, _ in recorder.statements
+            if "FROM steps" in statement
+        ]
+        assert len(steps_statements) == 1
+
+    def test_access(self, treated_patient, trainer, testapp):
+        """Trainers sync the given patient, invalid requests are rejected."""
+        authorize(testapp, trainer.account)
+        testapp.get("/api/v1/sync", status=400)
+        assert sync(testapp, patientId=treated_patient.id)["cursor"] == 0
+        testapp.get("/api/v1/sync?patientId=999", status=404)
+        testapp.get(f"/api/v1/sync?patientId={treated_patient.id}&cursor=x", status=400)
+
+    def test_deleted_patient(self, treated_patient):
+        """The changes of a deleted patient are removed."""
+        Steps.create(
+            patientId=treated_patient.id, date=dt.date(2021, 11, 18), amount=10
+        )
+        assert Change.query.count() == 1
+        treated_patient.delete()
+        assert Change.query.count() == 0
+
+    def test_cursor_follows_commit_order(self, db, tmp_path):
+        """A transaction numbers its changes only after a concurrent one of the same patient committed."""
+        engine = sa.create_engine(f"sqlite:///{tmp_path / 'sync.db'}")
+        db.metadata.create_all(engine)
+        # Sessions of the app's session class (logging the changes), bound to a database file with locking
+        factory = functools.partial(db.session.session_factory, bind=engine, binds={})
+        setup = factory()
+        patient = Patient(
+            accountId=None,
+            treatmentStarted=dt.date(2021, 11, 1),
+            treatmentFinished=dt.date(2022, 11, 1),
+            treatmentGoal="",
+        )
+        setup.add(patient)
+        setup.commit()
+        patientId = patient.id
+        setup.close()
+
+        first, second = factory(), factory()
+        first.add(Steps(patientId=patientId, date=dt.date(2021, 11, 18), amount=1))
+        first.flush()
+
+        def upload():
+            second.add(Steps(patientId=patientId, date=dt.date(2021, 11, 19), amount=2))
+            second.commit()
+
+        thread = threading.Thread(target=upload)
+        thread.start()
+        thread.join(0.5)
+        # The second upload waits for the patient row locked by the first one
+        assert thread.is_alive()
+        first.commit()
+        thread.join()
+
+        check = factory()
+        changes = check.query(Change).order_by(Change.sequence).all()
+        assert [change.sequence for change in changes] == [1, 2]
+        assert [check.get(Steps, change.recordId).amount for change in changes] == [
+            1,
+            2,
+        ]
+        assert check.get(Patient, patientId).changeSequence == 2
+        for session in (first, second, check):
+            session.close()
+        engine.dispose()
@@ -0,0 +1,112 @@
+"""Training zone tests."""
+import datetime as dt
+import json
+
+import pytest
+
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.patient.models import PatientTrainingZones
+from tumsm_server.workout.lib import create_workout, get_training_zones
+
+from .helpers import StatementRecorder, health_kit_payload
+
+
+class Bounds:
+    """Bounds of training zones."""
+
+    def __init__(self, *bounds):
+        (
+            self.upper0Bound,
+            self.upper1Bound,
+            self.upper2Bound,
+            self.upper3Bound,
+        ) = bounds
+
+
+def heart_rate_profile(*values):
+    return [{"heartRate": value} for value in values]
+
+
+class TestTrainingZoneHistogram:
+    """Samples of a combined profile are counted per training zone."""
+
+    def test_bounds(self):
+        """Values on a bound belong to the upper zone, missing values only count towards the total."""
+        profile = heart_rate_profile(90, 110, 120, 130, 150, 169.9, 170, 200, None)
+        assert get_training_zones(
+            Bounds(110, 130, 150, 170), profile, 37, "heartRate"
+        ) == {
+            "total": 9,
+            "zone0": 1,
+            "zone1": 2,
+            "zone2": 1,
+            "zone3": 2,
+            "zone4": 2,
+        }
+
+    def test_overlapping_bounds(self):
+        """Values in overlapping zones of misconfigured bounds are counted in each of them."""
+        profile = heart_rate_profile(100, 125, 140)
+        zones = get_training_zones(Bounds(130, 120, 150, 170), profile, 37, "heartRate")
+        assert [zones[f"zone{zone}"] for zone in range(5)] == [2, 0, 2, 0, 0]
+
+    def test_no_zones(self):
+        """Without training zones there is no histogram."""
+        assert (
+            get_training_zones(None, heart_rate_profile(100), 37, "heartRate") is None
+        )
+
+
+@pytest.mark.usefixtures("db")
+class TestTrainingZoneOfDate:
+    """The training zones in effect when a workout was recorded are used."""
+
+    def create_zones(self, patient, creationDate, upper0Bound):
+        zones = create_patient_training_zones(
+            patient.id, 37, "HEARTRATE", upper0Bound, 130, 150, 170
+        )
+        zones.update(creationDate=creationDate)
+        return zones
+
+    def test_zone_of_date(self, treated_patient):
+        """The latest zones created before the date, else the oldest ones."""
+        self.create_zones(treated_patient, dt.date(2021, 11, 1), 100)
+        self.create_zones(treated_patient, dt.date(2021, 11, 10), 110)
+        self.create_zones(treated_patient, dt.date(2021, 11, 20), 120)
+
+        def upper0Bound(date):
+            zones = treated_patient.training_zone_of_date("HEARTRATE", date, 37)
+            return zones.upper0Bound
+
+        assert upper0Bound(dt.date(2021, 10, 1)) == 100
+        assert upper0Bound(dt.date(2021, 11, 10)) == 100
+        assert upper0Bound(dt.datetime(2021, 11, 18, 8)) == 110
+        assert upper0Bound(dt.date(2022, 1, 1)) == 120
+        assert (
+            treated_patient.training_zone_of_date("SPEED", dt.date.today(), 37) is None
+        )
+
+    def test_loaded_once(self, db, treated_patient):
+        """The zones of a patient are loaded once per request, until they change."""
+        self.create_zones(treated_patient, dt.date(2021, 11, 1), 100)
+        with StatementRecorder(db.engine) as recorder:
+            for unit in ("HEARTRATE", "SPEED", "HEARTRATE"):
+                treated_patient.training_zone_of_date(unit, dt.date.today(), 37)
+        zone_statements = [
+            statement
+            for statement, _ in recorder.statements
+            if 'FROM "patientTrainingZones"' in statement
+        ]
+        assert len(zone_statements) == 1
+        self.create_zones(treated_patient, dt.date(2021, 11, 10), 110)
+        zones = treated_patient.training_zone_of_date("HEARTRATE", dt.date.today(), 37)
+        assert zones.upper0Bound == 110
+
+    def test_upload_after_zones_changed(self, treated_patient):
+        """Workouts are uploaded after the zones of the patient were changed."""
+        self.create_zones(treated_patient, dt.date(2021, 11, 1), 100)
+        self.create_zones(treated_patient, dt.date(2021, 12, 1), 200)
+        workout = create_workout(health_kit_payload(duration=60), treated_patient.id)
+        heartRateZones = json.loads(workout.trainingZones)["heartRate"]
+        assert heartRateZones["zone0"] < heartRateZones["total"]
+        assert PatientTrainingZones.query.count() == 2
@@ -0,0 +1,139 @@
+"""Utility tests."""
+import datetime as dt
+import logging
+
+import pytest
+
+from tumsm_server import utils
+from tumsm_server.utils import (
+    dateTimeFormat,
+    functionStatistics,
+    log_enter_and_exit,
+    parse_date_time,
+    parse_date_times,
+)
+
+
+class ReprCounter:
+    """Counts how often it is formatted."""
+
+    def __init__(self):
+        self.reprs = 0
+
+    def __repr__(self):
+        self.reprs += 1
+        return "<ReprCounter>"
+
+
+@log_enter_and_exit
+def traced(value, other=None):
+    return value
+
+
+@log_enter_and_exit
+def failing():
+    raise ValueError("failed")
+
+
+class TestLogEnterAndExit:
+    """Tracing of function calls."""
+
+    def test_no_formatting_when_disabled(self, caplog):
+        """Arguments aren't formatted when INFO logging is disabled."""
+        caplog.set_level(logging.WARNING)
+        value = ReprCounter()
+        statistics = functionStatistics[f"{__name__}.traced"]
+        calls = statistics.calls
+        assert traced(value) is value
+        assert value.reprs == 0
+        assert statistics.calls == calls + 1
+        assert statistics.totalSeconds > 0
+
+    def test_truncated_logging(self, caplog):
+        """Large arguments & return values are truncated."""
+        caplog.set_level(logging.INFO)
+        traced("x" * 10_000_000, other={"samples": list(range(10_000))})
+        enter, exit = [record.getMessage() for record in caplog.records]
+        assert enter.startswith("> traced('xxx")
+        assert exit.startswith("< traced -> 'xxx")
+        assert len(enter) < 200
+        assert len(exit) < 100
+
+    def test_exceptions(self, caplog):
+        """Failing calls are counted & don't break the indentation."""
+        caplog.set_level(logging.INFO)
+        calls = functionStatistics[f"{__name__}.failing"].calls
+        with pytest.raises(ValueError):
+            failing()
+        assert functionStatistics[f"{__name__}.failing"].calls == calls + 1
+        traced(1)
+        assert caplog.records[-1].getMessage() == "< traced -> 1"
+
+    def test_disabled_modules(self, monkeypatch):
+        """Functions of disabled modules are not wrapped at all."""
+        monkeypatch.setattr(utils, "tracingDisabledModules", ["tests"])
+
+        def function():
+            pass
+
+        assert log_enter_and_exit(function) is function
+        monkeypatch.setattr(utils, "tracingDisabledModules", ["test"])
+        assert log_enter_and_exit(function) is not function
+
+    @pytest.mark.usefixtures("db")
+    def test_statistics_endpoint(self, testapp_trainer):
+        """Trainers can see the hottest functions."""
+        traced(1)
+        resp = testapp_trainer.get("/api/v1/statistics/functions")
+        functions = resp.json["functions"]
+        assert f"{__name__}.traced" in [function["name"] for function in functions]
+        totals = [function["totalSeconds"] for function in functions]
+        assert totals == sorted(totals, reverse=True)
+
+
+class TestParseDateTime:
+    """Parsing of healthkit timestamps."""
+
+    @pytest.mark.parametrize(
+        "timestamp",
+        [
+            "2021-11-18 08:00:00.250000",
+            "2021-11-18 23:59:59.999999",
+            "2020-02-29 00:00:00.000000",
+            "2021-11-18 08:00:00.25",
+            "2021-1-8 8:0:0.5",
+        ],
+    )
+    def test_compatible_with_strptime(self, timestamp):
+        """Timestamps are parsed exactly like with strptime."""
+        assert parse_date_time(timestamp) == dt.datetime.strptime(
+            timestamp, dateTimeFormat
+        )
+
+    @pytest.mark.parametrize(
+        "timestamp",
+        [
+            "2021-11-18T08:00:00.250000",
+            "2021-11-18 08:00:00",
+            "2021-02-30 08:00:00.250000",
+            "2021-11-18 08:00:00.25+0100",
+            "2021-11-18 08:00:00.2500000",
+        ],
+    )
+    def test_invalid(self, timestamp):
+        """Timestamps rejected by strptime are rejected as well."""
+        with pytest.raises(ValueError):
+            parse_date_time(timestamp)
+        with pytest.raises(ValueError):
+            parse_date_times(["2021-11-18 08:00:00.250000", timestamp])
+
+    def test_bulk(self):
+        """Sequences of timestamps are parsed like one by one, also with non canonical ones."""
+        canonical = ["2021-11-18 08:00:00.250000", "2020-02-29 00:00:00.000000"]
+        for timestamps in [canonical, canonical + ["2021-1-8 8:0:0.5"], []]:
+            parsed = parse_date_times(timestamps)
+            assert parsed.dtype == "datetime64[us]"
+            assert parsed.tolist() == [
+                dt.datetime.strptime(timestamp, dateTimeFormat)
+                for timestamp in timestamps
+            ]
@@ -0,0 +1,101 @@
+"""Workout overview tests."""
+import pytest
+
+from tumsm_server.patient.lib import create_patient_training_zones
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import WorkoutRating
+from tumsm_server.workout.sampleEncoding import SAMPLE_COLUMNS
+
+from .helpers import StatementRecorder, health_kit_payload
+
+
+def upload_rated_workouts(patient, count, start=0):
+    workouts = [
+        create_workout(health_kit_payload(duration=60, seed=seed), patient.id)
+        for seed in range(start, start + count)
+    ]
+    for workout in workouts:
+        WorkoutRating.create(workoutId=workout.id, rating=1, intensity=2)
+        WorkoutRating.create(workoutId=workout.id, rating=3, intensity=4, comment="ok")
+    return workouts
+
+
+@pytest.mark.usefixtures("db")
+class TestWorkoutOverviews:
+    """The workout overviews of a patient."""
+
+    def test_latest_rating(self, treated_patient, testapp_trainer):
+        """The latest rating of each workout is shown."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        upload_rated_workouts(treated_patient, 2)
+        create_workout(health_kit_payload(duration=60, seed=2), treated_patient.id)
+        resp = testapp_trainer.get(
+            f"/api/v1/workout/overviews?patientId={treated_patient.id}"
+        )
+        assert sorted(
+            (workout["rating"], workout["intensity"], workout["comment"])
+            for workout in resp.json["workouts"]
+        ) == [(-1, -1, ""), (3, 4, "ok"), (3, 4, "ok")]
+
+    def test_constant_query_count(self, db, treated_patient, testapp_trainer):
+        """The number of queries doesn't grow with the number of rated workouts."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+
+        def count_queries():
+            with StatementRecorder(db.engine) as recorder:
+                testapp_trainer.get(
+                    f"/api/v1/workout/overviews?patientId={treated_patient.id}"
+                )
+            return len(recorder.statements)
+
+        upload_rated_workouts(treated_patient, 2)
+        few = count_queries()
+        upload_rated_workouts(treated_patient, 20, start=2)
+        assert count_queries() == few
+
+    def test_samples_not_loaded(self, db, treated_patient, testapp_trainer):
+        """The overview endpoints don't load the sample blobs."""
+        create_patient_training_zones(
+            treated_patient.id, 37, "HEARTRATE", 110, 130, 150, 170
+        )
+        upload_rated_workouts(treated_patient, 2)
+        with StatementRecorder(db.engine) as recorder:
+            testapp_trainer.get(
+                f"/api/v1/workout/overviews?patientId={treated_patient.id}"
+            )
+            testapp_trainer.get(
+                f"/api/v1/patient/overviews?patientIds={treated_patient.id}"
+            )
+        for statement, _ in recorder.statements:
+            for column in SAMPLE_COLUMNS:
+                assert column not in statement
+
+    def test_detail_undefers_what_it_needs(self, db, treated_patient, testapp_trainer):
+        """The workout endpoint loads the samples with one explicit query, the pyramid with the workout."""
+        workout = upload_rated_workouts(treated_patient, 1)[0]
+        url = f"/api/v1/workout?id={workout.id}"
+
+        def workout_statements(params):
+            db.session.expire_all()
+            with StatementRecorder(db.engine) as recorder:
+                testapp_trainer.get(url + params)
+            return [
+                statement
+                for statement, _ in recorder.statements
+                if "FROM workouts" in statement
+            ]
+
+        statements = workout_statements("&maxPoints=100")
+        pyramidStatements = [s for s in statements if "samplePyramid" in s]
+        assert len(pyramidStatements) == 1 and "appleUUID" in pyramidStatements[0]
+        assert not any("heartRateSamples" in statement for statement in statements)
+        statements = workout_statements("&sampleRate=10")
+        assert len([s for s in statements if "heartRateSamples" in s]) == 1
+        assert not any("samplePyramid" in statement for statement in statements)
+        # The cached profile needs no samples
+        statements = workout_statements("&sampleRate=10")
+        assert not any("heartRateSamples" in statement for statement in statements)
@@ -0,0 +1,97 @@
+"""Workout summary tests."""
+import datetime as dt
+
+import pytest
+
+from tumsm_server.patient.lib import create_patient_training_zones, workout_overviews
+from tumsm_server.workout.lib import create_workout
+from tumsm_server.workout.models import WorkoutRating, WorkoutSummary
+
+from .helpers import health_kit_payload
+
+
+def upload_workouts(patient, count):
+    create_patient_training_zones(patient.id, 37, "HEARTRATE", 110, 130, 150, 170)
+    return [
+        create_workout(health_kit_payload(duration=600, seed=seed), patient.id)
+        for seed in range(count)
+    ]
+
+
+@pytest.mark.usefixtures("db")
+class TestWorkoutSummary:
+    """Summaries are kept up to date with their workouts."""
+
+    def test_created_with_workout(self, treated_patient):
+        """Uploading a workout creates its summary."""
+        (workout,) = upload_workouts(treated_patient, 1)
+        summary = WorkoutSummary.query.filter_by(workoutId=workout.id).one()
+        zones = workout.trainingZones_data["heartRate"]
+        assert summary.patientId == treated_patient.id
+        assert summary.duration == workout.duration
+        assert summary.rating is None
+        assert summary.heartRateZoneTotal == zones["total"]
+        assert [
+            summary.heartRateZone0,
+            summary.heartRateZone1,
+            summary.heartRateZone2,
+            summary.heartRateZone3,
+            summary.heartRateZone4,
+        ] == [zones[f"zone{index}"] for index in range(5)]
+
+    def test_follows_latest_rating(self, treated_patient):
+        """Creating, updating & deleting ratings updates the summary."""
+        (workout,) = upload_workouts(treated_patient, 1)
+        first = WorkoutRating.create(workoutId=workout.id, rating=1, intensity=5)
+        assert workout.summary.rating == 1
+        second = WorkoutRating.create(workoutId=workout.id, rating=3, intensity=5)
+        assert workout.summary.rating == 3
+        first.update(rating=2)
+        assert workout.summary.rating == 3
+        second.delete()
+        assert workout.summary.rating == 2
+        first.delete()
+        assert workout.summary.rating is None
+
+    def test_deleted_with_workout(self, treated_patient):
+        """Deleting a workout deletes its summary."""
+        (workout,) = upload_workouts(treated_patient, 1)
+        workout.delete()
+        assert WorkoutSummary.query.count() == 0
+
+    def test_workout_overviews(self, treated_patient, trainer):
+        """Ratings, hours & zones are aggregated per patient."""
+        workouts = upload_workouts(treated_patient, 3)
+        WorkoutRating.create(workoutId=workouts[0].id, rating=3, intensity=5)
+        WorkoutRating.create(workoutId=workouts[1].id, rating=1, intensity=5)
+        overview = workout_overviews(None, None, [treated_patient.id, 999])
+        assert overview[999]["lastTraining"] is None
+        assert overview[999]["ratings"]["unrated"] == 0
+        patient_overview = overview[treated_patient.id]
+        assert patient_overview["ratings"] == {
+            "unrated": 1,
+            "bad": 1,
+            "medium": 0,
+            "good": 1,
+        }
+        assert patient_overview["totalHours"] == pytest.approx(3 * 600 / 3600)
+        assert patient_overview["lastTraining"] == workouts[0].startTime
+        assert sum(patient_overview["heartRateProfiles"][37].values()) == sum(
+            w.trainingZones_data["heartRate"]["total"] for w in workouts
+        )
+        assert (
+            workout_overviews(dt.datetime(2022, 1, 1), None, [treated_patient.id])[
+                treated_patient.id
+            ]["totalHours"]
+            == 0
+        )
+
+    def test_patient_overviews_endpoint(self, treated_patient, testapp_trainer):
+        """The patient overview is served from the summaries."""
+        upload_workouts(treated_patient, 2)
+        resp = testapp_trainer.get("/api/v1/patient/overviews")
+        (overview,) = resp.json
+        assert overview["ratings"]["unrated"] == 2
+        assert overview["totalHours"] == pytest.approx(2 * 600 / 3600)
+        assert overview["heartRateProfileCycling"]["zone0"] == 0
+        assert sum(overview["heartRateProfileRunning"].values()) > 0
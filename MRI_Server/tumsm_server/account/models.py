@@ -65,6 +65,10 @@ class Account(UserMixin, PkModel):
                 setattr(self, attr, value)
         return commit and self.save() or self
 
+    def revised_records(self):
+        """The name & contact data of the account are part of its patients."""
+        return self.patients
+
     def set_password(self, password):
         """Set password."""
         self.password = bcrypt.generate_password_hash(password)
@@ -1,9 +1,12 @@
 """The user module."""
 
 from . import account  # noqa
+from . import job  # noqa
 from . import patient  # noqa
 from . import studyGroup  # noqa
 from . import trainer  # noqa
 from . import planning  # noqa
+from . import statistics  # noqa
+from . import sync  # noqa
 from . import views  # noqa
 from . import workout  # noqa
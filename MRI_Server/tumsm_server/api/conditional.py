@@ -0,0 +1,29 @@
+"""Conditional requests, answering If-None-Match with 304 Not Modified."""
+import hashlib
+
+from flask import Response, after_this_request, request
+
+
+def make_etag(*revisions):
+    """Strong ETag of the revisions (ids, revision counters, dates...) a response is built from"""
+    return hashlib.sha1(repr(revisions).encode()).hexdigest()
+
+
+def not_modified(*revisions):
+    """Return a 304 response if the client already has the current version of the response, else None
+
+    Call it before building the response, the response is tagged with the ETag of the revisions.
+    """
+    etag = make_etag(*revisions)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    @after_this_request
+    def add_etag(response):
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+
+    return None
@@ -0,0 +1,142 @@
+import json
+
+from flask import Response, request, send_file
+from flask_jwt_extended import jwt_required, current_user
+
+from .authorization import is_a_trainer, equals_account
+from .views import blueprint
+import tumsm_server.job.lib as lib
+from ..job.models import Job, finishedJobStatus, runningJobStatus
+from ..planning.forms import ImportPlannedWorkoutsForm
+from ..studygroup.models import StudyGroup
+from ..utils import log_enter_and_exit, parse_date
+
+
+@blueprint.route("/job/patientExport", methods=["POST"])
+@jwt_required()
+@log_enter_and_exit
+def add_patient_export_job():
+    """Endpoint for exporting the workouts of patients as zip archive of xlsx files in the background"""
+    if request.json is None or request.json.get("patientIds") is None:
+        return Response({"400 Bad Request"}, status=400)
+    if not is_a_trainer(current_user):
+        return Response("403 Forbidden", status=403)
+    arguments = {
+        "patientIds": request.json["patientIds"],
+        "fromDate": request.json.get("fromDate"),
+        "toDate": request.json.get("toDate"),
+    }
+    try:
+        for date in (arguments["fromDate"], arguments["toDate"]):
+            if date is not None:
+                parse_date(date)
+    except ValueError:
+        return Response("400 Bad Request - Wrong date format", status=400)
+    job = lib.submit_job(current_user, lib.patientExportJobType, arguments)
+    return {"job": job.id}, 202
+
+
+@blueprint.route("/job/planningImport", methods=["POST"])
+@jwt_required()
+@log_enter_and_exit
+def add_planning_import_job():
+    """Endpoint for importing multiple planned workouts for one patient in the background"""
+    if request.json is None:
+        return Response({"400 Bad Request"}, status=400)
+    if not is_a_trainer(current_user):
+        return Response("403 Forbidden", status=403)
+    form = ImportPlannedWorkoutsForm(obj=request.json, meta={"csrf": False})
+    if form.validate_on_submit():
+        job = lib.submit_job(
+            current_user,
+            lib.planningImportJobType,
+            {"patientId": form.patientId.data, "xlsxBase64": form.xlsxBase64.data},
+        )
+        return {"job": job.id}, 202
+    return Response(json.dumps(form.errors), status=422, mimetype="application/json")
+
+
+@blueprint.route("/job/workoutRecompute", methods=["POST"])
+@jwt_required()
+@log_enter_and_exit
+def add_workout_recompute_job():
+    """Endpoint for recomputing derived metrics of patients or a study group in the background"""
+    if request.json is None:
+        return Response({"400 Bad Request"}, status=400)
+    if not is_a_trainer(current_user):
+        return Response("403 Forbidden", status=403)
+    patientIds = request.json.get("patientIds")
+    studyGroupId = request.json.get("studyGroupId")
+    if (patientIds is None) == (studyGroupId is None):
+        return Response(
+            "400 Bad Request - Either patientIds or studyGroupId is required",
+            status=400,
+        )
+    if studyGroupId is not None and StudyGroup.query.get(studyGroupId) is None:
+        return Response("404 Study Group Not Found", status=404)
+    arguments = {
+        "patientIds": patientIds,
+        "studyGroupId": studyGroupId,
+        "fromDate": request.json.get("fromDate"),
+        "toDate": request.json.get("toDate"),
+    }
+    try:
+        for date in (arguments["fromDate"], arguments["toDate"]):
+            if date is not None:
+                parse_date(date)
+    except ValueError:
+        return Response("400 Bad Request - Wrong date format", status=400)
+    job = lib.submit_job(current_user, lib.workoutRecomputeJobType, arguments)
+    return {"job": job.id}, 202
+
+
+def get_own_job():
+    """Return the requested job, or an error response if it doesn't exist or belongs to another account"""
+    if request.args is None or request.args.get("id") is None:
+        return None, Response({"400 Bad Request"}, status=400)
+    job = Job.query.filter_by(id=request.args.get("id")).first()
+    if job is None:
+        return None, Response("404 Job Not Found", status=404)
+    if not equals_account(current_user, job.account):
+        return None, Response("403 Forbidden", status=403)
+    return job, None
+
+
+@blueprint.route("/job", methods=["GET"])
+@jwt_required()
+def get_job():
+    """Endpoint for polling the status of a job"""
+    job, error = get_own_job()
+    if error is not None:
+        return error
+    return job.asJson
+
+
+@blueprint.route("/job/result", methods=["GET"])
+@jwt_required()
+def get_job_result():
+    """Endpoint for downloading the result of a finished job"""
+    job, error = get_own_job()
+    if error is not None:
+        return error
+    if job.status != finishedJobStatus:
+        return Response("409 Conflict - The job is not finished", status=409)
+    return send_file(
+        lib.job_result_path(job),
+        mimetype=job.resultMimetype,
+        as_attachment=True,
+        download_name=job.resultName,
+    )
+
+
+@blueprint.route("/job", methods=["DELETE"])
+@jwt_required()
+def delete_job():
+    """Endpoint for deleting a job & its result"""
+    job, error = get_own_job()
+    if error is not None:
+        return error
+    if job.status == runningJobStatus:
+        return Response("409 Conflict - The job is running", status=409)
+    lib.delete_job(job)
+    return {"job": job.id}
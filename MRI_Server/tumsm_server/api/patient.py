@@ -1,10 +1,14 @@
+import datetime
 import json
+import tempfile
+
 from flask_jwt_extended import jwt_required, current_user
-from flask import jsonify, Response, request
+from flask import jsonify, Response, request, send_file
 
 from tumsm_server.patient.models import Patient, PatientTrainingZones
 
 from .authorization import is_a_trainer, equals_account, is_patient
+from .conditional import not_modified
 from .views import blueprint
 import tumsm_server.patient.lib as lib
 
@@ -68,6 +72,10 @@ def get_patient():
 @blueprint.route("/patient/export", methods=["GET"])
 @jwt_required()
 def export_data():
+    """Endpoint for exporting the workouts of patients as xlsx files
+
+    With format=zip the files are sent as one zip archive, otherwise as base64 strings in a JSON array.
+    """
     if request.args is None or request.args.get("patientIds") is None:
         return Response({"400 Bad Request"}, status=400)
     patientIds = request.args.getlist("patientIds")
@@ -77,8 +85,19 @@ def export_data():
         fromDate = parse_date(fromDate)
     if toDate is not None:
         toDate = parse_date(toDate)
-    patientDumps = []
     selectedPatients = Patient.query.filter(Patient.id.in_(patientIds)).all()
+    if request.args.get("format") == "zip":
+        # The temporary file is deleted as soon as the response has been sent
+        archive = tempfile.TemporaryFile()
+        lib.write_patients_zip(selectedPatients, fromDate, toDate, archive)
+        archive.seek(0)
+        return send_file(
+            archive,
+            mimetype="application/zip",
+            as_attachment=True,
+            download_name="export.zip",
+        )
+    patientDumps = []
     for patient in selectedPatients:
         patientDumps.append(
             {
@@ -207,8 +226,17 @@ def patients():
                 toDate = parse_date(toDate)
         except ValueError:
             return Response("400 Bad Request - Wrong date format", status=403)
+    # The week progress depends on the current date
+    notModified = not_modified(lib.patient_revisions(), datetime.date.today())
+    if notModified is not None:
+        return notModified
     patient_overview = []
-    for patient in Patient.query.all():
+    all_patients = Patient.query.all()
+    patientIds = [patient.id for patient in all_patients]
+    workout_overviews = lib.workout_overviews(fromDate, toDate, patientIds)
+    training_progresses = lib.training_progresses(patientIds, fromDate, toDate)
+    for patient in all_patients:
+        workout_overview = workout_overviews[patient.id]
         heartRateTrainingZoneCycling = patient.active_training_zone(
             "HEARTRATE", cyclingWorkoutType
         )
@@ -241,18 +269,18 @@ def patients():
                 "treatmentStarted": patient.treatmentStarted,
                 "treatmentFinished": patient.treatmentFinished,
                 "weekProgress": lib.week_progress(patient),
-                "lastTraining": lib.last_training(patient),
-                "ratings": lib.rating_overview(patient, fromDate, toDate),
-                "trainingProgress": lib.training_progress(patient, fromDate, toDate),
+                "lastTraining": workout_overview["lastTraining"],
+                "ratings": workout_overview["ratings"],
+                "trainingProgress": training_progresses[patient.id],
                 "studyGroups": lib.get_study_group_array(patient.studygroups),
-                "heartRateProfileRunning": lib.get_heartrate_profile(
-                    patient, fromDate, toDate, runningWorkoutType
+                "heartRateProfileRunning": workout_overview["heartRateProfiles"].get(
+                    runningWorkoutType, lib.empty_heartrate_profile()
                 ),
-                "heartRateProfileCycling": lib.get_heartrate_profile(
-                    patient, fromDate, toDate, cyclingWorkoutType
+                "heartRateProfileCycling": workout_overview["heartRateProfiles"].get(
+                    cyclingWorkoutType, lib.empty_heartrate_profile()
                 ),
                 "active": patient.account.active,
-                "totalHours": lib.get_total_workout_hours(patient, fromDate, toDate),
+                "totalHours": workout_overview["totalHours"],
                 "height": patient.height,
                 "weight": patient.weight,
                 "gender": patient.gender,
@@ -0,0 +1,15 @@
+from flask import Response
+from flask_jwt_extended import jwt_required, current_user
+
+from .authorization import is_a_trainer
+from .views import blueprint
+from ..utils import function_statistics
+
+
+@blueprint.route("/statistics/functions", methods=["GET"])
+@jwt_required()
+def get_function_statistics():
+    """Endpoint for getting the call counts & timings of the traced functions of this worker process"""
+    if not is_a_trainer(current_user):
+        return Response("403 Forbidden", status=403)
+    return {"functions": [statistics.asJson for statistics in function_statistics()]}
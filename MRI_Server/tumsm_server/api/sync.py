@@ -0,0 +1,33 @@
+from flask import Response, request
+from flask_jwt_extended import jwt_required, current_user
+
+from .authorization import is_a_patient, is_a_trainer, is_patient
+from .views import blueprint
+import tumsm_server.sync.lib as lib
+from ..patient.models import Patient
+
+
+@blueprint.route("/sync", methods=["GET"])
+@jwt_required()
+def sync():
+    """Endpoint for getting the records of a patient changed since the cursor of the last sync
+
+    Patients sync their own records, trainers the ones of the patient given by patientId. Without a cursor all records
+    are returned.
+    """
+    patientId = request.args.get("patientId")
+    if patientId is None and is_a_patient(current_user):
+        patientId = current_user.patients[0].id
+    if patientId is None:
+        return Response({"400 Bad Request"}, status=400)
+    if Patient.query.filter_by(id=patientId).first() is None:
+        return Response("404 Patient Not Found", status=404)
+    if not is_a_trainer(current_user) and not is_patient(current_user, patientId):
+        return Response("403 Forbidden", status=403)
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        if not cursor.isdigit():
+            return Response("400 Bad Request - Invalid cursor", status=400)
+        cursor = int(cursor)
+    nextCursor, changes = lib.sync(int(patientId), cursor)
+    return {"cursor": nextCursor, **changes}
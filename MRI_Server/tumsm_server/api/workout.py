@@ -1,9 +1,12 @@
+import datetime
 import json
+import math
 
 from flask import jsonify, Response, request
 from flask_jwt_extended import jwt_required, current_user
 
 from sqlalchemy import extract
+from sqlalchemy.orm import selectinload, undefer
 
 from ..patient.lib import training_progress
 from ..planning.lib import runningWorkoutType, cyclingWorkoutType
@@ -17,11 +20,26 @@ from ..workout.forms import (
 )
 from tumsm_server.workout.models import Workout, WorkoutRating, Steps
 
-from ..workout.lib import create_workout, get_combined_profile
+from ..workout.lib import (
+    create_workout,
+    create_workouts,
+    get_cached_combined_profile,
+    get_cached_segment_index,
+    get_downsampled_profiles,
+    get_splits,
+)
 from .authorization import *
+from .conditional import not_modified
 from ..utils import log_enter_and_exit
 from .views import blueprint
 
+# Maximum number of workouts of one bulk upload
+maxBulkWorkouts = 50
+# Shortest split length (m) of /workout/splits
+minSplitLength = 100
+# Fewest points per sample stream of downsampled profiles
+minMaxPoints = 2
+
 
 @blueprint.route("/workout/steps", methods=["POST"])
 @jwt_required()
@@ -69,9 +87,8 @@ def add_workout():
     request.json["patientId"] = patient.id
     form = AddWorkoutForm(obj=request.json, meta={"csrf": False})
     if form.validate_on_submit():
-        workout_json = request.json.get("healthJsonData")
         isPatch = request.method == "PATCH"
-        workout = create_workout(workout_json, patient.id, patch=isPatch)
+        workout = create_workout(form.payload, patient.id, patch=isPatch)
         if workout is None:
             return Response(
                 {
@@ -83,6 +100,28 @@ def add_workout():
     return Response(json.dumps(form.errors), status=422, mimetype="application/json")
 
 
+@blueprint.route("/workout/bulk", methods=["POST"])
+@jwt_required()
+@log_enter_and_exit
+def add_workouts():
+    """Endpoint for adding multiple workouts to a patient at once, e.g. after the phone was offline"""
+    account = current_user
+
+    if len(account.patients) == 0:
+        return Response({"404 No patient found for this account"}, status=404)
+
+    patient = account.patients[0]
+
+    if request.json is None or not isinstance(request.json.get("workouts"), list):
+        return Response({"400 Bad Request"}, status=400)
+    if len(request.json["workouts"]) > maxBulkWorkouts:
+        return Response(
+            f"413 Payload Too Large - At most {maxBulkWorkouts} workouts per request",
+            status=413,
+        )
+    return {"workouts": create_workouts(request.json["workouts"], patient.id)}
+
+
 @blueprint.route("/workout/raw", methods=["GET"])
 @jwt_required()
 def get_workout_raw():
@@ -92,12 +131,15 @@ def get_workout_raw():
     workout = Workout.query.filter_by(id=request.args.get("id")).first()
     if workout is None:
         return Response("404 Workout Not Found", status=404)
+    notModified = not_modified(workout.id, workout.revision)
+    if notModified is not None:
+        return notModified
     rawWorkout = workout.rawJson[0]
     if rawWorkout is None:
         return Response("404 Raw Workout Not Found", status=404)
     return {
         "workoutId": workout.id,
-        "rawJson": json.loads(rawWorkout.healthKitJson.decode()),
+        "rawJson": rawWorkout.healthKit,
     }
 
 
@@ -108,17 +150,34 @@ def get_workout():
     requested_workoutId = request.args.get("id")
     requested_workout_uuid = request.args.get("appleUUID")
     sample_rate = request.args.get("sampleRate")
+    max_points = request.args.get("maxPoints")
     if (
         (requested_workoutId is None and requested_workout_uuid is None)
         or (requested_workoutId is not None and requested_workout_uuid is not None)
-        or sample_rate is None
+        or (sample_rate is None and max_points is None)
     ):
         return Response({"400 Bad Request"}, status=400)
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            return Response(
+                "400 Bad Request - maxPoints must be an integer", status=400
+            )
+        if max_points < minMaxPoints:
+            return Response(
+                f"400 Bad Request - maxPoints must be at least {minMaxPoints}",
+                status=400,
+            )
+    # The samples are only loaded if the combined profile isn't cached, see get_cached_combined_profile
+    query = Workout.query
+    if max_points is not None:
+        query = query.options(undefer(Workout.samplePyramid))
     workout = None
     if requested_workoutId is not None:
-        workout = Workout.query.filter_by(id=requested_workoutId).first()
+        workout = query.filter_by(id=requested_workoutId).first()
     if requested_workout_uuid is not None:
-        workout = Workout.query.filter_by(appleUUID=requested_workout_uuid).first()
+        workout = query.filter_by(appleUUID=requested_workout_uuid).first()
     if workout is None:
         return Response("404 Workout not found", status=404)
     else:
@@ -126,10 +185,14 @@ def get_workout():
             current_user, workout.patient.account
         ) and not is_a_trainer(current_user):
             return Response("403 Forbidden", status=403)
-        sample_rate = request.args.get("sampleRate")
-        if not isinstance(sample_rate, int):
-            sample_rate = force_to_int(sample_rate)
-        combined_profile = get_combined_profile(sample_rate, workout=workout)
+        notModified = not_modified(workout.id, workout.revision)
+        if notModified is not None:
+            return notModified
+        combined_profile = None
+        if sample_rate is not None:
+            if not isinstance(sample_rate, int):
+                sample_rate = force_to_int(sample_rate)
+            combined_profile = get_cached_combined_profile(sample_rate, workout)
         patient = Patient.query.filter_by(id=workout.patientId).first()
         return {
             "id": workout.id,
@@ -155,9 +218,76 @@ def get_workout():
             "trainingZones": workout.trainingZones_data,
             "type": force_to_int(workout.type),
             "combinedProfiles": combined_profile,
+            "downsampledProfiles": get_downsampled_profiles(max_points, workout)
+            if max_points is not None
+            else None,
         }
 
 
+@blueprint.route("/workout/splits", methods=["GET"])
+@jwt_required()
+def get_workout_splits():
+    """Endpoint for getting the splits of a workout every splitLength metres (default 1000)"""
+    if request.args is None or "id" not in request.args:
+        return Response({"400 Bad Request"}, status=400)
+    try:
+        split_length = int(request.args.get("splitLength", 1000))
+    except ValueError:
+        return Response("400 Bad Request - splitLength must be an integer", status=400)
+    if split_length < minSplitLength:
+        return Response(
+            f"400 Bad Request - splitLength must be at least {minSplitLength}",
+            status=400,
+        )
+    workout = Workout.query.filter_by(id=request.args.get("id")).first()
+    if workout is None:
+        return Response("404 Workout not found", status=404)
+    if not equals_account(current_user, workout.patient.account) and not is_a_trainer(
+        current_user
+    ):
+        return Response("403 Forbidden", status=403)
+    notModified = not_modified(workout.id, workout.revision, split_length)
+    if notModified is not None:
+        return notModified
+    splits, paceMin, paceMax = get_splits(
+        workout.distanceSamples_columns,
+        workout.heartRateSamples_columns,
+        workout.speedSamples_columns,
+        split_length,
+    )
+    return {"splits": splits, "paceMin": paceMin, "paceMax": paceMax}
+
+
+@blueprint.route("/workout/segment", methods=["GET"])
+@jwt_required()
+def get_workout_segment():
+    """Endpoint for getting min/max/mean, time in zone & elevation changes of a workout between start & end (s)"""
+    if request.args is None or "id" not in request.args:
+        return Response({"400 Bad Request"}, status=400)
+    workout = Workout.query.filter_by(id=request.args.get("id")).first()
+    if workout is None:
+        return Response("404 Workout not found", status=404)
+    if not equals_account(current_user, workout.patient.account) and not is_a_trainer(
+        current_user
+    ):
+        return Response("403 Forbidden", status=403)
+    try:
+        start = float(request.args.get("start", 0))
+        end = float(
+            request.args.get(
+                "end", (workout.endTime - workout.startTime).total_seconds()
+            )
+        )
+    except ValueError:
+        return Response("400 Bad Request - start & end must be numbers", status=400)
+    if not (math.isfinite(start) and math.isfinite(end) and start < end):
+        return Response("400 Bad Request - start must be before end", status=400)
+    return {
+        "workoutId": workout.id,
+        **get_cached_segment_index(workout).segment(start, end),
+    }
+
+
 @blueprint.route("/workout", methods=["DELETE"])
 @jwt_required()
 def delete_workout():
@@ -196,7 +326,16 @@ def workouts():
 
     if patientId is None:
         return Response({"400 Bad Request"}, status=400)
-    found_workouts = Workout.query.filter_by(patientId=patientId)
+    patient = Patient.query.filter_by(id=patientId).first()
+    if patient is None:
+        return Response("404 Patient Not Found", status=404)
+    # The training progress depends on the current date
+    notModified = not_modified(patient.id, patient.revision, datetime.date.today())
+    if notModified is not None:
+        return notModified
+    found_workouts = Workout.query.filter_by(patientId=patientId).options(
+        selectinload(Workout.latestRating)
+    )
     found_steps = Steps.query.filter_by(patientId=patientId)
     if from_date_p is not None and to_date_p is not None:
         found_workouts = found_workouts.filter(Workout.startTime >= from_date_p).filter(
@@ -290,9 +429,6 @@ def workouts():
                 "mainHeartRateSegment": force_to_int(workout.mainHeartRate_segment()),
             }
         )
-    patient = Patient.query.filter_by(id=patientId).first()
-    if patient is None:
-        return Response("404 Patient Not Found", status=404)
     name = patient.account.full_name
     treatment_goal = patient.treatmentGoal
     if patient.study_group is None:
@@ -26,6 +26,8 @@ from tumsm_server.extensions import (
     jwt,
     login_manager,
     migrate,
+    request_metrics,
+    segment_indexes,
 )
 
 
@@ -56,6 +58,8 @@ def register_extensions(app):
     migrate.init_app(app, db)
     flask_static_digest.init_app(app)
     jwt.init_app(app)
+    request_metrics.init_app(app)
+    segment_indexes.init_app(app, "SEGMENT_INDEX_CACHE")
     return None
 
 
@@ -101,7 +105,10 @@ def register_shellcontext(app):
 def register_commands(app):
     """Register Click commands."""
     app.cli.add_command(commands.test)
+    app.cli.add_command(commands.benchmark)
     app.cli.add_command(commands.lint)
+    app.cli.add_command(commands.encode_samples)
+    app.cli.add_command(commands.run_jobs)
 
 
 def configure_logger(app):
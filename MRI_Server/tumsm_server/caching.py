@@ -0,0 +1,181 @@
+"""Cache backends for the flask_caching extension."""
+import logging
+import threading
+from collections import OrderedDict
+from time import time
+
+from flask_caching.backends.simplecache import SimpleCache
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(SimpleCache):
+    """Thread safe memory cache evicting the least recently used items
+
+    Configured with CACHE_TYPE = "tumsm_server.caching.LRUCache", it holds at most CACHE_THRESHOLD items with at most
+    CACHE_MAX_BYTES pickled bytes in total, larger values aren't cached. Unlike SimpleCache, which drops every third
+    item once it is full, reading an item keeps it in the cache.
+    """
+
+    def __init__(
+        self,
+        threshold=500,
+        default_timeout=300,
+        ignore_errors=False,
+        max_bytes=128 * 1024 * 1024,
+    ):
+        super().__init__(threshold, default_timeout, ignore_errors)
+        # SimpleCache binds clear to the dict's clear, which returns None instead of whether the cache was cleared
+        del self.clear
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.maxBytes = max_bytes
+        self.nbytes = 0
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        if "CACHE_MAX_BYTES" in config:
+            kwargs["max_bytes"] = config["CACHE_MAX_BYTES"]
+        return super().factory(app, config, args, kwargs)
+
+    def _prune(self, size):
+        now = time()
+        for key in [
+            key
+            for key, (expires, _) in self._cache.items()
+            if expires != 0 and expires <= now
+        ]:
+            self._pop(key)
+        while self._cache and (
+            len(self._cache) >= self._threshold or self.nbytes + size > self.maxBytes
+        ):
+            key, (_, value) = self._cache.popitem(last=False)
+            self.nbytes -= len(value)
+            logger.debug("evicted key %r", key)
+
+    def _pop(self, key):
+        item = self._cache.pop(key, None)
+        if item is None:
+            return False
+        self.nbytes -= len(item[1])
+        return True
+
+    def _store(self, key, value, timeout):
+        self._pop(key)
+        if len(value) > self.maxBytes:
+            logger.debug("skipped key %r of %d bytes", key, len(value))
+            return False
+        self._prune(len(value))
+        self._cache[key] = (self._normalize_timeout(timeout), value)
+        self.nbytes += len(value)
+        return True
+
+    def get(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires != 0 and expires <= time():
+                self._pop(key)
+                return None
+            self._cache.move_to_end(key)
+        try:
+            return pickle.loads(value)
+        except Exception as exc:
+            logger.error("get key %r -> %s", key, exc)
+            return None
+
+    def set(self, key, value, timeout=None):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            return self._store(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self.has(key):
+                return False
+            return self._store(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+        return True
+
+
+class ObjectLRU:
+    """Thread safe per process cache of live objects, evicting the least recently used ones
+
+    Unlike LRUCache the objects aren't pickled, a hit returns the cached object itself, so they must not be changed.
+    It holds at most maxItems objects with at most maxBytes bytes in total, the size of an object is its nbytes.
+    Objects larger than maxBytes aren't cached.
+    """
+
+    def __init__(self, maxItems=32, maxBytes=64 * 1024 * 1024):
+        self.maxItems = maxItems
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self._objects = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, prefix):
+        """Configure the bounds from the <prefix>_ITEMS & <prefix>_BYTES settings"""
+        self.maxItems = app.config.setdefault(f"{prefix}_ITEMS", self.maxItems)
+        self.maxBytes = app.config.setdefault(f"{prefix}_BYTES", self.maxBytes)
+        self.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, key):
+        with self._lock:
+            item = self._objects.get(key)
+            if item is None:
+                return None
+            self._objects.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        size = value.nbytes
+        with self._lock:
+            self._pop(key)
+            if size > self.maxBytes:
+                return False
+            while self._objects and (
+                len(self._objects) >= self.maxItems
+                or self.nbytes + size > self.maxBytes
+            ):
+                evicted, (evictedSize, _) = self._objects.popitem(last=False)
+                self.nbytes -= evictedSize
+                logger.debug("evicted key %r", evicted)
+            self._objects[key] = (size, value)
+            self.nbytes += size
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self.nbytes = 0
+        return True
+
+    def _pop(self, key):
+        item = self._objects.pop(key, None)
+        if item is None:
+            return False
+        self.nbytes -= item[0]
+        return True
@@ -1,13 +1,18 @@
 """Click commands."""
 import os
+import signal
+import sys
+import time
 from glob import glob
 from subprocess import call
 
 import click
+from flask.cli import with_appcontext
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.join(HERE, os.pardir)
 TEST_PATH = os.path.join(PROJECT_ROOT, "tests")
+BENCHMARK_PATH = os.path.join(PROJECT_ROOT, "benchmarks")
 
 
 @click.command()
@@ -19,6 +24,28 @@ def test():
     exit(rv)
 
 
+@click.command()
+@click.option(
+    "-c",
+    "--compare",
+    default=False,
+    is_flag=True,
+    help="Fail if the minimal time of a benchmark regressed by more than 10% since the last saved run.",
+)
+def benchmark(compare):
+    """Run the benchmarks & save their results."""
+    import pytest
+
+    args = [
+        BENCHMARK_PATH,
+        f"--benchmark-storage={os.path.join(PROJECT_ROOT, '.benchmarks')}",
+    ]
+    if compare:
+        args += ["--benchmark-compare", "--benchmark-compare-fail=min:10%"]
+    rv = pytest.main(args)
+    exit(rv)
+
+
 @click.command()
 @click.option(
     "-f",
@@ -62,3 +89,81 @@ def lint(fix_imports, check):
         execute_tool("Fixing import order", "isort", *isort_args)
     execute_tool("Formatting style", "black", *black_args)
     execute_tool("Checking code style", "flake8")
+
+
+@click.command("encode-samples")
+@click.option(
+    "-b",
+    "--batch-size",
+    default=100,
+    show_default=True,
+    help="Number of workouts converted & committed at once",
+)
+@click.option(
+    "--json",
+    "to_json",
+    default=False,
+    is_flag=True,
+    help="Convert the sample columns back to the JSON encoding",
+)
+@with_appcontext
+def encode_samples(batch_size, to_json):
+    """Convert the sample columns of all stored workouts to the binary encoding."""
+    from tumsm_server.extensions import db
+    from tumsm_server.workout.sampleEncoding import reencode_sample_batch
+
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            last_id = reencode_sample_batch(
+                connection, last_id, batch_size, binary=not to_json
+            )
+        if last_id is None:
+            break
+        click.echo(f"Converted workouts up to id {last_id}")
+    click.echo("All workouts converted")
+
+
+@click.command("run-jobs")
+@click.option(
+    "-i",
+    "--interval",
+    default=1.0,
+    show_default=True,
+    help="Seconds to wait before looking for new jobs when the queue is empty",
+)
+@click.option(
+    "--once",
+    default=False,
+    is_flag=True,
+    help="Exit as soon as the queue is empty",
+)
+@click.option(
+    "--requeue",
+    default=False,
+    is_flag=True,
+    help="Queue the jobs left running by a killed worker again, only when no other worker runs",
+)
+@with_appcontext
+def run_jobs(interval, once, requeue):
+    """Run the background jobs submitted through the api, e.g. exports."""
+    from tumsm_server.extensions import db
+    from tumsm_server.job.lib import requeue_running_jobs, run_next_job
+
+    if requeue:
+        click.echo(f"Requeued {requeue_running_jobs()} jobs")
+    # A stopped worker exits through SystemExit, so the running job is queued again instead of left running
+    previous_handler = signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        while True:
+            job = run_next_job()
+            if job is not None:
+                click.echo(f"{job} done")
+                # Don't keep the objects loaded by one job around for the next one
+                db.session.remove()
+            elif once:
+                break
+            else:
+                time.sleep(interval)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
@@ -1,4 +1,6 @@
 """Database module, including the SQLAlchemy database object and DB-related utilities."""
+from sqlalchemy import inspect
+
 from .extensions import db
 
 # Alias common SQLAlchemy names
@@ -23,16 +25,42 @@ class CRUDMixin(object):
 
     def save(self, commit=True):
         """Save the record."""
-        db.session.add(self)
+        self.add_revised()
         if commit:
             db.session.commit()
         return self
 
     def delete(self, commit=True):
         """Remove the record from the database."""
+        increment_revisions(self.revised_records())
         db.session.delete(self)
         return commit and db.session.commit()
 
+    def revised_records(self):
+        """Records with a revision column which contain this record, e.g. the patient of a workout."""
+        return []
+
+    def add_revised(self):
+        """Add the record to the session and increment the revisions of itself (if it existed) & its revised records.
+
+        The record is flushed, so the relationships of new records can be loaded.
+        """
+        existed = inspect(self).persistent
+        db.session.add(self)
+        db.session.flush()
+        increment_revisions(([self] if existed else []) + list(self.revised_records()))
+
+
+def increment_revisions(records):
+    """Increment the revision counters of records which already exist, they are used for conditional requests."""
+    for record in records:
+        if (
+            record is not None
+            and hasattr(type(record), "revision")
+            and inspect(record).persistent
+        ):
+            record.revision = type(record).revision + 1
+
 
 class Model(CRUDMixin, db.Model):
     """Base model class that includes CRUD convenience methods."""
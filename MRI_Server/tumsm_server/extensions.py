@@ -9,6 +9,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_static_digest import FlaskStaticDigest
 from flask_wtf.csrf import CSRFProtect
 
+from tumsm_server.caching import ObjectLRU
+from tumsm_server.instrumentation import RequestMetrics
+
 bcrypt = Bcrypt()
 csrf_protect = CSRFProtect()
 login_manager = LoginManager()
@@ -18,3 +21,6 @@ cache = Cache()
 debug_toolbar = DebugToolbarExtension()
 flask_static_digest = FlaskStaticDigest()
 jwt = JWTManager()
+request_metrics = RequestMetrics()
+# Built segment indexes of workouts, too large to be pickled into the cache on every hit
+segment_indexes = ObjectLRU()
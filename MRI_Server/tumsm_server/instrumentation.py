@@ -0,0 +1,168 @@
+"""Request instrumentation, recording the wall time, database time, statement count & response size per endpoint."""
+import threading
+import time
+
+from flask import Response, current_app, g, has_request_context, request
+from flask.signals import request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from tumsm_server.utils import function_statistics
+
+# Upper bounds of the buckets of the request duration histogram, in seconds
+durationBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointMetrics:
+    """Aggregated metrics of all requests to one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.durationBuckets = [0] * len(durationBuckets)
+        self.dbSeconds = 0.0
+        self.statements = 0
+        self.responseBytes = 0
+
+    def add(self, seconds, dbSeconds, statements, responseBytes):
+        self.requests += 1
+        self.seconds += seconds
+        for index, bound in enumerate(durationBuckets):
+            if seconds <= bound:
+                self.durationBuckets[index] += 1
+        self.dbSeconds += dbSeconds
+        self.statements += statements
+        self.responseBytes += responseBytes
+
+
+class RequestMetrics:
+    """Flask extension recording metrics of every request, using Flask request signals & SQLAlchemy engine events
+
+    The metrics are served in the Prometheus text format at /metrics, if METRICS_TOKEN is configured (it has to be
+    sent as bearer token). With SERVER_TIMING enabled, the metrics of a request are also sent in its Server-Timing
+    header.
+    """
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.config.setdefault("SERVER_TIMING", False)
+        request_started.connect(self.request_started, app)
+        request_finished.connect(self.request_finished, app)
+        if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        app.add_url_rule("/metrics", "metrics", self.metrics_endpoint)
+
+    def request_started(self, sender, **extra):
+        g.metricsStarted = time.perf_counter()
+        g.metricsDbSeconds = 0.0
+        g.metricsStatements = 0
+
+    def request_finished(self, sender, response, **extra):
+        if "metricsStarted" not in g:
+            return
+        seconds = time.perf_counter() - g.metricsStarted
+        endpoint = request.endpoint or "unknown"
+        with self.lock:
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = EndpointMetrics()
+            self.endpoints[endpoint].add(
+                seconds,
+                g.metricsDbSeconds,
+                g.metricsStatements,
+                response.content_length or 0,
+            )
+        if current_app.config["SERVER_TIMING"]:
+            response.headers["Server-Timing"] = (
+                f"app;dur={seconds * 1000:.1f}, "
+                f'db;dur={g.metricsDbSeconds * 1000:.1f};desc="{g.metricsStatements} statements"'
+            )
+
+    def metrics_endpoint(self):
+        """Endpoint for scraping the metrics in the Prometheus text format"""
+        token = current_app.config["METRICS_TOKEN"]
+        if token is None:
+            return Response("404 Not Found", status=404)
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return Response("401 Unauthorized", status=401)
+        return Response(self.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+    def prometheus_text(self):
+        """Format the metrics of all endpoints & traced functions in the Prometheus text format"""
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                "# HELP tumsm_request_duration_seconds Wall time of the requests",
+                "# TYPE tumsm_request_duration_seconds histogram",
+            ]
+            for endpoint, metrics in endpoints:
+                for bound, count in zip(durationBuckets, metrics.durationBuckets):
+                    lines.append(
+                        f'tumsm_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                    )
+                lines += [
+                    f'tumsm_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {metrics.requests}',
+                    f'tumsm_request_duration_seconds_sum{{endpoint="{endpoint}"}} {metrics.seconds}',
+                    f'tumsm_request_duration_seconds_count{{endpoint="{endpoint}"}} {metrics.requests}',
+                ]
+            for name, attribute, help in (
+                (
+                    "tumsm_request_db_duration_seconds_total",
+                    "dbSeconds",
+                    "Time spent executing SQL statements",
+                ),
+                (
+                    "tumsm_request_statements_total",
+                    "statements",
+                    "Number of executed SQL statements",
+                ),
+                (
+                    "tumsm_response_size_bytes_total",
+                    "responseBytes",
+                    "Size of the response bodies",
+                ),
+            ):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+                for endpoint, metrics in endpoints:
+                    lines.append(
+                        f'{name}{{endpoint="{endpoint}"}} {getattr(metrics, attribute)}'
+                    )
+
+        functions = function_statistics()
+        lines += [
+            "# HELP tumsm_function_calls_total Calls of the traced functions",
+            "# TYPE tumsm_function_calls_total counter",
+        ]
+        lines += [
+            f'tumsm_function_calls_total{{function="{f.name}"}} {f.calls}'
+            for f in functions
+        ]
+        lines += [
+            "# HELP tumsm_function_duration_seconds_total Time spent in the traced functions",
+            "# TYPE tumsm_function_duration_seconds_total counter",
+        ]
+        lines += [
+            f'tumsm_function_duration_seconds_total{{function="{f.name}"}} {f.totalSeconds}'
+            for f in functions
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start is kept on the statement's execution context, which is discarded with it when the statement fails
+    if has_request_context() and context is not None:
+        context._metricsStarted = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metricsStarted", None)
+    if has_request_context() and started is not None:
+        if "metricsStarted" in g:
+            g.metricsDbSeconds += time.perf_counter() - started
+            g.metricsStatements += 1
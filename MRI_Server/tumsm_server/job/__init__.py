@@ -0,0 +1 @@
+"""The job module, running heavy exports & imports outside of the web workers."""
@@ -0,0 +1,202 @@
+import datetime as dt
+import json
+import os
+from pathlib import Path
+
+from flask import current_app
+
+from tumsm_server.extensions import db
+from tumsm_server.job.models import (
+    Job,
+    failedJobStatus,
+    finishedJobStatus,
+    queuedJobStatus,
+    runningJobStatus,
+)
+from tumsm_server.patient.lib import write_patients_zip
+from tumsm_server.patient.models import Patient
+from tumsm_server.planning.lib import import_planned_workouts
+from tumsm_server.studygroup.models import StudyGroupPatients
+from tumsm_server.utils import log_enter_and_exit, parse_date
+from tumsm_server.workout.lib import recompute_query, recompute_workouts
+
+patientExportJobType = "patientExport"
+planningImportJobType = "planningImport"
+workoutRecomputeJobType = "workoutRecompute"
+
+
+class JobError(Exception):
+    """Raised by a job when it can't be completed, the message is shown to the user"""
+
+
+def run_patient_export(job, file):
+    """Writes the xlsx exports of the patients as zip archive"""
+    arguments = job.arguments_data
+    fromDate = arguments.get("fromDate")
+    toDate = arguments.get("toDate")
+    patients = Patient.query.filter(Patient.id.in_(arguments["patientIds"])).all()
+    write_patients_zip(
+        patients,
+        parse_date(fromDate) if fromDate is not None else None,
+        parse_date(toDate) if toDate is not None else None,
+        file,
+    )
+    return "application/zip", "export.zip"
+
+
+def run_planning_import(job, file):
+    """Imports the planned workouts of a xlsx file & writes their ids"""
+    arguments = job.arguments_data
+    patient = Patient.query.filter_by(id=arguments["patientId"]).first()
+    if patient is None:
+        raise JobError("Patient does not exist")
+    success, plannedWorkoutIds = import_planned_workouts(
+        patient, arguments["xlsxBase64"]
+    )
+    if not success:
+        raise JobError("There was an error parsing the xlsx file")
+    file.write(str.encode(json.dumps({"plannedWorkouts": plannedWorkoutIds})))
+    return "application/json", "import.json"
+
+
+def run_workout_recompute(job, file):
+    """Re-derives the metrics of the workouts of patients or a study group & writes the counts
+
+    The progress is committed with every batch of workouts, an interrupted job resumes after the last committed one.
+    """
+    arguments = job.arguments_data
+    if arguments.get("studyGroupId") is not None:
+        patientIds = [
+            member.patientId
+            for member in StudyGroupPatients.query.filter_by(
+                studyGroupId=arguments["studyGroupId"]
+            )
+        ]
+    else:
+        patientIds = arguments["patientIds"]
+    fromDate = arguments.get("fromDate")
+    toDate = arguments.get("toDate")
+    query = recompute_query(
+        patientIds,
+        parse_date(fromDate) if fromDate is not None else None,
+        parse_date(toDate) if toDate is not None else None,
+    )
+    progress = job.progress_data
+    if not progress:
+        progress = {"cursor": 0, "total": query.count(), "recomputed": 0, "failed": 0}
+        job.update(progress=str.encode(json.dumps(progress)))
+
+    def store_progress(cursor, recomputed, failed):
+        progress["cursor"] = cursor
+        progress["recomputed"] += recomputed
+        progress["failed"] += failed
+        job.update(commit=False, progress=str.encode(json.dumps(progress)))
+
+    recompute_workouts(
+        query,
+        cursor=progress["cursor"],
+        batch_size=current_app.config["RECOMPUTE_BATCH_SIZE"],
+        processes=current_app.config["RECOMPUTE_PROCESSES"],
+        on_batch=store_progress,
+    )
+    file.write(
+        str.encode(
+            json.dumps(
+                {"recomputed": progress["recomputed"], "failed": progress["failed"]}
+            )
+        )
+    )
+    return "application/json", "recompute.json"
+
+
+# Runs a job with its arguments, writes the result into a file & returns its mimetype & file name
+jobRunners = {
+    patientExportJobType: run_patient_export,
+    planningImportJobType: run_planning_import,
+    workoutRecomputeJobType: run_workout_recompute,
+}
+
+
+@log_enter_and_exit
+def submit_job(account, type, arguments):
+    """Queue a job, it is run by the job worker"""
+    return Job.create(
+        accountId=account.id, type=type, arguments=str.encode(json.dumps(arguments))
+    )
+
+
+def job_result_path(job):
+    return os.path.abspath(
+        os.path.join(current_app.config["JOB_RESULT_PATH"], f"{job.id}.result")
+    )
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running & return it, this is safe with multiple workers"""
+    while True:
+        job = Job.query.filter_by(status=queuedJobStatus).order_by(Job.id).first()
+        if job is None:
+            return None
+        claimed = Job.query.filter_by(id=job.id, status=queuedJobStatus).update(
+            {"status": runningJobStatus, "startedAt": dt.datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if claimed == 1:
+            return job
+
+
+def requeue_running_jobs():
+    """Queue the jobs left running by a killed worker again, returns their amount"""
+    requeued = Job.query.filter_by(status=runningJobStatus).update(
+        {"status": queuedJobStatus, "startedAt": None}, synchronize_session=False
+    )
+    db.session.commit()
+    return requeued
+
+
+@log_enter_and_exit
+def run_job(job):
+    """Run a claimed job & store its result, an interrupted job is queued again"""
+    Path(current_app.config["JOB_RESULT_PATH"]).mkdir(parents=True, exist_ok=True)
+    resultPath = job_result_path(job)
+    try:
+        with open(resultPath, "wb") as file:
+            resultMimetype, resultName = jobRunners[job.type](job, file)
+    except (KeyboardInterrupt, SystemExit):
+        db.session.rollback()
+        job.update(status=queuedJobStatus, startedAt=None)
+        raise
+    # Catches all exceptions, a failing job must not stop the worker
+    except Exception as e:
+        db.session.rollback()
+        if not isinstance(e, JobError):
+            current_app.logger.exception(f"{job} failed")
+        os.remove(resultPath)
+        return job.update(
+            status=failedJobStatus,
+            error=str(e)[:280],
+            finishedAt=dt.datetime.utcnow(),
+        )
+    return job.update(
+        status=finishedJobStatus,
+        resultName=resultName,
+        resultMimetype=resultMimetype,
+        finishedAt=dt.datetime.utcnow(),
+    )
+
+
+def run_next_job():
+    """Run the oldest queued job, returns None if there is no queued job"""
+    job = claim_next_job()
+    if job is None:
+        return None
+    return run_job(job)
+
+
+@log_enter_and_exit
+def delete_job(job):
+    """Delete a job & its result"""
+    if os.path.exists(job_result_path(job)):
+        os.remove(job_result_path(job))
+    job.delete()
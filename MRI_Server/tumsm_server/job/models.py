@@ -0,0 +1,64 @@
+"""Job models."""
+import datetime as dt
+import json
+
+from tumsm_server.database import Column, PkModel, db, reference_col, relationship
+
+queuedJobStatus = "queued"
+runningJobStatus = "running"
+finishedJobStatus = "finished"
+failedJobStatus = "failed"
+
+
+class Job(PkModel):
+    """A background job, submitted through the api & run by the job worker (flask run-jobs)"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (db.Index("ix_jobs_status", "status"),)
+    accountId = reference_col("accounts", nullable=False)
+    type = Column(db.String(32), nullable=False)
+    status = Column(db.String(16), nullable=False, default=queuedJobStatus)
+    arguments = Column(db.LargeBinary, nullable=False)
+    # Progress of a resumable job, committed along with the work it describes
+    progress = Column(db.LargeBinary, nullable=True)
+    error = Column(db.String(280), nullable=True)
+    resultName = Column(db.String(64), nullable=True)
+    resultMimetype = Column(db.String(64), nullable=True)
+    createdAt = Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
+    startedAt = Column(db.DateTime, nullable=True)
+    finishedAt = Column(db.DateTime, nullable=True)
+
+    account = relationship("Account")
+
+    def __init__(self, **kwargs):
+        """Create instance."""
+        super().__init__(**kwargs)
+
+    def __str__(self):
+        """Represent instance as a unique string."""
+        return f"<Job({self.id} - {self.type} - {self.status})>"
+
+    @property
+    def arguments_data(self):
+        return json.loads(self.arguments.decode())
+
+    @property
+    def progress_data(self):
+        if self.progress is not None:
+            data = json.loads(self.progress.decode())
+            if data is not None:
+                return data
+        return {}
+
+    @property
+    def asJson(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "error": self.error,
+            "progress": self.progress_data,
+            "createdAt": self.createdAt,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+        }
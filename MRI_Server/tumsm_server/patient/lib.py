@@ -1,10 +1,18 @@
 import base64
 import datetime
 import math
+import os
+import tempfile
+import zipfile
+from itertools import zip_longest
 
 import xlsxwriter
+from sqlalchemy import case, func
+from sqlalchemy.orm import selectinload
 
-from tumsm_server.patient.models import PatientTrainingZones
+from tumsm_server.extensions import db
+from tumsm_server.patient.models import Patient, PatientTrainingZones
+from tumsm_server.planning.models import PlannedWorkout
 from tumsm_server.utils import (
     format_date,
     workout_type_description,
@@ -12,14 +20,10 @@ from tumsm_server.utils import (
     force_to_int,
     force_to_date,
 )
-from tumsm_server.workout.models import Workout
-from threading import Lock
-from pathlib import Path
+from tumsm_server.workout.models import WorkoutSummary
+from tumsm_server.workout.sampleEncoding import SAMPLE_COLUMNS
 import tumsm_server.workout.models as WorkoutModels
 
-export_lock = Lock()
-exportCachePath = "./export/"
-
 
 @log_enter_and_exit
 def create_patient_training_zones(
@@ -47,6 +51,11 @@ def create_patient_training_zones(
     return training_zones
 
 
+def patient_revisions():
+    """Return the ids & revisions of all patients, which change whenever a patient or its records change"""
+    return db.session.query(Patient.id, Patient.revision).order_by(Patient.id).all()
+
+
 @log_enter_and_exit
 def week_progress(patient):
     """Return how many workouts were planned & completed in this calendar week"""
@@ -64,92 +73,58 @@ def week_progress(patient):
 @log_enter_and_exit
 def last_training(patient):
     """Return the start time of the latest training uploaded by a patient"""
-    found_workouts = (
-        Workout.query.filter_by(patientId=patient.id)
-        .order_by(Workout.startTime.desc())
-        .first()
-    )
-    if found_workouts is None:
-        return None
-    return found_workouts.startTime
+    return workout_overviews(None, None, [patient.id])[patient.id]["lastTraining"]
 
 
 @log_enter_and_exit
 def rating_overview(patient, fromDate, toDate):
     """Return how many workouts were rated not at all, bad, medium or good by a patient in a given time frame"""
-    unrated_count = 0
-    bad_count = 0
-    medium_count = 0
-    good_count = 0
-    for workout in patient.workouts:
-        if (fromDate is not None and fromDate > workout.startTime) or (
-            toDate is not None and workout.startTime > toDate
-        ):
-            continue
-        rating = workout.rating()
-        if rating == 1:
-            bad_count += 1
-        elif rating == 2:
-            medium_count += 1
-        elif rating == 3:
-            good_count += 1
-        else:
-            unrated_count += 1
-    return {
-        "unrated": unrated_count,
-        "bad": bad_count,
-        "medium": medium_count,
-        "good": good_count,
-    }
+    return workout_overviews(fromDate, toDate, [patient.id])[patient.id]["ratings"]
 
 
 @log_enter_and_exit
 def training_progress(patient, fromDate, toDate, type=None):
     """Return how many workouts were planned & completed in a given time frame"""
-    total = 0
-    complete = 0
-    for plannedWorkout in patient.plannedWorkouts:
-        if (
-            (fromDate is None or force_to_date(fromDate) <= plannedWorkout.plannedDate)
-            and (toDate is None or force_to_date(toDate) >= plannedWorkout.plannedDate)
-            and (plannedWorkout.plannedDate <= datetime.date.today())
-            and (type is None or plannedWorkout.type == type)
-        ):
-            total += 1
-            if plannedWorkout.complete:
-                complete += 1
-    return {"completed": complete, "total": total}
+    return training_progresses([patient.id], fromDate, toDate, type)[patient.id]
+
+
+@log_enter_and_exit
+def training_progresses(patientIds, fromDate, toDate, type=None):
+    """Return how many workouts were planned & completed in a given time frame, for each of the given patients"""
+    progresses = {patientId: {"completed": 0, "total": 0} for patientId in patientIds}
+    plannedWorkouts = PlannedWorkout.query.filter(
+        PlannedWorkout.patientId.in_(progresses.keys())
+    ).filter(PlannedWorkout.plannedDate <= datetime.date.today())
+    if fromDate is not None:
+        plannedWorkouts = plannedWorkouts.filter(
+            PlannedWorkout.plannedDate >= force_to_date(fromDate)
+        )
+    if toDate is not None:
+        plannedWorkouts = plannedWorkouts.filter(
+            PlannedWorkout.plannedDate <= force_to_date(toDate)
+        )
+    if type is not None:
+        plannedWorkouts = plannedWorkouts.filter_by(type=type)
+
+    completed = PlannedWorkout.completed_ids(plannedWorkouts)
+    for plannedWorkoutId, patientId in plannedWorkouts.with_entities(
+        PlannedWorkout.id, PlannedWorkout.patientId
+    ):
+        progresses[patientId]["total"] += 1
+        if plannedWorkoutId in completed:
+            progresses[patientId]["completed"] += 1
+    return progresses
 
 
 @log_enter_and_exit
 def get_heartrate_profile(patient, fromDate, toDate, workoutType):
     """Return how many samples were in the heart rate zones of a patient in a given time frame"""
-    zone0 = 0
-    zone1 = 0
-    zone2 = 0
-    zone3 = 0
-    zone4 = 0
-    for workout in patient.workouts:
-        if (
-            (fromDate is not None and fromDate > workout.startTime)
-            or (toDate is not None and workout.startTime > toDate)
-            or workout.type != workoutType
-        ):
-            continue
-        training_zones = workout.trainingZones_data
-        if training_zones != {} and training_zones["heartRate"] is not None:
-            zone0 += training_zones["heartRate"]["zone0"]
-            zone1 += training_zones["heartRate"]["zone1"]
-            zone2 += training_zones["heartRate"]["zone2"]
-            zone3 += training_zones["heartRate"]["zone3"]
-            zone4 += training_zones["heartRate"]["zone4"]
-    return {
-        "zone0": zone0,
-        "zone1": zone1,
-        "zone2": zone2,
-        "zone3": zone3,
-        "zone4": zone4,
-    }
+    overview = workout_overviews(fromDate, toDate, [patient.id])[patient.id]
+    return overview["heartRateProfiles"].get(workoutType, empty_heartrate_profile())
+
+
+def empty_heartrate_profile():
+    return {"zone0": 0, "zone1": 0, "zone2": 0, "zone3": 0, "zone4": 0}
 
 
 def get_study_group_array(study_groups):
@@ -160,14 +135,76 @@ def get_study_group_array(study_groups):
 @log_enter_and_exit
 def get_total_workout_hours(patient, fromDate, toDate):
     """Returns the sum (as float) of all workout durations in hours"""
-    durationSum = 0  # in seconds
-    for workout in patient.workouts:
-        if (fromDate is not None and fromDate > workout.startTime) or (
-            toDate is not None and workout.startTime > toDate
-        ):
-            continue
-        durationSum += workout.duration
-    return float(durationSum / 60 / 60)
+    return workout_overviews(fromDate, toDate, [patient.id])[patient.id]["totalHours"]
+
+
+@log_enter_and_exit
+def workout_overviews(fromDate, toDate, patientIds):
+    """Return ratings, total hours, heart rate profiles (per workout type) & the last training of patients
+
+    Aggregated with two grouped queries from the precomputed workout summaries, instead of decoding every workout
+    """
+    overviews = {
+        patientId: {
+            "ratings": {"unrated": 0, "bad": 0, "medium": 0, "good": 0},
+            "totalHours": 0.0,
+            "heartRateProfiles": {},
+            "lastTraining": None,
+        }
+        for patientId in patientIds
+    }
+    if len(overviews) == 0:
+        return overviews
+
+    aggregates = db.session.query(
+        WorkoutSummary.patientId,
+        WorkoutSummary.type,
+        func.count(WorkoutSummary.id),
+        func.sum(case((WorkoutSummary.rating == 1, 1), else_=0)),
+        func.sum(case((WorkoutSummary.rating == 2, 1), else_=0)),
+        func.sum(case((WorkoutSummary.rating == 3, 1), else_=0)),
+        func.sum(WorkoutSummary.duration),
+        func.sum(WorkoutSummary.heartRateZone0),
+        func.sum(WorkoutSummary.heartRateZone1),
+        func.sum(WorkoutSummary.heartRateZone2),
+        func.sum(WorkoutSummary.heartRateZone3),
+        func.sum(WorkoutSummary.heartRateZone4),
+    ).filter(WorkoutSummary.patientId.in_(overviews.keys()))
+    if fromDate is not None:
+        aggregates = aggregates.filter(WorkoutSummary.startTime >= fromDate)
+    if toDate is not None:
+        aggregates = aggregates.filter(WorkoutSummary.startTime <= toDate)
+    aggregates = aggregates.group_by(WorkoutSummary.patientId, WorkoutSummary.type)
+
+    for (
+        patientId,
+        workoutType,
+        count,
+        bad,
+        medium,
+        good,
+        duration,
+        *zones,
+    ) in aggregates:
+        overview = overviews[patientId]
+        ratings = overview["ratings"]
+        ratings["unrated"] += count - bad - medium - good
+        ratings["bad"] += bad
+        ratings["medium"] += medium
+        ratings["good"] += good
+        overview["totalHours"] += float(duration / 60 / 60)
+        overview["heartRateProfiles"][workoutType] = {
+            f"zone{index}": zone for index, zone in enumerate(zones)
+        }
+
+    last_trainings = (
+        db.session.query(WorkoutSummary.patientId, func.max(WorkoutSummary.startTime))
+        .filter(WorkoutSummary.patientId.in_(overviews.keys()))
+        .group_by(WorkoutSummary.patientId)
+    )
+    for patientId, startTime in last_trainings:
+        overviews[patientId]["lastTraining"] = startTime
+    return overviews
 
 
 def format_for_export(data):
@@ -182,30 +219,66 @@ def format_for_export(data):
 
 @log_enter_and_exit
 def get_patient_xlsx(patient, fromDate, toDate):
-    workouts = WorkoutModels.Workout.query.filter_by(patientId=patient.id)
-    Path(exportCachePath).mkdir(exist_ok=True)
-    fileName = exportCachePath + str(patient.id) + ".xlsx"
+    """Return the xlsx export of a patient as base64 string"""
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, f"{patient.id}.xlsx")
+        write_patient_xlsx(patient, fromDate, toDate, fileName)
+        with open(fileName, "rb") as file:
+            return base64.b64encode(file.read()).decode("UTF-8")
+
+
+@log_enter_and_exit
+def write_patients_zip(patients, fromDate, toDate, file):
+    """Write the xlsx exports of the patients into a zip archive, one after another"""
+    with tempfile.TemporaryDirectory() as directory, zipfile.ZipFile(
+        file, "w"
+    ) as archive:
+        for patient in patients:
+            fileName = os.path.join(directory, f"{patient.id}.xlsx")
+            write_patient_xlsx(patient, fromDate, toDate, fileName)
+            archive.write(fileName, f"{patient.id}.xlsx")
+            os.remove(fileName)
+
+
+@log_enter_and_exit
+def write_patient_xlsx(patient, fromDate, toDate, fileName):
+    """Write the workouts of a patient into a xlsx file
+
+    Rows are written strictly in order (constant memory mode of xlsxwriter) and the samples of only one workout are
+    loaded at a time (they are deferred), so the memory used doesn't depend on the amount of exported workouts.
+    """
+    workouts = WorkoutModels.Workout.query.filter_by(patientId=patient.id).options(
+        selectinload(WorkoutModels.Workout.latestRating)
+    )
     if fromDate is not None:
         workouts = workouts.filter(WorkoutModels.Workout.startTime >= fromDate)
     if toDate is not None:
         workouts = workouts.filter(WorkoutModels.Workout.startTime < toDate)
     workouts = workouts.all()
-    with export_lock:
-        workbook = xlsxwriter.Workbook(fileName)
-        overview_worksheet = add_patient_overview_table(workbook, patient, workouts)
-        for x in range(len(workouts)):
-            workout = workouts[x]
-            workout_worksheet = add_workout_table(workbook, workout)
-            url_cell_string = format_for_export(workout.startTime)
-            overview_worksheet.write_url(
-                x + 1,
-                0,
-                "internal:'" + workout_worksheet.name + "'!A1",
-                string=url_cell_string,
-            )
-        workbook.close()
-        with open(fileName, "rb") as file:
-            return base64.b64encode(file.read()).decode("UTF-8")
+    sheetNames = workout_sheet_names(workouts)
+    workbook = xlsxwriter.Workbook(fileName, {"constant_memory": True})
+    add_patient_overview_table(workbook, patient, workouts, sheetNames)
+    for workout, sheetName in zip(workouts, sheetNames):
+        add_workout_table(workbook, workout, sheetName)
+        # Drop the loaded samples again before the next workout
+        db.session.expire(workout, list(SAMPLE_COLUMNS))
+    workbook.close()
+
+
+def workout_sheet_names(workouts):
+    """Names of the sub tables of the workouts, see add_workout_table"""
+    # Table Names must be unique, this appends an index to workouts if more then one workout was uploaded for one day
+    sheetNames = []
+    usedSheetNames = set()
+    for workout in workouts:
+        sheetName = format_date(workout.startTime)
+        next_date_index = 2
+        while sheetName in usedSheetNames:
+            sheetName = format_date(workout.startTime) + " " + str(next_date_index)
+            next_date_index += 1
+        usedSheetNames.add(sheetName)
+        sheetNames.append(sheetName)
+    return sheetNames
 
 
 def add_line_to_worksheet(worksheet, lineDataDict, headers, lastWrittenRow):
@@ -220,7 +293,7 @@ def add_line_to_worksheet(worksheet, lineDataDict, headers, lastWrittenRow):
 
 
 @log_enter_and_exit
-def add_patient_overview_table(workbook, patient, workouts):
+def add_patient_overview_table(workbook, patient, workouts, sheetNames):
     """Add a sub table to the file, containing an overview over all workouts of a patient"""
 
     worksheet = workbook.add_worksheet("Übersicht")
@@ -243,7 +316,7 @@ def add_patient_overview_table(workbook, patient, workouts):
         worksheet.write(0, x, headers[x]["label"])
         worksheet.set_column(x, x, headers[x]["width"])
     lastWrittenRow = 0
-    for workout in workouts:
+    for workout, sheetName in zip(workouts, sheetNames):
         training_zones = workout.trainingZones_data
         if training_zones != {}:
             zone0 = training_zones["heartRate"]["zone0"]
@@ -281,23 +354,19 @@ def add_patient_overview_table(workbook, patient, workouts):
         lastWrittenRow = add_line_to_worksheet(
             worksheet, lineDataDict, headers, lastWrittenRow
         )
+        worksheet.write_url(
+            lastWrittenRow,
+            0,
+            "internal:'" + sheetName + "'!A1",
+            string=lineDataDict["Start"],
+        )
     return worksheet
 
 
 @log_enter_and_exit
-def add_workout_table(workbook, workout):
+def add_workout_table(workbook, workout, sheetName):
     """Add a sub table to the file, containing all raw samples for one workout"""
 
-    # Table Names must be unique, this appends an index to workouts if more then one workout was uploaded for one day
-    sheetName = format_date(workout.startTime)
-    next_date_index = 2
-    while workbook.get_worksheet_by_name(sheetName) is not None:
-        sheetNameWithIndex = sheetName + " " + str(next_date_index)
-        if workbook.get_worksheet_by_name(sheetNameWithIndex) is not None:
-            next_date_index += 1
-        else:
-            sheetName = sheetNameWithIndex
-
     worksheet = workbook.add_worksheet(sheetName)
     headers = [
         {"label": "Sekunden seit Start (HF)", "width": 21},
@@ -316,49 +385,30 @@ def add_workout_table(workbook, workout):
         worksheet.write(0, x, headers[x]["label"])
         worksheet.set_column(x, x, headers[x]["width"])
     lastWrittenRow = 0
-    heartRateSamples = workout.heartRateSamples_data
-    speedSamples = workout.speedSamples_data
-    altitudeSamples = workout.altitudeSamples_data
-    distanceSamples = workout.distanceSamples_data
-    while (
-        len(heartRateSamples) > 0
-        or len(speedSamples) > 0
-        or len(altitudeSamples) > 0
-        or len(distanceSamples) > 0
-    ):
-        heartRateSample = {"seconds_since_start": None, "heartRate": None}
-        speedRateSample = {"seconds_since_start": None, "speed": None}
-        altitudeRateSample = {"seconds_since_start": None, "altitude": None}
-        distanceRateSample = {"seconds_since_start": None, "distance": None}
-        if len(heartRateSamples) > 0:
-            heartRateSample = heartRateSamples[0]
-            heartRateSamples = heartRateSamples[1:]
-        if len(speedSamples) > 0:
-            speedRateSample = speedSamples[0]
-            speedSamples = speedSamples[1:]
-        if len(altitudeSamples) > 0:
-            altitudeRateSample = altitudeSamples[0]
-            altitudeSamples = altitudeSamples[1:]
-        if len(distanceSamples) > 0:
-            distanceRateSample = distanceSamples[0]
-            distanceSamples = distanceSamples[1:]
+    columns = [
+        zip(*[column.tolist() for column in sample_columns])
+        for sample_columns in (
+            workout.heartRateSamples_columns,
+            workout.speedSamples_columns,
+            workout.altitudeSamples_columns,
+            workout.distanceSamples_columns,
+        )
+    ]
+    for (
+        heartRateSample,
+        speedRateSample,
+        altitudeRateSample,
+        distanceRateSample,
+    ) in zip_longest(*columns, fillvalue=(None, None)):
         lineDataDict = {
-            "Sekunden seit Start (HF)": format_for_export(
-                heartRateSample["seconds_since_start"]
-            ),
-            "HerzFrequenz": format_for_export(heartRateSample["heartRate"]),
-            "Sekunden seit Start (Geschw)": format_for_export(
-                speedRateSample["seconds_since_start"]
-            ),
-            "Geschwindigkeit": format_for_export(speedRateSample["speed"]),
-            "Sekunden seit Start (Höhe)": format_for_export(
-                altitudeRateSample["seconds_since_start"]
-            ),
-            "Höhe": format_for_export(altitudeRateSample["altitude"]),
-            "Sekunden seit Start (Dist)": format_for_export(
-                distanceRateSample["seconds_since_start"]
-            ),
-            "Distanz": format_for_export(distanceRateSample["distance"]),
+            "Sekunden seit Start (HF)": format_for_export(heartRateSample[0]),
+            "HerzFrequenz": format_for_export(heartRateSample[1]),
+            "Sekunden seit Start (Geschw)": format_for_export(speedRateSample[0]),
+            "Geschwindigkeit": format_for_export(speedRateSample[1]),
+            "Sekunden seit Start (Höhe)": format_for_export(altitudeRateSample[0]),
+            "Höhe": format_for_export(altitudeRateSample[1]),
+            "Sekunden seit Start (Dist)": format_for_export(distanceRateSample[0]),
+            "Distanz": format_for_export(distanceRateSample[1]),
         }
         lastWrittenRow = add_line_to_worksheet(
             worksheet, lineDataDict, headers, lastWrittenRow
@@ -1,8 +1,10 @@
 """Patient models."""
+import bisect
 import datetime as dt
 import json
 
-from flask import jsonify
+from flask import g, has_request_context, jsonify
+from sqlalchemy import event
 
 from tumsm_server.database import Column, PkModel, db, reference_col, relationship
 from tumsm_server.planning.lib import cyclingWorkoutType, runningWorkoutType
@@ -21,6 +23,10 @@ class Patient(PkModel):
     weight = Column(db.Float, nullable=True)
     gender = Column(db.String(1), nullable=True)
     comment = Column(db.String(200), nullable=True)
+    # Incremented whenever the patient or one of its records changes
+    revision = Column(db.Integer, nullable=False, default=1, server_default="1")
+    # Sequence of the latest logged change of the patient's records, the sync cursor
+    changeSequence = Column(db.Integer, nullable=False, default=0, server_default="0")
 
     plannedWorkouts = relationship(
         "PlannedWorkout", cascade="all,delete", backref="patient"
@@ -80,22 +86,17 @@ class Patient(PkModel):
         return zone.asJson
 
     def training_zone_of_date(self, unit, date, workoutType):
-        date = force_to_date(date)
-        trainingZone = None
-        oldestTrainingZone = None
-        zones = PatientTrainingZones.query.filter_by(
-            patientId=self.id, unit=unit, workoutType=workoutType
-        ).all()
-        for zone in zones:
-            if trainingZone is None or (
-                zone.creationDate < date and trainingZone > zone.creationDate
-            ):
-                trainingZone = zone
-            if oldestTrainingZone is None or zone.creationDate < oldestTrainingZone:
-                oldestTrainingZone = zone
-        if trainingZone is None:
-            return oldestTrainingZone
-        return trainingZone
+        return self.training_zone_index.zone_of_date(unit, date, workoutType)
+
+    @property
+    def training_zone_index(self):
+        """Index of all training zones of the patient, built once per request"""
+        if not has_request_context():
+            return TrainingZoneIndex.of_patient(self.id)
+        indexes = g.setdefault("trainingZoneIndexes", {})
+        if self.id not in indexes:
+            indexes[self.id] = TrainingZoneIndex.of_patient(self.id)
+        return indexes[self.id]
 
     @property
     def training_zone_segments_json(self):
@@ -109,6 +110,15 @@ class PatientTrainingZones(PkModel):
     """The training zones for an patient"""
 
     __tablename__ = "patientTrainingZones"
+    __table_args__ = (
+        db.Index(
+            "ix_patientTrainingZones_patientId_unit_workoutType_active",
+            "patientId",
+            "unit",
+            "workoutType",
+            "active",
+        ),
+    )
     patientId = reference_col("patients", nullable=True)
     active = Column(db.Boolean, nullable=False)
     creationDate = Column(db.Date, nullable=False, default=dt.datetime.utcnow)
@@ -146,6 +156,10 @@ class PatientTrainingZones(PkModel):
             **kwargs,
         )
 
+    def revised_records(self):
+        """The patient changes with this record."""
+        return [self.patient]
+
     def __str__(self):
         """Represent instance as a string."""
         return f"<PatientTrainingZones({self.patient.account.full_name} {self.active} {self.creationDate})>"
@@ -161,3 +175,47 @@ class PatientTrainingZones(PkModel):
             "upper2Bound": self.upper2Bound,
             "upper3Bound": self.upper3Bound,
         }
+
+
+class TrainingZoneIndex:
+    """The training zones of a patient per unit & workout type, ordered by their creation dates"""
+
+    def __init__(self, zones):
+        self.creationDates = {}
+        self.zones = {}
+        for zone in sorted(zones, key=lambda zone: (zone.creationDate, zone.id)):
+            key = (zone.unit, zone.workoutType)
+            self.creationDates.setdefault(key, []).append(zone.creationDate)
+            self.zones.setdefault(key, []).append(zone)
+
+    @classmethod
+    def of_patient(cls, patientId):
+        """Index of the bounds of all (also inactive) training zones of a patient, loaded with one query"""
+        return cls(
+            db.session.query(
+                PatientTrainingZones.id,
+                PatientTrainingZones.creationDate,
+                PatientTrainingZones.unit,
+                PatientTrainingZones.workoutType,
+                PatientTrainingZones.upper0Bound,
+                PatientTrainingZones.upper1Bound,
+                PatientTrainingZones.upper2Bound,
+                PatientTrainingZones.upper3Bound,
+            ).filter(PatientTrainingZones.patientId == patientId)
+        )
+
+    def zone_of_date(self, unit, date, workoutType):
+        """The latest zone created before the date, the oldest one if all of them were created later"""
+        creationDates = self.creationDates.get((unit, workoutType))
+        if creationDates is None:
+            return None
+        index = bisect.bisect_left(creationDates, force_to_date(date))
+        return self.zones[(unit, workoutType)][max(index - 1, 0)]
+
+
+@event.listens_for(PatientTrainingZones, "after_insert")
+@event.listens_for(PatientTrainingZones, "after_update")
+@event.listens_for(PatientTrainingZones, "after_delete")
+def invalidate_training_zone_index(mapper, connection, zone):
+    if has_request_context():
+        g.get("trainingZoneIndexes", {}).pop(zone.patientId, None)
@@ -1,4 +1,4 @@
-import datetime
+from sqlalchemy import and_, func, or_
 
 from tumsm_server.database import Column, PkModel, db, reference_col, relationship
 from tumsm_server.utils import log_enter_and_exit
@@ -9,6 +9,14 @@ class PlannedWorkout(PkModel):
     """A planned workout in a training plan"""
 
     __tablename__ = "plannedWorkouts"
+    __table_args__ = (
+        db.Index(
+            "ix_plannedWorkouts_patientId_plannedDate_type",
+            "patientId",
+            "plannedDate",
+            "type",
+        ),
+    )
 
     patientId = reference_col("patients", nullable=False)
     plannedDate = Column(db.Date, nullable=False)
@@ -22,6 +30,10 @@ class PlannedWorkout(PkModel):
         """Create instance."""
         super().__init__(**kwargs)
 
+    def revised_records(self):
+        """The patient changes with this record."""
+        return [self.patient]
+
     def __str__(self):
         """Represent instance as a string."""
         return f"<PlannedWorkout>"
@@ -40,17 +52,32 @@ class PlannedWorkout(PkModel):
 
     @property
     def complete(self):
-        foundWorkouts = (
-            Workout.query.filter_by(patientId=self.patientId)
-            .filter_by(type=self.type)
-            .filter(Workout.startTime >= self.plannedDate)
-            .filter(Workout.startTime < (self.plannedDate + datetime.timedelta(days=1)))
-        )
-
-        if self.minDistance is not None:
-            foundWorkouts = foundWorkouts.filter(Workout.distance > self.minDistance)
+        planned_workout = PlannedWorkout.query.filter_by(id=self.id)
+        return len(PlannedWorkout.completed_ids(planned_workout)) > 0
 
-        if self.minDuration is not None:
-            foundWorkouts = foundWorkouts.filter(Workout.duration > self.minDuration)
+    @staticmethod
+    def completion_condition():
+        """Join condition between a planned workout and the workouts which complete it"""
+        return and_(
+            Workout.patientId == PlannedWorkout.patientId,
+            Workout.type == PlannedWorkout.type,
+            func.date(Workout.startTime) == PlannedWorkout.plannedDate,
+            or_(
+                PlannedWorkout.minDistance.is_(None),
+                Workout.distance > PlannedWorkout.minDistance,
+            ),
+            or_(
+                PlannedWorkout.minDuration.is_(None),
+                Workout.duration > PlannedWorkout.minDuration,
+            ),
+        )
 
-        return len(foundWorkouts.all()) > 0
+    @staticmethod
+    def completed_ids(planned_workouts):
+        """Return the ids of all completed planned workouts of a query of planned workouts, using one joined query"""
+        completed = (
+            planned_workouts.join(Workout, PlannedWorkout.completion_condition())
+            .with_entities(PlannedWorkout.id)
+            .distinct()
+        )
+        return {plannedWorkoutId for (plannedWorkoutId,) in completed}
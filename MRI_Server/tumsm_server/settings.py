@@ -18,5 +18,20 @@ SEND_FILE_MAX_AGE_DEFAULT = env.int("SEND_FILE_MAX_AGE_DEFAULT")
 BCRYPT_LOG_ROUNDS = env.int("BCRYPT_LOG_ROUNDS", default=13)
 DEBUG_TB_ENABLED = DEBUG
 DEBUG_TB_INTERCEPT_REDIRECTS = False
-CACHE_TYPE = "simple"  # Can be "memcached", "redis", etc.
+CACHE_TYPE = "tumsm_server.caching.LRUCache"  # Can be "memcached", "redis", etc.
+# Maximum number of cached items
+CACHE_THRESHOLD = env.int("CACHE_THRESHOLD", default=500)
+# Maximum number of pickled bytes of all cached items (128 MiB), larger items aren't cached
+CACHE_MAX_BYTES = env.int("CACHE_MAX_BYTES", default=134217728)
+# Built segment indexes kept per worker process, at most this many with this many bytes (64 MiB)
+SEGMENT_INDEX_CACHE_ITEMS = env.int("SEGMENT_INDEX_CACHE_ITEMS", default=32)
+SEGMENT_INDEX_CACHE_BYTES = env.int("SEGMENT_INDEX_CACHE_BYTES", default=67108864)
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+JOB_RESULT_PATH = env.str("JOB_RESULT_PATH", default="./jobs/")
+# Bearer token for /metrics, disabled if not set
+METRICS_TOKEN = env.str("METRICS_TOKEN", default=None)
+SERVER_TIMING = env.bool("SERVER_TIMING", default=False)
+# Processes deriving workout metrics in recompute jobs
+RECOMPUTE_PROCESSES = env.int("RECOMPUTE_PROCESSES", default=2)
+# Workouts committed at once by recompute jobs
+RECOMPUTE_BATCH_SIZE = env.int("RECOMPUTE_BATCH_SIZE", default=100)
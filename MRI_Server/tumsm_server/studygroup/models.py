@@ -26,6 +26,10 @@ class StudyGroup(PkModel):
         """Represent instance as a string."""
         return f"<StudyGroup({self.name})>"
 
+    def revised_records(self):
+        """The name of the study group is part of its patients."""
+        return [member.patient for member in self.members]
+
 
 class StudyGroupPatients(PkModel):
     """Mapping of patients to a studygroup"""
@@ -39,6 +43,10 @@ class StudyGroupPatients(PkModel):
         """Create instance."""
         super().__init__(**kwargs)
 
+    def revised_records(self):
+        """The patient changes with this record."""
+        return [self.patient]
+
 
 class StudyGroupTrainers(PkModel):
     """Mapping of trainers to a studygroup"""
@@ -0,0 +1 @@
+"""The sync module, logging changes of patient records for the incremental sync of the apps."""
@@ -0,0 +1,125 @@
+from .models import Change, syncedModels
+from ..extensions import db
+from ..patient.models import Patient
+from ..workout.models import Workout, WorkoutRating
+from ..utils import log_enter_and_exit
+
+
+def workout_json(workout):
+    """Workout without its samples, they are requested per workout"""
+    return {
+        "id": workout.id,
+        "appleUUID": workout.appleUUID,
+        "type": workout.type,
+        "startTime": workout.startTime,
+        "endTime": workout.endTime,
+        "duration": workout.duration,
+        "kcal": workout.kcal,
+        "distance": workout.distance,
+        "terrainUp": workout.terrainUp,
+        "terrainDown": workout.terrainDown,
+        "heartRateAvg": workout.heartRateAvg,
+        "heartRateMin": workout.heartRateMin,
+        "heartRateMax": workout.heartRateMax,
+        "speedAvg": workout.speedAvg,
+        "speedMin": workout.speedMin,
+        "speedMax": workout.speedMax,
+        "paceMin": workout.paceMin,
+        "paceMax": workout.paceMax,
+        "trainingZones": workout.trainingZones_data,
+    }
+
+
+def rating_json(rating):
+    return {
+        "id": rating.id,
+        "workoutId": rating.workoutId,
+        "rating": rating.rating,
+        "intensity": rating.intensity,
+        "comment": rating.comment,
+    }
+
+
+def training_zones_json(training_zones):
+    return {
+        **training_zones.asJson,
+        "active": training_zones.active,
+        "creationDate": training_zones.creationDate,
+    }
+
+
+syncedJson = {
+    "workouts": workout_json,
+    "ratings": rating_json,
+    "steps": lambda steps: steps.asJson,
+    "plannedWorkouts": lambda planned_workout: planned_workout.asJson,
+    "trainingZones": training_zones_json,
+}
+
+
+def synced_records_query(name, patientId):
+    """Query of all synced records of one type of a patient"""
+    model = syncedModels[name]
+    if model is WorkoutRating:
+        return WorkoutRating.query.join(Workout).filter(Workout.patientId == patientId)
+    return model.query.filter(model.patientId == patientId)
+
+
+def current_cursor(patientId):
+    """Cursor after the latest change of a patient"""
+    return (
+        db.session.query(Patient.changeSequence)
+        .filter(Patient.id == patientId)
+        .scalar()
+        or 0
+    )
+
+
+@log_enter_and_exit
+def sync(patientId, cursor=None):
+    """Return the records of a patient changed after the cursor & the ids of the deleted ones, and the next cursor
+
+    Without a cursor all records of the patient are returned. The work is proportional to the amount of changes, the
+    latest change of each record wins.
+    """
+    result = {name: {"updated": [], "deleted": []} for name in syncedModels}
+    if cursor is None:
+        nextCursor = current_cursor(patientId)
+        for name in syncedModels:
+            result[name]["updated"] = [
+                syncedJson[name](record)
+                for record in synced_records_query(name, patientId).order_by(
+                    syncedModels[name].id
+                )
+            ]
+        return nextCursor, result
+
+    nextCursor = cursor
+    latest = {}
+    changes = (
+        db.session.query(
+            Change.sequence, Change.recordType, Change.recordId, Change.deleted
+        )
+        .filter(Change.patientId == patientId, Change.sequence > cursor)
+        .order_by(Change.sequence)
+    )
+    for sequence, recordType, recordId, deleted in changes:
+        latest[(recordType, recordId)] = deleted
+        nextCursor = sequence
+    for (recordType, recordId), deleted in latest.items():
+        if deleted:
+            result[recordType]["deleted"].append(recordId)
+    for name, model in syncedModels.items():
+        updatedIds = [
+            recordId
+            for (recordType, recordId), deleted in latest.items()
+            if recordType == name and not deleted
+        ]
+        if updatedIds:
+            result[name]["updated"] = [
+                syncedJson[name](record)
+                for record in model.query.filter(model.id.in_(updatedIds)).order_by(
+                    model.id
+                )
+            ]
+    return nextCursor, result
@@ -0,0 +1,119 @@
+"""Sync models."""
+import datetime as dt
+
+from sqlalchemy import event, select
+
+from tumsm_server.database import Column, PkModel, db
+from tumsm_server.patient.models import Patient, PatientTrainingZones
+from tumsm_server.planning.models import PlannedWorkout
+from tumsm_server.workout.models import Steps, Workout, WorkoutRating
+
+# Record types which are synced, by the name they are synced as
+syncedModels = {
+    "workouts": Workout,
+    "ratings": WorkoutRating,
+    "steps": Steps,
+    "plannedWorkouts": PlannedWorkout,
+    "trainingZones": PatientTrainingZones,
+}
+syncedNames = {model: name for name, model in syncedModels.items()}
+
+
+class Change(PkModel):
+    """A created, updated or deleted (tombstone) record of a patient, the sequence is the sync cursor"""
+
+    __tablename__ = "changes"
+    __table_args__ = (
+        db.Index("ix_changes_patientId_sequence", "patientId", "sequence", unique=True),
+    )
+    # No foreign key, the changes are deleted with their patient but must not block deleting it
+    patientId = Column(db.Integer, nullable=False)
+    # Numbers the changes of a patient in the order their transactions commit
+    sequence = Column(db.Integer, nullable=False, server_default="0")
+    recordType = Column(db.String(32), nullable=False)
+    recordId = Column(db.Integer, nullable=False)
+    deleted = Column(db.Boolean, nullable=False, default=False)
+    createdAt = Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
+
+    def __str__(self):
+        """Represent instance as a unique string."""
+        return f"<Change({self.id} - {self.recordType} {self.recordId})>"
+
+
+def patient_of(session, record):
+    """Id of the patient a synced record belongs to"""
+    if isinstance(record, WorkoutRating):
+        # The workout of a new rating isn't loaded yet, the one of a deleted rating may be deleted as well
+        workout = record.workout or session.get(Workout, record.workoutId)
+        return workout.patientId if workout is not None else None
+    return record.patientId
+
+
+def allocate_sequences(session, patientId, count):
+    """Reserve the next count sequence numbers of a patient, None if the patient doesn't exist
+
+    The update locks the patient row until the transaction ends, so a concurrent transaction allocates its numbers only
+    after this one committed. Unlike autoincrement ids, which are handed out on insert, the sequence numbers follow the
+    commit order & a client never skips a change committed after its sync.
+    """
+    patients = Patient.__table__
+    session.execute(
+        patients.update()
+        .where(patients.c.id == patientId)
+        .values(changeSequence=patients.c.changeSequence + count)
+    )
+    last = session.execute(
+        select(patients.c.changeSequence).where(patients.c.id == patientId)
+    ).scalar()
+    if last is None:
+        return None
+    return range(last - count + 1, last + 1)
+
+
+@event.listens_for(db.session, "after_flush")
+def log_changes(session, flush_context):
+    """Log the synced records of a flush, including records deleted by cascades"""
+    changesByPatient = {}
+    deletedPatientIds = []
+    for record in session.deleted:
+        if isinstance(record, Patient):
+            deletedPatientIds.append(record.id)
+    updated = [record for record in session.dirty if session.is_modified(record)]
+    for records, deleted in (
+        (session.new, False),
+        (updated, False),
+        (session.deleted, True),
+    ):
+        for record in records:
+            name = syncedNames.get(type(record))
+            if name is None:
+                continue
+            patientId = patient_of(session, record)
+            if patientId is not None:
+                changesByPatient.setdefault(patientId, []).append(
+                    {
+                        "patientId": patientId,
+                        "recordType": name,
+                        "recordId": record.id,
+                        "deleted": deleted,
+                        "createdAt": dt.datetime.utcnow(),
+                    }
+                )
+    changes = []
+    # Patients are locked in the order of their ids, so concurrent transactions can't deadlock
+    for patientId in sorted(changesByPatient):
+        patientChanges = changesByPatient[patientId]
+        sequences = allocate_sequences(session, patientId, len(patientChanges))
+        if sequences is None:
+            continue
+        for change, sequence in zip(patientChanges, sequences):
+            change["sequence"] = sequence
+        changes.extend(patientChanges)
+    if changes:
+        session.execute(Change.__table__.insert(), changes)
+    if deletedPatientIds:
+        session.execute(
+            Change.__table__.delete().where(
+                Change.__table__.c.patientId.in_(deletedPatientIds)
+            )
+        )
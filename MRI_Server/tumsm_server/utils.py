@@ -2,12 +2,15 @@
 import functools
 import logging
 import datetime
-import math
+import reprlib
+import sys
 import threading
-import inspect
+import time
 import os
 import pathlib
 
+import numpy as np
+from environs import Env
 from flask import flash
 from flask_wtf import FlaskForm
 
@@ -15,6 +18,12 @@ dateTimeFormat = "%Y-%m-%d %H:%M:%S.%f"
 dateFormat = "%Y-%m-%d"
 threadLocal = threading.local()
 maxLoggingValueLength = 30
+logger = logging.getLogger()
+
+env = Env()
+env.read_env()
+# Modules which are not traced by log_enter_and_exit, e.g. "tumsm_server.workout,tumsm_server.patient.lib"
+tracingDisabledModules = env.list("TRACING_DISABLED_MODULES", default=[])
 
 
 class LoggingFlaskForm(FlaskForm):
@@ -66,90 +75,197 @@ def myMakeRecord(self, name, level, fn, lno, msg, args, exc_info, func, extra, s
     return rv
 
 
-def log(msg):
-    if not hasattr(threadLocal, "indent"):
-        threadLocal.indent = ""
+logging.Logger.makeRecord = myMakeRecord
+
 
-    caller = inspect.currentframe().f_back
-    override = {
+def caller_override(caller):
+    return {
         "lineno": caller.f_lineno,
         "filename": pathlib.PurePath(caller.f_code.co_filename).parent.name
         + "|"
         + os.path.basename(caller.f_code.co_filename),
     }
-    logging.info(f"{threadLocal.indent}\t{msg}", extra=override)
+
+
+def log(msg):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if not hasattr(threadLocal, "indent"):
+        threadLocal.indent = ""
+    logger.info(f"{threadLocal.indent}\t{msg}", extra=caller_override(sys._getframe(1)))
+
+
+class TruncatingRepr(reprlib.Repr):
+    """Repr for logging, which truncates long values without building their full repr first"""
+
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 2
+        self.maxstring = maxLoggingValueLength
+        self.maxlong = maxLoggingValueLength
+        self.maxother = maxLoggingValueLength
+
+    def repr_bytes(self, x, level):
+        if len(x) <= self.maxstring:
+            return repr(x)
+        return f"{x[: self.maxstring // 2]!r}...({len(x)} bytes)"
+
+
+truncatingRepr = TruncatingRepr()
+
+
+class FunctionStatistics:
+    """Number of calls of a traced function & the time spent in it, including the time spent in the functions it
+    calls"""
+
+    __slots__ = ("name", "calls", "totalSeconds", "maxSeconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.totalSeconds += seconds
+        if seconds > self.maxSeconds:
+            self.maxSeconds = seconds
+
+    @property
+    def asJson(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "totalSeconds": self.totalSeconds,
+            "meanSeconds": self.totalSeconds / self.calls if self.calls > 0 else 0.0,
+            "maxSeconds": self.maxSeconds,
+        }
+
+
+functionStatistics = {}
+
+
+def function_statistics():
+    """Statistics of all traced functions, the functions with the most time spent in first"""
+    return sorted(
+        functionStatistics.values(), key=lambda s: s.totalSeconds, reverse=True
+    )
+
+
+def is_tracing_disabled(module):
+    return any(
+        module == disabled or module.startswith(disabled + ".")
+        for disabled in tracingDisabledModules
+    )
 
 
 def log_enter_and_exit(func):
-    """Print the function signature and return value when called.
+    """Count & time the calls of a function, and log its signature and return value when INFO logging is enabled.
+
+    The arguments are only formatted if the log message is emitted, large values are truncated while formatting.
+    Functions of the modules in TRACING_DISABLED_MODULES (comma separated, packages include their modules) are not
+    wrapped at all.
 
     Example:
-        Let's define a method and decorate it with our `@debug` decorator
-        >>> @debug
-        ... def get_greeting(who="World", also_print=False):
-        ...     if also_print:
-        ...         print(f"Hello, {who}!")
+        >>> @log_enter_and_exit
+        ... def get_greeting(who="World"):
         ...     return f"Hello, {who}!"
 
-        When the method is called, its call signature and return value are printed:
-        >>> _ = get_greeting("Reader", also_print=True)
-        > get_greeting('Reader', also_print=True)
-        Hello, Reader!
+        When the method is called, its call signature and return value are logged:
+        >>> _ = get_greeting("Reader")
+        > get_greeting('Reader')
         < get_greeting -> 'Hello, Reader!'
 
     """
-    logging.Logger.makeRecord = myMakeRecord
+    if is_tracing_disabled(func.__module__):
+        return func
+    name = f"{func.__module__}.{func.__qualname__}"
+    statistics = functionStatistics.setdefault(name, FunctionStatistics(name))
 
     @functools.wraps(func)
     def wrapper_debug(*args, **kwargs):
-        if not hasattr(threadLocal, "indent"):
-            threadLocal.indent = ""
-        args_repr = [
-            repr(a)
-            if len(repr(a)) < maxLoggingValueLength
-            else repr(a)[: math.floor(maxLoggingValueLength / 2)]
-            + "..."
-            + repr(a)[math.floor(-maxLoggingValueLength / 2) :]
-            for a in args
-        ]
-        kwargs_repr = [
-            f"{k}={v!r}"
-            if len(repr(v)) < maxLoggingValueLength
-            else f"{k}={repr(v)[:math.floor(maxLoggingValueLength / 2)] + '...' + repr(v)[math.floor(-maxLoggingValueLength / 2):]}"
-            for k, v in kwargs.items()
-        ]
-        caller = inspect.currentframe().f_back
-        override = {
-            "lineno": caller.f_lineno,
-            "filename": pathlib.PurePath(caller.f_code.co_filename).parent.name
-            + "|"
-            + os.path.basename(caller.f_code.co_filename),
-        }
-        logging.info(
-            f"{threadLocal.indent}> {func.__name__}({', '.join(args_repr + kwargs_repr)})",
-            extra=override,
-        )
-        threadLocal.indent = threadLocal.indent + "\t"
-        rv = func(*args, **kwargs)
-        threadLocal.indent = threadLocal.indent[:-1]
-        rv_repr = f" -> {rv!r}" if rv is not None else ""
-        if len(rv_repr) > maxLoggingValueLength:
-            rv_repr = (
-                " -> "
-                + repr(rv)[: math.floor(maxLoggingValueLength / 2)]
-                + "..."
-                + repr(rv)[math.floor(-maxLoggingValueLength / 2) :]
-            )
-        logging.info(f"{threadLocal.indent}< {func.__name__}{rv_repr}", extra=override)
-        return rv
+        started = time.perf_counter()
+        try:
+            if not logger.isEnabledFor(logging.INFO):
+                return func(*args, **kwargs)
+            return call_logged(func, sys._getframe(1), args, kwargs)
+        finally:
+            statistics.add(time.perf_counter() - started)
 
     return wrapper_debug
 
 
+def call_logged(func, caller, args, kwargs):
+    if not hasattr(threadLocal, "indent"):
+        threadLocal.indent = ""
+    args_repr = [truncatingRepr.repr(a) for a in args] + [
+        f"{k}={truncatingRepr.repr(v)}" for k, v in kwargs.items()
+    ]
+    override = caller_override(caller)
+    logger.info(
+        f"{threadLocal.indent}> {func.__name__}({', '.join(args_repr)})",
+        extra=override,
+    )
+    indent = threadLocal.indent
+    threadLocal.indent = indent + "\t"
+    try:
+        rv = func(*args, **kwargs)
+    finally:
+        threadLocal.indent = indent
+    rv_repr = f" -> {truncatingRepr.repr(rv)}" if rv is not None else ""
+    logger.info(f"{indent}< {func.__name__}{rv_repr}", extra=override)
+    return rv
+
+
 def parse_date_time(date_time_string):
+    """Parse a timestamp in the dateTimeFormat
+
+    Timestamps in the canonical layout of the format (e.g. "2021-11-18 08:00:00.250000") are decoded with the much
+    faster fromisoformat, all others go through strptime.
+    """
+    if (
+        len(date_time_string) == 26
+        and date_time_string[4] == "-"
+        and date_time_string[7] == "-"
+        and date_time_string[10] == " "
+        and date_time_string[13] == ":"
+        and date_time_string[16] == ":"
+        and date_time_string[19] == "."
+        and date_time_string.isascii()
+        and date_time_string[20:].isdigit()
+    ):
+        try:
+            return datetime.datetime.fromisoformat(date_time_string)
+        except ValueError:
+            pass
     return datetime.datetime.strptime(date_time_string, dateTimeFormat)
 
 
+def parse_date_times(date_time_strings):
+    """Parse a sequence of timestamps in the dateTimeFormat into a datetime64[us] array
+
+    If all timestamps have the canonical layout of the format they are decoded by numpy at once, otherwise one by one
+    with parse_date_time.
+    """
+    characters = np.array(date_time_strings, dtype=str)
+    if len(characters) > 0 and characters.dtype.itemsize == 26 * 4:
+        codes = characters.view(np.uint32).reshape(len(characters), 26)
+        if (
+            np.all(codes[:, [4, 7, 10, 13, 16, 19]] == [ord(c) for c in "-- ::."])
+            and np.all((codes[:, 20:] >= ord("0")) & (codes[:, 20:] <= ord("9")))
+            and np.all(codes < 128)
+        ):
+            try:
+                return characters.astype("datetime64[us]")
+            except ValueError:
+                pass
+    return np.array(
+        [parse_date_time(date_time_string) for date_time_string in date_time_strings],
+        dtype="datetime64[us]",
+    )
+
+
 def parse_date(date_string):
     return datetime.datetime.strptime(date_string, dateFormat)
 
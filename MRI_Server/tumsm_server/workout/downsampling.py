@@ -0,0 +1,137 @@
+"""Level of detail downsampling of the sample columns of a workout, for charts
+
+Each sample stream is downsampled with Largest-Triangle-Three-Buckets (LTTB), which keeps the points spanning the
+largest triangles with their neighbouring buckets, so peaks & dips stay visible. The levels of a stream hold at most
+4096, 2048, ... 128 points, every level is downsampled from the previous one. A stream with fewer samples than a
+level's size has no further levels, its smallest level holds all of its samples. The pyramid is built when a workout is
+uploaded and stored as
+
+    length (I) | encoded sample column | length (I) | encoded sample column | ...
+
+with one encoded column (see sampleEncoding) per level & stream, ordered by stream & decreasing size.
+"""
+import struct
+
+import numpy as np
+
+from .sampleEncoding import HEADER, decode_sample_columns, encode_sample_columns
+
+PYRAMID_SIZES = (4096, 2048, 1024, 512, 256, 128)
+LENGTH = struct.Struct("<I")
+
+
+def lttb(times, values, threshold):
+    """Downsample the (times, values) columns of samples ordered by time to at most threshold points"""
+    count = len(values)
+    if count <= threshold or count <= 2:
+        return times, values
+    if threshold < 3:
+        kept = [0, count - 1][:threshold]
+        return times[kept], values[kept]
+
+    # The first & last point are kept, the others are split into threshold - 2 buckets
+    bounds = np.linspace(1, count - 1, threshold - 1).astype(int)
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    time_sums = np.concatenate(([0.0], np.cumsum(times)))
+    bucket_sizes = np.diff(bounds)
+    # The third point of a bucket's triangles is the average of the next bucket (the last point for the last bucket)
+    next_times = np.append(
+        (time_sums[bounds[2:]] - time_sums[bounds[1:-1]]) / bucket_sizes[1:],
+        times[-1],
+    )
+    next_values = np.append(
+        (value_sums[bounds[2:]] - value_sums[bounds[1:-1]]) / bucket_sizes[1:],
+        values[-1],
+    )
+
+    offsets = np.arange(bucket_sizes.max())
+    indexes = np.minimum(bounds[:-1, None] + offsets, count - 1)
+    # The points padding the shorter buckets to the size of the largest one are never selected
+    padding = offsets >= bucket_sizes[:, None]
+    bucket_times = times[indexes]
+    bucket_values = values[indexes]
+
+    def select(buckets, previous):
+        """The index of the point spanning the largest triangle in each bucket, given the previously selected points"""
+        previous_times = times[previous][:, None]
+        previous_values = values[previous][:, None]
+        # Twice the areas of the triangles of the previous point, each point & the next bucket's average
+        areas = np.abs(
+            (next_times[buckets, None] - previous_times)
+            * (bucket_values[buckets] - previous_values)
+            - (bucket_times[buckets] - previous_times)
+            * (next_values[buckets, None] - previous_values)
+        )
+        areas[np.isnan(areas) | padding[buckets]] = -1.0
+        return bounds[buckets] + np.argmax(areas, axis=1)
+
+    # The point of a bucket depends on the one selected in the previous bucket. All buckets are selected at once,
+    # starting from the last point of each previous bucket, and the buckets whose previous point turned out differently
+    # are selected again until nothing changes. The first changed bucket is final after each round, so this ends with
+    # the same points as selecting the buckets one after another, usually after a few rounds.
+    previous = bounds[:-1] - 1
+    selected = select(np.arange(threshold - 2), previous)
+    while True:
+        changed = np.flatnonzero(selected[:-1] != previous[1:]) + 1
+        if len(changed) == 0:
+            break
+        previous[changed] = selected[changed - 1]
+        selected[changed] = select(changed, previous[changed])
+    selected = np.concatenate(([0], selected, [count - 1]))
+    return times[selected], values[selected]
+
+
+def build_pyramid(times, values):
+    """The levels of one sample stream, each downsampled from the previous one & smaller than it"""
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+    levels = []
+    for size in PYRAMID_SIZES:
+        times, values = lttb(times, values, size)
+        if len(levels) > 0 and len(values) == len(levels[-1][1]):
+            break
+        levels.append((times, values))
+    return levels
+
+
+def encode_pyramid(sample_columns):
+    """Builds & encodes the pyramids of the (times, values) columns per value key"""
+    blob = bytearray()
+    for value_key, (times, values) in sample_columns.items():
+        for level_times, level_values in build_pyramid(times, values):
+            column = encode_sample_columns(level_times, level_values, value_key)
+            blob += LENGTH.pack(len(column)) + column
+    return bytes(blob)
+
+
+def decode_pyramid(blob):
+    """Decodes a stored pyramid into the levels (times, values) per value key, ordered by decreasing size"""
+    pyramid = {}
+    blob = bytes(blob)
+    offset = 0
+    while offset < len(blob):
+        (length,) = LENGTH.unpack_from(blob, offset)
+        offset += LENGTH.size
+        column = blob[offset : offset + length]
+        offset += length
+        value_key = column_value_key(column)
+        pyramid.setdefault(value_key, []).append(
+            decode_sample_columns(column, value_key)
+        )
+    return pyramid
+
+
+def column_value_key(column):
+    key_length = HEADER.unpack_from(column)[4]
+    return column[HEADER.size : HEADER.size + key_length].decode()
+
+
+def select_level(levels, max_points):
+    """The most detailed level with at most max_points points, downsampled further below the smallest level"""
+    for times, values in levels:
+        if len(values) <= max_points:
+            return times, values
+    return lttb(*levels[-1], max_points)
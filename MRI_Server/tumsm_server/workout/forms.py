@@ -3,7 +3,7 @@ from wtforms import IntegerField, StringField, DateField
 from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 import tumsm_server.patient.models as PatientModel
-from .healthkitDataProcessor import check_health_kit_data_structure
+from .healthkitDataProcessor import HealthKitPayload
 from .models import Workout, WorkoutRating
 from ..utils import dateFormat, LoggingFlaskForm
 
@@ -39,13 +39,15 @@ class AddWorkoutForm(LoggingFlaskForm):
     def __init__(self, *args, **kwargs):
         """Create instance."""
         super(AddWorkoutForm, self).__init__(*args, **kwargs)
+        self.payload = None
 
     def validate_pre_logging(self):
         """Validate the form."""
         if PatientModel.Patient.query.filter_by(id=self.patientId.data).first() is None:
             self.patientId.errors.append("Patient does not exist")
             return False
-        if not check_health_kit_data_structure(self.healthJsonData.data):
+        self.payload = HealthKitPayload.parse(self.healthJsonData.data)
+        if self.payload is None:
             self.healthJsonData.errors.append(
                 "Health data does not conform to expected structure"
             )
@@ -2,47 +2,110 @@
 
 
 import json
-import math
+from array import array
 from json import JSONDecodeError
 
-from tumsm_server.utils import parse_date_time, log_enter_and_exit
+import numpy as np
+
+from tumsm_server.utils import parse_date_time, parse_date_times, log_enter_and_exit
+
+# Sample streams of a workout, a stream which wasn't recorded (e.g. without a watch) is null
+SAMPLE_STREAMS = (
+    "workoutEvents",
+    "heartRateSamples",
+    "locations",
+    "distanceWalkingRunningSamples",
+)
+
+
+class HealthKitPayload:
+    """A healthkit workout which is parsed & validated once per request
+
+    Keeps the original bytes of the upload, they are stored verbatim as the raw workout.
+    """
+
+    def __init__(self, raw, data):
+        self.raw = raw
+        self.data = data
+        self.startDate = parse_date_time(data["startDate"])
+        self.endDate = parse_date_time(data["endDate"])
+
+    @classmethod
+    def parse(cls, health_kit_json_data):
+        """Parse & validate a healthkit string/bytes/object, None if it isn't a valid workout"""
+        if isinstance(health_kit_json_data, cls):
+            return health_kit_json_data
+        try:
+            if isinstance(health_kit_json_data, (str, bytes)):
+                raw = (
+                    health_kit_json_data.encode()
+                    if isinstance(health_kit_json_data, str)
+                    else health_kit_json_data
+                )
+                data = json.loads(raw)
+            else:
+                # Objects embedded in a request have no original bytes of their own
+                data = health_kit_json_data
+                raw = str.encode(json.dumps(data))
+            payload = cls(raw, data)
+        except (TypeError, KeyError, ValueError, UnicodeError, JSONDecodeError):
+            return None
+        return payload if payload.is_valid() else None
+
+    def is_valid(self):
+        """Checks the structural & semantical integrity of the workout"""
+        data = self.data
+        try:
+            data["appleUUID"]
+            data["activityType"]
+            measures = [
+                data[key]["doubleValue"]
+                for key in ("duration", "totalDistance", "totalCalories")
+            ]
+            samples = [data[key] for key in SAMPLE_STREAMS]
+        except (TypeError, KeyError):
+            return False
+        return (
+            self.startDate <= self.endDate
+            and all(
+                isinstance(measure, (int, float))
+                and not isinstance(measure, bool)
+                and measure >= 0
+                for measure in measures
+            )
+            and all(sample is None or isinstance(sample, list) for sample in samples)
+        )
 
 
 @log_enter_and_exit
 def check_health_kit_data_structure(health_kit_json_data):
-    """Checks the structural (!!not semantical!!) integrity of the healthkit string
+    """Checks the integrity of the healthkit string
     Used for data validation when posting a workout
     """
-    try:
-        if isinstance(health_kit_json_data, str):
-            data = json.loads(health_kit_json_data)
-        else:
-            data = health_kit_json_data
-        data["appleUUID"]
-        data["activityType"]
-        parse_date_time(data["startDate"])
-        parse_date_time(data["endDate"])
-        data["duration"]["doubleValue"]
-        data["totalDistance"]["doubleValue"]
-        data["totalCalories"]["doubleValue"]
-        data["workoutEvents"]
-        data["heartRateSamples"]
-        data["locations"]
-        data["distanceWalkingRunningSamples"]
-        return True
-    except (TypeError, KeyError, ValueError, UnicodeError, JSONDecodeError):
-        return False
+    return HealthKitPayload.parse(health_kit_json_data) is not None
 
 
 @log_enter_and_exit
 def process_health_kit_data(health_kit_json_data):
-    """Consumes the raw healthkit string and parses its contents"""
+    """Consumes the parsed healthkit payload (or a raw healthkit string) and processes its contents"""
+    result = process_health_kit_columns(health_kit_json_data)
+    if result is None:
+        return None
+    return (*result[:15], *(columns.profile for columns in result[15:]))
 
+
+@log_enter_and_exit
+def process_health_kit_columns(health_kit_json_data):
+    """Like process_health_kit_data, but returns the SampleColumns of the streams instead of their profiles"""
+
+    payload = HealthKitPayload.parse(health_kit_json_data)
+    if payload is None:
+        return None
     try:
-        if isinstance(health_kit_json_data, str):
-            json_object = json.loads(health_kit_json_data)
-        else:
-            json_object = health_kit_json_data
+        json_object = {
+            **payload.data,
+            **{key: [] for key in SAMPLE_STREAMS if payload.data[key] is None},
+        }
         (
             apple_uuid,
             workout_type,
@@ -51,12 +114,18 @@ def process_health_kit_data(health_kit_json_data):
             duration,
             distance,
             kcal,
-        ) = get_workout_quick_facts(json_object)
-        terrain_up, terrain_down = get_terrain_facts(json_object)
-        heart_rate_profile = get_heart_rate_profile(json_object)
-        speed_profile = get_speed_profile(json_object)
-        altitude_profile = get_altitude_profile(json_object)
-        distance_profile = get_distance_profile(json_object)
+        ) = get_workout_quick_facts(payload)
+        # Every sample stream is decoded exactly once, all profiles & stats are derived from these columns
+        heart_rate_columns = get_heart_rate_columns(json_object)
+        (
+            altitude_columns,
+            speed_columns,
+            terrain_up,
+            terrain_down,
+        ) = get_location_columns(json_object)
+        distance_columns, device_speed_columns = get_distance_columns(json_object)
+        if len(speed_columns) == 0:
+            speed_columns = device_speed_columns
         (
             heartRateAvg,
             heartRateMin,
@@ -64,7 +133,7 @@ def process_health_kit_data(health_kit_json_data):
             speedAvg,
             speedMin,
             speedMax,
-        ) = get_sample_overview(heart_rate_profile, speed_profile)
+        ) = get_sample_overview(heart_rate_columns, speed_columns)
         return (
             apple_uuid,
             workout_type,
@@ -81,50 +150,69 @@ def process_health_kit_data(health_kit_json_data):
             speedAvg,
             speedMin,
             speedMax,
-            heart_rate_profile,
-            speed_profile,
-            altitude_profile,
-            distance_profile,
+            heart_rate_columns,
+            speed_columns,
+            altitude_columns,
+            distance_columns,
         )
     except (TypeError, JSONDecodeError):
         return None
 
 
+class SampleColumns:
+    """Float columns (seconds since start & value) of one decoded healthkit sample stream"""
+
+    def __init__(self, value_key, seconds_since_start=(), values=()):
+        self.value_key = value_key
+        self.seconds_since_start = np.asarray(seconds_since_start, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def profile(self):
+        """Sample dicts in the layout which is stored for a workout"""
+        value_key = self.value_key
+        return [
+            {value_key: value, "seconds_since_start": seconds}
+            for value, seconds in zip(
+                self.values.tolist(), self.seconds_since_start.tolist()
+            )
+        ]
+
+
 @log_enter_and_exit
-def get_sample_overview(heartRate_profile, speed_profile):
+def get_sample_overview(heart_rate_columns, speed_columns):
     """Calculates overview data for heartrate and speed samples"""
-    heartRate_sum = 0
-    heartRateMin = None
-    heartRateMax = None
-    speed_sum = 0
-    speedMin = None
-    speedMax = None
-    for sample in heartRate_profile:
-        heartRate = sample["heartRate"]
-        heartRate_sum += heartRate
-        if heartRateMin is None or heartRateMin > heartRate:
-            heartRateMin = heartRate
-        if heartRateMax is None or heartRateMax < heartRate:
-            heartRateMax = heartRate
-    for sample in speed_profile:
-        speed = sample["speed"]
-        speed_sum += speed
-        if speedMin is None or speedMin > speed:
-            speedMin = speed
-        if speedMax is None or speedMax < speed:
-            speedMax = speed
+    heart_rates = heart_rate_columns.values.tolist()
+    speeds = speed_columns.values.tolist()
     return (
-        heartRate_sum / max(len(heartRate_profile), 1),
-        heartRateMin,
-        heartRateMax,
-        speed_sum / max(len(speed_profile), 1),
-        speedMin,
-        speedMax,
+        sum(heart_rates) / max(len(heart_rates), 1),
+        min(heart_rates) if len(heart_rates) > 0 else None,
+        max(heart_rates) if len(heart_rates) > 0 else None,
+        sum(speeds) / max(len(speeds), 1),
+        min(speeds) if len(speeds) > 0 else None,
+        max(speeds) if len(speeds) > 0 else None,
     )
 
 
+def float_column(values):
+    """A float array of healthkit values, like the JSON null a value which isn't a number raises a TypeError"""
+    return np.array(array("d", values))
+
+
+def sequential_sum(values):
+    """Sum of the values added up one after another like in a loop, numpy's sum adds them up pairwise"""
+    return float(np.cumsum(values)[-1]) if len(values) > 0 else 0
+
+
 def seconds_since_start(start_date_time, current_date_time):
-    """Helper method to calculate seconds since a given point time"""
+    """Helper method to calculate seconds since a given point time, also of datetime64 arrays"""
+    if isinstance(current_date_time, np.ndarray):
+        return (
+            current_date_time - np.datetime64(start_date_time, "us")
+        ) / np.timedelta64(1, "s")
     return (current_date_time - start_date_time).total_seconds()
 
 
@@ -149,12 +237,13 @@ def cut_device_data(device_string):
     return device_string.split(">, ", 1)[1]
 
 
-def get_workout_quick_facts(data):
+def get_workout_quick_facts(payload):
     """Parses easily accessible data of the workout"""
+    data = payload.data
     apple_uuid = data["appleUUID"]
     workout_type = data["activityType"]
-    start_date = parse_date_time(data["startDate"])
-    end_date = parse_date_time(data["endDate"])
+    start_date = payload.startDate
+    end_date = payload.endDate
     duration = data["duration"]["doubleValue"]
     distance = data["totalDistance"]["doubleValue"]
     kcal = data["totalCalories"]["doubleValue"]
@@ -183,153 +272,73 @@ def get_prioritized_device(data):
         return cut_device_data(iphone_device)
 
 
-def get_altitude_profile(data):
-    """Extracts altitude samples into a list"""
-    profile = []
-
-    if data["locations"] is None or len(data["locations"]) == 0:
-        return []
-
-    first_timestamps = data["locations"][0]["timestamp"]
-
-    for sample in data["locations"]:
-        profile.append(
-            {
-                "altitude": sample["altitude"],
-                "seconds_since_start": seconds_since_start(
-                    parse_date_time(first_timestamps),
-                    parse_date_time(sample["timestamp"]),
-                ),
-            }
-        )
-    return profile
-
-
-def get_terrain_facts(data):
-    """Calculates terrain up/down delta of the whole workout"""
-    if data["locations"] is None or len(data["locations"]) == 0:
-        return 0, 0
-
-    sum_up = 0
-    sum_down = 0
-
-    previous_height = data["locations"][0]["altitude"]
-    for sample in data["locations"]:
-        if sample["altitude"] > previous_height:
-            sum_up += sample["altitude"] - previous_height
-        elif sample["altitude"] < previous_height:
-            sum_down += previous_height - sample["altitude"]
-        previous_height = sample["altitude"]
-    return sum_up, sum_down
+def get_location_columns(data):
+    """Decodes all location samples at once into altitude & speed columns and the terrain up/down delta"""
+    locations = data["locations"]
 
+    if locations is None or len(locations) == 0:
+        return SampleColumns("altitude"), SampleColumns("speed"), 0, 0
 
-def get_speed_profile(data):
-    """Extracts speed samples into a list"""
-    profile = []
+    timestamps = parse_date_times([sample["timestamp"] for sample in locations])
+    seconds = seconds_since_start(timestamps[0], timestamps)
+    heights = float_column([sample["altitude"] for sample in locations])
+    speeds = float_column([sample["speed"]["doubleValue"] for sample in locations])
+    climbs = np.diff(heights)
+    return (
+        SampleColumns("altitude", seconds, heights),
+        SampleColumns("speed", seconds, speeds * 3.6),
+        sequential_sum(climbs[climbs > 0]),
+        sequential_sum(-climbs[climbs < 0]),
+    )
 
-    if (data["locations"] is None or len(data["locations"]) == 0) and (
-        data["distanceWalkingRunningSamples"] is None
-        or len(data["distanceWalkingRunningSamples"]) == 0
-    ):
-        return []
-    elif data["locations"] is None or len(data["locations"]) == 0:
-        return _get_speed_profile_without_location_data_(data)
-
-    first_timestamps = data["locations"][0]["timestamp"]
-
-    for sample in data["locations"]:
-        profile.append(
-            {
-                "speed": sample["speed"]["doubleValue"] * 3.6,
-                "seconds_since_start": seconds_since_start(
-                    parse_date_time(first_timestamps),
-                    parse_date_time(sample["timestamp"]),
-                ),
-            }
-        )
-    return profile
 
+def get_distance_columns(data):
+    """Decodes the distanceWalkingRunning samples of the prioritized device at once
 
-def _get_speed_profile_without_location_data_(data):
-    """Extracts altitude samples into a list, when no location data is provided"""
-    profile = []
+    Returns the cumulative distance and the speed derived from each sample, the latter is used as speed profile when
+    no location data is provided
+    """
+    samples = data["distanceWalkingRunningSamples"]
 
-    if (
-        data["distanceWalkingRunningSamples"] is None
-        or len(data["distanceWalkingRunningSamples"]) == 0
-    ):
-        return []
+    if samples is None or len(samples) == 0:
+        return SampleColumns("distance"), SampleColumns("speed")
 
-    first_timestamps = data["distanceWalkingRunningSamples"][0]["startTime"]
+    first_timestamp = parse_date_time(samples[0]["startTime"])
     prioritized_device = get_prioritized_device(data)
+    # A workout's samples come from a few devices, so each distinct device string is only compared once
+    devices = {
+        device
+        for device in {sample["device"] for sample in samples}
+        if cut_device_data(device) == prioritized_device
+    }
+    samples = [sample for sample in samples if sample["device"] in devices]
+    meters = np.array(
+        [float(sample["quantity"]["doubleValue"]) for sample in samples], dtype=float
+    )
+    start_times = parse_date_times([sample["startTime"] for sample in samples])
+    end_times = parse_date_times([sample["endTime"] for sample in samples])
+    seconds = seconds_since_start(first_timestamp, end_times)
+    durations = (end_times - start_times) / np.timedelta64(1, "s")
+    moving = durations != 0
+    return (
+        SampleColumns("distance", seconds, np.cumsum(meters)),
+        SampleColumns(
+            "speed", seconds[moving], meters[moving] / durations[moving] * 3.6
+        ),
+    )
 
-    for sample in data["distanceWalkingRunningSamples"]:
-        if cut_device_data(sample["device"]) != prioritized_device:
-            continue
-        meters = float(sample["quantity"]["doubleValue"])
-        timeDiff = (
-            parse_date_time(sample["endTime"]) - parse_date_time(sample["startTime"])
-        ).total_seconds()
-        if timeDiff != 0:
-            profile.append(
-                {
-                    "speed": meters / timeDiff * 3.6,
-                    "seconds_since_start": seconds_since_start(
-                        parse_date_time(first_timestamps),
-                        parse_date_time(sample["endTime"]),
-                    ),
-                }
-            )
-    return profile
-
-
-def get_heart_rate_profile(data):
-    """Extracts heart rate samples into a list"""
-    profile = []
-
-    if data["heartRateSamples"] is None or len(data["heartRateSamples"]) == 0:
-        return []
-
-    first_timestamps = data["heartRateSamples"][0]["startTime"]
-
-    for sample in data["heartRateSamples"]:
-        profile.append(
-            {
-                "heartRate": sample["quantity"]["doubleValue"],
-                "seconds_since_start": seconds_since_start(
-                    parse_date_time(first_timestamps),
-                    parse_date_time(sample["endTime"]),
-                ),
-            }
-        )
-    return profile
 
+def get_heart_rate_columns(data):
+    """Decodes all heart rate samples at once"""
+    samples = data["heartRateSamples"]
 
-def get_distance_profile(data):
-    """Extracts distance samples into a list"""
-    profile = []
-    current_sum = 0
+    if samples is None or len(samples) == 0:
+        return SampleColumns("heartRate")
 
-    if (
-        data["distanceWalkingRunningSamples"] is None
-        or len(data["distanceWalkingRunningSamples"]) == 0
-    ):
-        return []
-
-    first_timestamps = data["distanceWalkingRunningSamples"][0]["startTime"]
-    prioritized_device = get_prioritized_device(data)
-
-    for sample in data["distanceWalkingRunningSamples"]:
-        if cut_device_data(sample["device"]) != prioritized_device:
-            continue
-        current_sum += float(sample["quantity"]["doubleValue"])
-        profile.append(
-            {
-                "distance": current_sum,
-                "seconds_since_start": seconds_since_start(
-                    parse_date_time(first_timestamps),
-                    parse_date_time(sample["endTime"]),
-                ),
-            }
-        )
-    return profile
+    first_timestamp = parse_date_time(samples[0]["startTime"])
+    end_times = parse_date_times([sample["endTime"] for sample in samples])
+    return SampleColumns(
+        "heartRate",
+        seconds_since_start(first_timestamp, end_times),
+        float_column([sample["quantity"]["doubleValue"] for sample in samples]),
+    )
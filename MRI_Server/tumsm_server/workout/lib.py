@@ -1,18 +1,92 @@
+import datetime as dt
 import json
 import logging
 import math
+from concurrent.futures import ProcessPoolExecutor
 from json import JSONDecodeError
 
-from .healthkitDataProcessor import process_health_kit_data
-from .models import Workout, RawWorkout
+import numpy as np
+from sqlalchemy import inspect
+from sqlalchemy.orm import undefer_group
+
+from .downsampling import build_pyramid, encode_pyramid, select_level
+from .healthkitDataProcessor import HealthKitPayload, process_health_kit_columns
+from .models import SAMPLES_GROUP, Workout, RawWorkout
+from .sampleEncoding import decode_sample_columns, encode_sample_columns
+from .segmentIndex import SegmentIndex
 import tumsm_server.patient.models as PatientModels
-from ..utils import log_enter_and_exit, force_to_float
+from ..extensions import cache, db, segment_indexes
+from ..utils import log_enter_and_exit, force_to_date, force_to_float
 
 
 @log_enter_and_exit
 def create_workout(workout_json, patientId, patch=False):
-    """Creates/Patches a workout object from a raw healthkit string"""
+    """Creates/Patches a workout object from a parsed healthkit payload or a raw healthkit string"""
+    payload = HealthKitPayload.parse(workout_json)
+    if payload is None:
+        return None
+    patient = PatientModels.Patient.query.filter_by(id=patientId).first()
+    workoutContent = workout_content(payload, patient)
+    if workoutContent is None:
+        return None
+
+    existing_workout = Workout.query.filter_by(
+        appleUUID=workoutContent["appleUUID"], patientId=patientId
+    ).first()
+
+    if patch:
+        if existing_workout is None:
+            return None
+        existing_workout.update(**workoutContent)
+        return existing_workout
+    else:
+        if existing_workout is not None:
+            return existing_workout
+        workout = Workout.create(**workoutContent)
+        RawWorkout.create(workoutId=workout.id, healthKitJson=payload.raw)
+        return workout
+
 
+@log_enter_and_exit
+def create_workouts(workout_jsons, patientId):
+    """Creates the workouts of a batch of healthkit strings/objects of one patient in a single transaction
+
+    Returns a status per workout: "created", "exists" (known appleUUID, also inside the batch) or "invalid".
+    """
+    patient = PatientModels.Patient.query.filter_by(id=patientId).first()
+    parsed = [HealthKitPayload.parse(workout_json) for workout_json in workout_jsons]
+
+    uuids = {payload.data["appleUUID"] for payload in parsed if payload is not None}
+    existing = dict(
+        db.session.query(Workout.appleUUID, Workout.id).filter(
+            Workout.patientId == patientId, Workout.appleUUID.in_(uuids)
+        )
+        if uuids
+        else []
+    )
+    results = []
+    for payload in parsed:
+        if payload is None:
+            results.append({"status": "invalid", "workout": None})
+            continue
+        appleUUID = payload.data["appleUUID"]
+        if appleUUID in existing:
+            results.append({"status": "exists", "workout": existing[appleUUID]})
+            continue
+        workoutContent = workout_content(payload, patient)
+        if workoutContent is None:
+            results.append({"status": "invalid", "workout": None})
+            continue
+        workout = Workout(**workoutContent).save(commit=False)
+        RawWorkout(workoutId=workout.id, healthKitJson=payload.raw).save(commit=False)
+        existing[appleUUID] = workout.id
+        results.append({"status": "created", "workout": workout.id})
+    db.session.commit()
+    return results
+
+
+def workout_content(payload, patient):
+    """Processes a parsed healthkit payload into the columns of a workout, None if it can't be processed"""
     try:
         (
             apple_uuid,
@@ -30,42 +104,33 @@ def create_workout(workout_json, patientId, patch=False):
             speedAvg_p,
             speedMin_p,
             speedMax_p,
-            heartRate_samples_p,
-            speed_samples_p,
-            altitude_samples_p,
-            distance_samples_p,
-        ) = process_health_kit_data(workout_json)
-
-        # The combined profile with always the same sample rate is used to calculate the data for
-        # trainingZones/kilometerPace
-        # We need data that always uses the same sample rate to ensure percentage comparability
-        combined_profile = get_combined_profile(
-            10,
-            heart_rate_profile=heartRate_samples_p,
-            speed_profile=speed_samples_p,
-            altitude_profile=altitude_samples_p,
-            distance_profile=distance_samples_p,
-            startTime=startTime_p,
-            endTime=endTime_p,
+            *stream_columns,
+        ) = process_health_kit_columns(payload)
+
+        # The decoded columns are encoded & analysed directly, without building the sample dicts of the profiles
+        sample_columns = tuple(
+            (columns.seconds_since_start, columns.values) for columns in stream_columns
         )
-        kilometer_pace_p, paceMin_p, paceMax_p = get_kilometre_wise_pace(
-            combined_profile
+        trainingZones = patient.training_zone_index
+        derivedMetrics = derived_metrics(
+            sample_columns,
+            startTime_p,
+            endTime_p,
+            trainingZones.zone_of_date(
+                unit="HEARTRATE", date=startTime_p, workoutType=type_p
+            ),
+            trainingZones.zone_of_date(
+                unit="SPEED", date=startTime_p, workoutType=type_p
+            ),
+            type_p,
         )
 
     except TypeError:
         return None
 
-    patient = PatientModels.Patient.query.filter_by(id=patientId).first()
-    trainingZoneHeartrate = patient.training_zone_of_date(
-        unit="HEARTRATE", date=startTime_p, workoutType=type_p
-    )
-    trainingZoneSpeed = patient.training_zone_of_date(
-        unit="SPEED", date=startTime_p, workoutType=type_p
-    )
-
     workoutContent = {
         "appleUUID": apple_uuid,
-        "patientId": patientId,
+        "patientId": patient.id,
         "type": type_p,
         "startTime": startTime_p,
         "endTime": endTime_p,
@@ -80,94 +145,226 @@ def create_workout(workout_json, patientId, patch=False):
         "speedAvg": speedAvg_p,
         "speedMin": speedMin_p,
         "speedMax": speedMax_p,
-        "paceMin": paceMin_p,
-        "paceMax": paceMax_p,
+        **{
+            f"{columns.value_key}Samples": encode_sample_columns(
+                columns.seconds_since_start, columns.values, columns.value_key
+            )
+            for columns in stream_columns
+        },
+        "samplePyramid": encode_pyramid(
+            dict(zip(("heartRate", "speed", "altitude", "distance"), sample_columns))
+        ),
+        **derivedMetrics,
+    }
+    return workoutContent
+
+
+def derived_metrics(
+    sample_columns,
+    startTime,
+    endTime,
+    trainingZoneHeartrate,
+    trainingZoneSpeed,
+    workoutType,
+):
+    """The columns of a workout derived from its heart rate, speed, altitude & distance columns and training zones
+
+    The training zones are counted on the combined profile, which always has the same sample rate (10s) to ensure
+    percentage comparability. The kilometre splits are taken from the distance samples themselves.
+    """
+    heart_rate_columns, speed_columns, _, distance_columns = sample_columns
+    combined_profile = combine_sample_columns(10, *sample_columns, startTime, endTime)
+    kilometer_pace, paceMin, paceMax = get_splits(
+        distance_columns, heart_rate_columns, speed_columns
+    )
+    return {
+        "paceMin": paceMin,
+        "paceMax": paceMax,
         "trainingZones": str.encode(
             json.dumps(
                 {
                     "heartRate": get_training_zones(
-                        trainingZoneHeartrate, combined_profile, type_p, "heartRate"
+                        trainingZoneHeartrate,
+                        combined_profile,
+                        workoutType,
+                        "heartRate",
                     ),
                     "speed": get_training_zones(
-                        trainingZoneSpeed, combined_profile, type_p, "speed"
+                        trainingZoneSpeed, combined_profile, workoutType, "speed"
                     ),
                 }
             )
         ),
-        "heartRateSamples": str.encode(json.dumps(heartRate_samples_p)),
-        "speedSamples": str.encode(json.dumps(speed_samples_p)),
-        "altitudeSamples": str.encode(json.dumps(altitude_samples_p)),
-        "distanceSamples": str.encode(json.dumps(distance_samples_p)),
-        "kilometerPace": str.encode(json.dumps(kilometer_pace_p)),
+        "kilometerPace": str.encode(json.dumps(kilometer_pace)),
     }
 
-    existing_workout = Workout.query.filter_by(
-        appleUUID=apple_uuid, patientId=patientId
-    ).first()
 
-    if patch:
-        if existing_workout is None:
-            return None
-        existing_workout.update(**workoutContent)
-        return existing_workout
-    else:
-        if existing_workout is not None:
-            return existing_workout
-        workout = Workout.create(**workoutContent)
-        RawWorkout.create(
-            workoutId=workout.id, healthKitJson=str.encode(json.dumps(workout_json))
+def recompute_derived_metrics(arguments):
+    """Re-derive the derived columns of a stored workout from its encoded samples, None if they can't be evaluated
+
+    Runs in the processes of the recompute pool, so it only gets & returns picklable values.
+    """
+    (
+        samples,
+        startTime,
+        endTime,
+        trainingZoneHeartrate,
+        trainingZoneSpeed,
+        workoutType,
+    ) = arguments
+    try:
+        sample_columns = [
+            decode_sample_columns(blob, value_key)
+            for blob, value_key in zip(
+                samples, ("heartRate", "speed", "altitude", "distance")
+            )
+        ]
+        return derived_metrics(
+            sample_columns,
+            startTime,
+            endTime,
+            trainingZoneHeartrate,
+            trainingZoneSpeed,
+            workoutType,
         )
-        return workout
+    except (TypeError, ValueError):
+        return None
+
+
+class InlineExecutor:
+    """Executor which does the work in the current process, used instead of a pool of one process"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
+
+
+def recompute_query(patientIds, fromDate=None, toDate=None):
+    """The workouts of the patients which started in the date range, including its last day"""
+    query = Workout.query.filter(Workout.patientId.in_(patientIds))
+    if fromDate is not None:
+        query = query.filter(Workout.startTime >= force_to_date(fromDate))
+    if toDate is not None:
+        query = query.filter(
+            Workout.startTime < force_to_date(toDate) + dt.timedelta(days=1)
+        )
+    return query
+
+
+@log_enter_and_exit
+def recompute_workouts(query, cursor=0, batch_size=100, processes=1, on_batch=None):
+    """Re-derive training zones, kilometre paces & min/max paces of the workouts of a query, e.g. after zones changed
+
+    The workouts are streamed in batches ordered by id, starting after the workout id cursor. The CPU work of a
+    batch is fanned out to a pool of processes. Each batch is committed on its own, on_batch(cursor, recomputed,
+    failed) is called with the counts of the batch right before, so a caller can commit its progress along with it.
+    Returns the amounts of recomputed & failed workouts.
+    """
+    recomputed = failed = 0
+    trainingZoneIndexes = {}
+    executor = InlineExecutor() if processes <= 1 else ProcessPoolExecutor(processes)
+    with executor:
+        while True:
+            workouts = (
+                query.filter(Workout.id > cursor)
+                .options(undefer_group(SAMPLES_GROUP))
+                .order_by(Workout.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not workouts:
+                return recomputed, failed
+            arguments = []
+            for workout in workouts:
+                if workout.patientId not in trainingZoneIndexes:
+                    trainingZoneIndexes[
+                        workout.patientId
+                    ] = PatientModels.TrainingZoneIndex.of_patient(workout.patientId)
+                trainingZones = trainingZoneIndexes[workout.patientId]
+                arguments.append(
+                    (
+                        (
+                            workout.heartRateSamples,
+                            workout.speedSamples,
+                            workout.altitudeSamples,
+                            workout.distanceSamples,
+                        ),
+                        workout.startTime,
+                        workout.endTime,
+                        trainingZones.zone_of_date(
+                            unit="HEARTRATE",
+                            date=workout.startTime,
+                            workoutType=workout.type,
+                        ),
+                        trainingZones.zone_of_date(
+                            unit="SPEED",
+                            date=workout.startTime,
+                            workoutType=workout.type,
+                        ),
+                        workout.type,
+                    )
+                )
+            batchRecomputed = batchFailed = 0
+            chunksize = max(1, len(workouts) // (4 * processes))
+            for workout, derivedMetrics in zip(
+                workouts,
+                executor.map(recompute_derived_metrics, arguments, chunksize=chunksize),
+            ):
+                if derivedMetrics is None:
+                    batchFailed += 1
+                    continue
+                workout.update(commit=False, **derivedMetrics).save(commit=False)
+                batchRecomputed += 1
+            cursor = workouts[-1].id
+            if on_batch is not None:
+                on_batch(cursor, batchRecomputed, batchFailed)
+            db.session.commit()
+            recomputed += batchRecomputed
+            failed += batchFailed
 
 
 @log_enter_and_exit
 def get_training_zones(patientTrainingZone, combined_profile, workoutType, unit):
-    """Calculate amount of samples in training zones"""
+    """Calculate amount of samples in training zones
+
+    Values on a bound belong to the upper zone, samples without a value only count towards the total.
+    """
     if patientTrainingZone is None:
         return None
-    total = len(combined_profile)
-    zone0count = 0
-    zone1count = 0
-    zone2count = 0
-    zone3count = 0
-    zone4count = 0
-
-    for sample in combined_profile:
-        value = sample[unit]
-        if value is not None:
-            if patientTrainingZone is not None:
-                if value < patientTrainingZone.upper0Bound:
-                    zone0count += 1
-                if (
-                    patientTrainingZone.upper0Bound
-                    <= value
-                    < patientTrainingZone.upper1Bound
-                ):
-                    zone1count += 1
-                if (
-                    patientTrainingZone.upper1Bound
-                    <= value
-                    < patientTrainingZone.upper2Bound
-                ):
-                    zone2count += 1
-                if (
-                    patientTrainingZone.upper2Bound
-                    <= value
-                    < patientTrainingZone.upper3Bound
-                ):
-                    zone3count += 1
-                if value > patientTrainingZone.upper3Bound:
-                    zone4count += 1
+    values = np.array([sample[unit] for sample in combined_profile], dtype=float)
+    counts = zone_counts(
+        values[~np.isnan(values)],
+        [
+            patientTrainingZone.upper0Bound,
+            patientTrainingZone.upper1Bound,
+            patientTrainingZone.upper2Bound,
+            patientTrainingZone.upper3Bound,
+        ],
+    )
     return {
-        "total": total,
-        "zone0": zone0count,
-        "zone1": zone1count,
-        "zone2": zone2count,
-        "zone3": zone3count,
-        "zone4": zone4count,
+        "total": len(combined_profile),
+        **{f"zone{zone}": int(count) for zone, count in enumerate(counts)},
     }
 
 
+def zone_counts(values, bounds):
+    """Count the values per zone, zone n reaches from the bound n - 1 (inclusive) to the bound n (exclusive)"""
+    if np.all(np.diff(bounds) >= 0):
+        return np.bincount(np.digitize(values, bounds), minlength=len(bounds) + 1)
+    # Misconfigured, overlapping zones: a value is counted in every zone which contains it
+    lower = [-np.inf, *bounds]
+    upper = [*bounds, np.inf]
+    return [
+        np.count_nonzero((lower[zone] <= values) & (values < upper[zone]))
+        for zone in range(len(bounds) + 1)
+    ]
+
+
 @log_enter_and_exit
 def get_combined_profile(
     sample_period,
@@ -182,77 +379,251 @@ def get_combined_profile(
     """Calculate the combined profile from an already finished workout or lists of the respective samples"""
     try:
         if workout is not None:
-            heart_rate_profile = workout.heartRateSamples_data
-            speed_profile = workout.speedSamples_data
-            altitude_profile = workout.altitudeSamples_data
-            distance_profile = workout.distanceSamples_data
+            heart_rate_columns = workout.heartRateSamples_columns
+            speed_columns = workout.speedSamples_columns
+            altitude_columns = workout.altitudeSamples_columns
+            distance_columns = workout.distanceSamples_columns
             startTime = workout.startTime
             endTime = workout.endTime
+        else:
+            heart_rate_columns = get_profile_columns(heart_rate_profile, "heartRate")
+            speed_columns = get_profile_columns(speed_profile, "speed")
+            altitude_columns = get_profile_columns(altitude_profile, "altitude")
+            distance_columns = get_profile_columns(distance_profile, "distance")
+        return combine_sample_columns(
+            sample_period,
+            heart_rate_columns,
+            speed_columns,
+            altitude_columns,
+            distance_columns,
+            startTime,
+            endTime,
+        )
+    except (TypeError, JSONDecodeError):
+        return None
 
-        heart_rate_pointer = 0
-        speed_pointer = 0
-        altitude_pointer = 0
-        distance_pointer = 0
-
-        result = []
-        total_samples = math.ceil((endTime - startTime).seconds / sample_period)
-        first_sample_time_offset = 0
-        if len(distance_profile) > 0 and distance_profile[0]["distance"] < 200:
-            first_sample_time_offset = distance_profile[0]["seconds_since_start"]
-        current_lower_bound = first_sample_time_offset
-        for i in range(total_samples - 1):
-            current_upper_bound = current_lower_bound + sample_period
-            bpm = None
-            kmh = None
-            m_above_sea = None
-            distance = None
-
-            if len(heart_rate_profile) > 0:
-                bpm, heart_rate_pointer = get_value_for_interval(
-                    heart_rate_profile,
-                    heart_rate_pointer,
-                    "heartRate",
-                    current_lower_bound,
-                    current_upper_bound,
-                )
-            if len(speed_profile) > 0:
-                kmh, speed_pointer = get_value_for_interval(
-                    speed_profile,
-                    speed_pointer,
-                    "speed",
-                    current_lower_bound,
-                    current_upper_bound,
-                )
-            if len(altitude_profile) > 0:
-                m_above_sea, altitude_pointer = get_value_for_interval(
-                    altitude_profile,
-                    altitude_pointer,
-                    "altitude",
-                    current_lower_bound,
-                    current_upper_bound,
-                )
-            if len(distance_profile) > 0:
-                distance, distance_pointer = get_value_for_interval(
-                    distance_profile,
-                    distance_pointer,
-                    "distance",
-                    current_lower_bound,
-                    current_upper_bound,
-                )
 
-            result.append(
-                {
-                    "heartRate": bpm,
-                    "speed": kmh,
-                    "altitude": m_above_sea,
-                    "distance": distance,
-                    "secondsSinceStart": current_lower_bound - first_sample_time_offset,
-                }
+def combine_sample_columns(
+    sample_period,
+    heart_rate_columns,
+    speed_columns,
+    altitude_columns,
+    distance_columns,
+    startTime,
+    endTime,
+):
+    """Resample the (times, values) columns of the samples of a workout to the combined profile"""
+    total_samples = math.ceil((endTime - startTime).seconds / sample_period)
+    first_sample_time_offset = 0
+    distance_times, distances = distance_columns
+    if len(distances) > 0 and distances[0] < 200:
+        first_sample_time_offset = float(distance_times[0])
+    if total_samples - 1 <= 0:
+        return []
+
+    # Interval bounds are accumulated step by step (instead of offset + i * sample_period) to get exactly the
+    # same floating point bounds as an iteratively advanced interval
+    interval_bounds = np.cumsum(
+        np.concatenate(
+            (
+                [float(first_sample_time_offset)],
+                np.full(total_samples - 1, float(sample_period)),
             )
-            current_lower_bound = current_upper_bound
-        return result
-    except (TypeError, JSONDecodeError):
+        )
+    )
+    bpm = resample_columns(*heart_rate_columns, interval_bounds)
+    kmh = resample_columns(*speed_columns, interval_bounds)
+    m_above_sea = resample_columns(*altitude_columns, interval_bounds)
+    distance = resample_columns(*distance_columns, interval_bounds)
+    seconds = (interval_bounds[:-1] - first_sample_time_offset).tolist()
+
+    return [
+        {
+            "heartRate": values[0],
+            "speed": values[1],
+            "altitude": values[2],
+            "distance": values[3],
+            "secondsSinceStart": values[4],
+        }
+        for values in zip(bpm, kmh, m_above_sea, distance, seconds)
+    ]
+
+
+def workout_cache_key(workout):
+    """Identifies the content of a workout, a changed, patched or recreated (reused id) workout has a new key
+
+    Nothing has to be invalidated, cached items of outdated keys are evicted as the least recently used ones.
+    """
+    created = workout.createdAt.isoformat() if workout.createdAt is not None else ""
+    return f"{workout.id}/{created}/{workout.revision}"
+
+
+def combined_profile_cache_key(workout, sample_period):
+    return f"combinedProfile/{workout_cache_key(workout)}/{sample_period}"
+
+
+def segment_index_cache_key(workout, heartRateZoneBounds, speedZoneBounds):
+    return f"segmentIndex/{workout_cache_key(workout)}/{heartRateZoneBounds}/{speedZoneBounds}"
+
+
+def load_samples(workout):
+    """Load the deferred sample columns of a workout explicitly, in one query, unless they are loaded already"""
+    if "heartRateSamples" not in inspect(workout).unloaded:
+        return workout
+    return (
+        Workout.query.options(undefer_group(SAMPLES_GROUP))
+        .populate_existing()
+        .filter_by(id=workout.id)
+        .one()
+    )
+
+
+def get_cached_combined_profile(sample_period, workout):
+    """Calculate the combined profile of a finished workout, cached per workout revision and sample period"""
+    key = combined_profile_cache_key(workout, sample_period)
+    combined_profile = cache.get(key)
+    if combined_profile is None:
+        combined_profile = get_combined_profile(
+            sample_period, workout=load_samples(workout)
+        )
+        if combined_profile is not None:
+            cache.set(key, combined_profile, timeout=0)
+    return combined_profile
+
+
+def zone_bounds(patientTrainingZone):
+    if patientTrainingZone is None:
         return None
+    return (
+        patientTrainingZone.upper0Bound,
+        patientTrainingZone.upper1Bound,
+        patientTrainingZone.upper2Bound,
+        patientTrainingZone.upper3Bound,
+    )
+
+
+def get_cached_segment_index(workout):
+    """Build the segment index of a finished workout, cached per workout revision and training zones in effect"""
+    heartRateZoneBounds, speedZoneBounds = (
+        zone_bounds(
+            workout.patient.training_zone_of_date(unit, workout.startTime, workout.type)
+        )
+        for unit in ("HEARTRATE", "SPEED")
+    )
+    key = segment_index_cache_key(workout, heartRateZoneBounds, speedZoneBounds)
+    segmentIndex = segment_indexes.get(key)
+    if segmentIndex is None:
+        segmentIndex = SegmentIndex(
+            workout.heartRateSamples_columns,
+            workout.speedSamples_columns,
+            workout.altitudeSamples_columns,
+            heartRateZoneBounds,
+            speedZoneBounds,
+        )
+        segment_indexes.set(key, segmentIndex)
+    return segmentIndex
+
+
+def get_downsampled_profiles(max_points, workout):
+    """The samples of a finished workout with at most max_points points per stream, from its stored pyramid"""
+    pyramid = workout.samplePyramid_data
+    if not pyramid:
+        # Workouts stored without a pyramid are downsampled on the fly
+        workout = load_samples(workout)
+        pyramid = {
+            "heartRate": build_pyramid(*workout.heartRateSamples_columns),
+            "speed": build_pyramid(*workout.speedSamples_columns),
+            "altitude": build_pyramid(*workout.altitudeSamples_columns),
+            "distance": build_pyramid(*workout.distanceSamples_columns),
+        }
+    profiles = {}
+    for value_key, levels in pyramid.items():
+        times, values = select_level(levels, max_points)
+        profiles[value_key] = {"times": times.tolist(), "values": values.tolist()}
+    return profiles
+
+
+def get_profile_columns(profile, value_key):
+    """Splits a list of sample dicts into an array of times & one of values"""
+    times = np.fromiter(
+        (sample["seconds_since_start"] for sample in profile), float, len(profile)
+    )
+    values = np.fromiter((sample[value_key] for sample in profile), float, len(profile))
+    return times, values
+
+
+def resample_columns(times, values, interval_bounds):
+    """Resamples samples to one value per interval [interval_bounds[i], interval_bounds[i + 1])
+
+    Samples inside an interval are averaged. An interval without samples is interpolated from the neighbouring
+    samples, after the last sample the last value is repeated. Equivalent to advancing get_value_for_interval over
+    all intervals, but vectorized.
+    """
+    interval_count = len(interval_bounds) - 1
+    if len(times) == 0:
+        return [None] * interval_count
+    if np.any(times[1:] < times[:-1]):
+        return _resample_unsorted_columns(times, values, interval_bounds)
+
+    lower = interval_bounds[:-1]
+    upper = interval_bounds[1:]
+    first_at_lower = np.searchsorted(times, lower, side="left")
+    after_lower = np.searchsorted(times, lower, side="right")
+    first_at_upper = np.searchsorted(times, upper, side="left")
+    after_upper = np.searchsorted(times, upper, side="right")
+
+    # A sample lying exactly on the lower bound only belongs to the interval if the previous interval contained
+    # samples as well, otherwise the interpolation of the previous interval already moved past it
+    has_inner_samples = first_at_upper > after_lower
+    only_bound_samples = (first_at_upper > first_at_lower) & ~has_inner_samples
+    decided = ~only_bound_samples
+    decided[0] = True
+    averaged = has_inner_samples.copy()
+    averaged[0] = first_at_upper[0] > first_at_lower[0]
+    decided_index = np.maximum.accumulate(
+        np.where(decided, np.arange(interval_count), 0)
+    )
+    averaged = averaged[decided_index]
+    previous_averaged = np.concatenate(([True], averaged[:-1]))
+    first = np.where(previous_averaged, first_at_lower, after_lower)
+
+    result = np.empty(interval_count)
+
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    averaged_first = first[averaged]
+    averaged_last = first_at_upper[averaged]
+    result[averaged] = (value_sums[averaged_last] - value_sums[averaged_first]) / (
+        averaged_last - averaged_first
+    )
+
+    interpolated = ~averaged & (after_upper < len(times))
+    next_index = after_upper[interpolated]
+    previous_index = next_index - 1
+    previous_times = np.where(previous_index >= 0, times[previous_index], 0.0)
+    previous_values = np.where(previous_index >= 0, values[previous_index], 0.0)
+    result[interpolated] = previous_values + (
+        (lower[interpolated] - previous_times) / (times[next_index] - previous_times)
+    ) * (values[next_index] - previous_values)
+
+    result[~averaged & ~interpolated] = values[-1]
+    return result.tolist()
+
+
+def _resample_unsorted_columns(times, values, interval_bounds):
+    """Resamples samples which are not ordered by time by advancing get_value_for_interval over all intervals"""
+    value_key = "value"
+    profile = [
+        {value_key: value, "seconds_since_start": seconds}
+        for value, seconds in zip(values.tolist(), times.tolist())
+    ]
+    pointer = 0
+    result = []
+    for lower_bound, upper_bound in zip(interval_bounds[:-1], interval_bounds[1:]):
+        value, pointer = get_value_for_interval(
+            profile, pointer, value_key, lower_bound, upper_bound
+        )
+        result.append(value)
+    return result
 
 
 def get_value_for_interval(
@@ -306,116 +677,91 @@ def interpolate_samples(
 
 
 @log_enter_and_exit
-def get_kilometre_wise_pace(combined_profile):
-    """Calculates duration and avg/max values for speed & heart rate per kilometer"""
-    list_size = len(combined_profile)
-
-    sample_rate = 10  # sample rate used to calculate combined_profile
-
-    current_time_sum = 0
-    current_heart_rate_sum = None
-    max_heart_rate = None
-    currentSpeed_sum = None
-    maxSpeed = None
-
-    kilometer_pace_list = []
-
-    if list_size == 0 or combined_profile[0]["distance"] is None:
+def get_splits(distance_columns, heart_rate_columns, speed_columns, split_length=1000):
+    """Splits a workout every split_length metres of its cumulative distance samples
+
+    The time a split boundary is crossed is interpolated between the surrounding distance samples, the last split
+    holds the remaining distance. The heart rate & speed statistics of a split are taken from the samples recorded
+    during the split, so all splits together cost O(n). Returns the splits & the fastest and slowest pace (seconds
+    per kilometre).
+    """
+    times, distances = sorted_columns(*distance_columns)
+    if len(distances) == 0:
+        return [], 0, 0
+    # The distance is accumulated from the start of the first sample on
+    times = np.concatenate(([0.0], times))
+    distances = np.concatenate(([0.0], np.maximum.accumulate(distances)))
+    total_distance = distances[-1]
+    full_splits = math.floor(total_distance / split_length)
+
+    bounds = np.arange(1, full_splits + 1) * float(split_length)
+    after = np.searchsorted(distances, bounds, side="left")
+    before = after - 1
+    crossing_times = times[before] + (bounds - distances[before]) / (
+        distances[after] - distances[before]
+    ) * (times[after] - times[before])
+    edges = np.concatenate(([0.0], crossing_times))
+    lengths = np.full(full_splits, float(split_length))
+    if total_distance > full_splits * split_length:
+        edges = np.append(edges, times[-1])
+        lengths = np.append(lengths, total_distance - full_splits * split_length)
+    if len(lengths) == 0:
         return [], 0, 0
 
-    old_distance = 0
-    samples_in_kilometre_counter = 0
-    distance = combined_profile[0]["distance"]
-
-    for index in range(list_size):
-        sample = combined_profile[index]
-        distance = sample["distance"]
-        if distance < (len(kilometer_pace_list) + 1) * 1000:
-            samples_in_kilometre_counter += 1
-            current_time_sum += sample_rate
-            if sample["heartRate"] is not None:
-                if current_heart_rate_sum is None:
-                    current_heart_rate_sum = sample["heartRate"]
-                    max_heart_rate = sample["heartRate"]
-                else:
-                    current_heart_rate_sum += sample["heartRate"]
-                    if max_heart_rate < sample["heartRate"]:
-                        max_heart_rate = sample["heartRate"]
-            if sample["speed"] is not None:
-                if currentSpeed_sum is None:
-                    currentSpeed_sum = sample["speed"]
-                    maxSpeed = sample["speed"]
-                else:
-                    currentSpeed_sum += sample["speed"]
-                    if maxSpeed < sample["speed"]:
-                        maxSpeed = sample["speed"]
-        else:
-            overhead = distance - (len(kilometer_pace_list) + 1) * 1000
-            percentage_overhead = overhead / (distance - old_distance)
-            current_time_sum += sample_rate * (1 - percentage_overhead)
-            if current_heart_rate_sum is None:
-                avg_heart_rate = None
-            else:
-                avg_heart_rate = current_heart_rate_sum / samples_in_kilometre_counter
-
-            if currentSpeed_sum is None:
-                avgSpeed = None
-            else:
-                avgSpeed = currentSpeed_sum / samples_in_kilometre_counter
-
-            kilometer = KilometerPace(current_time_sum, distance)
-            kilometer_pace_list.append(
-                {
-                    "kilometre": len(kilometer_pace_list) + 1,
-                    "minutes": kilometer.minutes,
-                    "seconds": force_to_float(kilometer.seconds),
-                    "avgHeartRate": force_to_float(avg_heart_rate),
-                    "maxHeartRate": force_to_float(max_heart_rate),
-                    "avgSpeed": force_to_float(avgSpeed),
-                    "maxSpeed": force_to_float(maxSpeed),
-                }
-            )
-            current_time_sum += sample_rate * percentage_overhead
-            current_heart_rate_sum = None
-            max_heart_rate = 0
-            currentSpeed_sum = None
-            maxSpeed = 0
-            samples_in_kilometre_counter = 0
-
-        old_distance = distance
-
-    if current_heart_rate_sum is None:
-        avg_heart_rate = None
-    else:
-        avg_heart_rate = current_heart_rate_sum / samples_in_kilometre_counter
-
-    if currentSpeed_sum is None:
-        avgSpeed = None
-    else:
-        avgSpeed = currentSpeed_sum / samples_in_kilometre_counter
-
-    last_kilometer = KilometerPace(current_time_sum, distance)
-    kilometer_pace_list.append(
-        {
-            "kilometre": len(kilometer_pace_list) + 1,
-            "avgHeartRate": force_to_float(avg_heart_rate),
-            "maxHeartRate": force_to_float(max_heart_rate),
-            "avgSpeed": force_to_float(avgSpeed),
-            "maxSpeed": force_to_float(maxSpeed),
-            "minutes": last_kilometer.minutes,
-            "seconds": force_to_float(last_kilometer.seconds),
-        }
+    paces = np.diff(edges) / (lengths / 1000)
+    avgHeartRates, maxHeartRates = split_statistics(heart_rate_columns, edges)
+    avgSpeeds, maxSpeeds = split_statistics(speed_columns, edges)
+    splits = []
+    for index, pace in enumerate(paces.tolist()):
+        kilometer = KilometerPace(pace, 1000)
+        splits.append(
+            {
+                "kilometre": index + 1,
+                "minutes": kilometer.minutes,
+                "seconds": force_to_float(kilometer.seconds),
+                "avgHeartRate": avgHeartRates[index],
+                "maxHeartRate": maxHeartRates[index],
+                "avgSpeed": avgSpeeds[index],
+                "maxSpeed": maxSpeeds[index],
+            }
+        )
+    return splits, float(paces.min()), float(paces.max())
+
+
+def sorted_columns(times, values):
+    """The (times, values) columns of samples as float arrays, ordered by time"""
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        return times[order], values[order]
+    return times, values
+
+
+def split_statistics(columns, edges):
+    """Average & maximum of the samples in each split [edges[i], edges[i + 1]), None for splits without samples
+
+    The end of the last split is inclusive. Averages are taken from prefix sums of the values.
+    """
+    times, values = sorted_columns(*columns)
+    indices = np.searchsorted(times, edges, side="left")
+    indices[-1] = np.searchsorted(times, edges[-1], side="right")
+    starts = indices[:-1]
+    counts = np.diff(indices)
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    recorded = counts > 0
+    averages = np.full(len(counts), np.nan)
+    averages[recorded] = (
+        value_sums[indices[1:][recorded]] - value_sums[starts[recorded]]
+    ) / counts[recorded]
+    maxima = np.full(len(counts), np.nan)
+    if np.any(recorded):
+        # Splits without samples are skipped, so each reduction ends where the next recorded split starts
+        maxima[recorded] = np.maximum.reduceat(values[: indices[-1]], starts[recorded])
+    return (
+        [None if np.isnan(value) else value for value in averages.tolist()],
+        [None if np.isnan(value) else value for value in maxima.tolist()],
     )
-    paceMin = None
-    paceMax = None
-    for sample in kilometer_pace_list:
-        seconds = sample["seconds"] + sample["minutes"] * 60
-        if paceMin is None or paceMin > seconds:
-            paceMin = seconds
-        if paceMax is None or paceMax < seconds:
-            paceMax = seconds
-
-    return kilometer_pace_list, paceMin, paceMax
 
 
 class KilometerPace:
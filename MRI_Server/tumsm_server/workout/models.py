@@ -1,13 +1,33 @@
+import datetime as dt
 import json
 
-from tumsm_server.database import Column, PkModel, db, reference_col, relationship
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import deferred
+
+from tumsm_server.database import (
+    Column,
+    PkModel,
+    db,
+    increment_revisions,
+    reference_col,
+    relationship,
+)
 from tumsm_server.utils import log_enter_and_exit
+from tumsm_server.workout.downsampling import decode_pyramid
+from tumsm_server.workout.sampleEncoding import decode_sample_columns, decode_samples
+
+# Deferred column group of the sample blobs of a workout
+SAMPLES_GROUP = "samples"
 
 
 class Workout(PkModel):
     """Workout of an patient"""
 
     __tablename__ = "workouts"
+    __table_args__ = (
+        db.Index("ix_workouts_patientId_startTime", "patientId", "startTime"),
+        db.Index("ix_workouts_appleUUID_patientId", "appleUUID", "patientId"),
+    )
     appleUUID = Column(db.String(50), nullable=False, default="")
     patientId = reference_col("patients", nullable=False)
     type = Column(db.Integer, nullable=False)
@@ -27,38 +47,86 @@ class Workout(PkModel):
     paceMin = Column(db.Float(decimal_return_scale=3), nullable=True)
     paceMax = Column(db.Float(decimal_return_scale=3), nullable=True)
     trainingZones = Column(db.LargeBinary, nullable=True)
-    heartRateSamples = Column(db.LargeBinary, nullable=True)
-    speedSamples = Column(db.LargeBinary, nullable=True)
-    altitudeSamples = Column(db.LargeBinary, nullable=True)
-    distanceSamples = Column(db.LargeBinary, nullable=True)
+    # The samples are only loaded when accessed, lists of workouts don't need them
+    heartRateSamples = deferred(
+        Column(db.LargeBinary, nullable=True), group=SAMPLES_GROUP
+    )
+    speedSamples = deferred(Column(db.LargeBinary, nullable=True), group=SAMPLES_GROUP)
+    altitudeSamples = deferred(
+        Column(db.LargeBinary, nullable=True), group=SAMPLES_GROUP
+    )
+    distanceSamples = deferred(
+        Column(db.LargeBinary, nullable=True), group=SAMPLES_GROUP
+    )
+    # Downsampled levels of the samples for charts, loaded without the samples themselves
+    samplePyramid = deferred(Column(db.LargeBinary, nullable=True))
     kilometerPace = Column(db.LargeBinary, nullable=True)
-
-    ratings = relationship("WorkoutRating", cascade="all,delete", backref="workout")
+    # Incremented whenever the workout or one of its ratings changes
+    revision = Column(db.Integer, nullable=False, default=1, server_default="1")
+    # Tells apart workouts which reuse the id of a deleted workout, None for workouts created before it existed
+    createdAt = Column(db.DateTime, nullable=True, default=dt.datetime.utcnow)
+
+    ratings = relationship(
+        "WorkoutRating",
+        cascade="all,delete",
+        backref="workout",
+        order_by="WorkoutRating.id",
+    )
+    # The latest rating is the one with the highest id, i.e. there is no newer rating of the workout
+    latestRating = relationship(
+        "WorkoutRating",
+        primaryjoin=lambda: and_(
+            WorkoutRating.workoutId == Workout.id,
+            ~exists().where(
+                and_(
+                    newerWorkoutRatings.c.workoutId == WorkoutRating.workoutId,
+                    newerWorkoutRatings.c.id > WorkoutRating.id,
+                )
+            ),
+        ),
+        uselist=False,
+        viewonly=True,
+    )
     rawJson = relationship("RawWorkout", cascade="all,delete", backref="workout")
+    summary = relationship(
+        "WorkoutSummary", cascade="all,delete", uselist=False, backref="workout"
+    )
 
     @log_enter_and_exit
     def __init__(self, **kwargs):
         """Create instance."""
         super().__init__(**kwargs)
 
+    def save(self, commit=True):
+        """Save the record and keep its summary up to date."""
+        self.add_revised()
+        WorkoutSummary.refresh(self)
+        if commit:
+            db.session.commit()
+        return self
+
+    def revised_records(self):
+        """The patient changes with this record."""
+        return [self.patient]
+
     def __str__(self):
         """Represent instance as a unique string."""
         return f"<Workout({self.patient.account.full_name} - {self.startTime.strftime('%d/%m/%Y, %H:%M:%S')})>"
 
     def rating(self):
-        if len(self.ratings) == 0:
+        if self.latestRating is None:
             return -1
-        return self.ratings[-1].rating
+        return self.latestRating.rating
 
     def intensity(self):
-        if len(self.ratings) == 0:
+        if self.latestRating is None:
             return -1
-        return self.ratings[-1].intensity
+        return self.latestRating.intensity
 
     def comment(self):
-        if len(self.ratings) == 0:
+        if self.latestRating is None:
             return ""
-        return self.ratings[-1].comment
+        return self.latestRating.comment
 
     def mainHeartRate_segment(self):
         training_zones = self.trainingZones_data
@@ -96,35 +164,41 @@ class Workout(PkModel):
 
     @property
     def heartRateSamples_data(self):
-        if self.heartRateSamples is not None:
-            data = json.loads(self.heartRateSamples.decode())
-            if data is not None:
-                return data
-        return []
+        return decode_samples(self.heartRateSamples, "heartRate")
+
+    @property
+    def heartRateSamples_columns(self):
+        return decode_sample_columns(self.heartRateSamples, "heartRate")
 
     @property
     def speedSamples_data(self):
-        if self.speedSamples is not None:
-            data = json.loads(self.speedSamples.decode())
-            if data is not None:
-                return data
-        return []
+        return decode_samples(self.speedSamples, "speed")
+
+    @property
+    def speedSamples_columns(self):
+        return decode_sample_columns(self.speedSamples, "speed")
 
     @property
     def altitudeSamples_data(self):
-        if self.altitudeSamples is not None:
-            data = json.loads(self.altitudeSamples.decode())
-            if data is not None:
-                return data
-        return []
+        return decode_samples(self.altitudeSamples, "altitude")
+
+    @property
+    def altitudeSamples_columns(self):
+        return decode_sample_columns(self.altitudeSamples, "altitude")
 
     @property
     def distanceSamples_data(self):
-        if self.distanceSamples is not None:
-            data = json.loads(self.distanceSamples.decode())
-            if data is not None:
-                return data
-        return []
+        return decode_samples(self.distanceSamples, "distance")
+
+    @property
+    def distanceSamples_columns(self):
+        return decode_sample_columns(self.distanceSamples, "distance")
+
+    @property
+    def samplePyramid_data(self):
+        if self.samplePyramid is not None:
+            return decode_pyramid(self.samplePyramid)
+        return {}
 
     @property
     def kilometerPace_data(self):
@@ -169,6 +243,7 @@ class WorkoutRating(PkModel):
     """Rating of a workout"""
 
     __tablename__ = "workoutRatings"
+    __table_args__ = (db.Index("ix_workoutRatings_workoutId_id", "workoutId", "id"),)
     workoutId = reference_col("workouts", nullable=False)
     rating = Column(db.Integer, nullable=False)
     intensity = Column(db.Integer, nullable=False)
@@ -183,11 +258,92 @@ class WorkoutRating(PkModel):
         """Represent instance as a unique string."""
         return f"<WorkoutRating({self.workout.patient.account.full_name} - {self.rating} - {self.intensity})>"
 
+    def revised_records(self):
+        """The workout & its patient change with their ratings."""
+        return [self.workout, self.workout.patient]
+
+    def save(self, commit=True):
+        """Save the record and update the summary of the rated workout."""
+        self.add_revised()
+        WorkoutSummary.refresh(Workout.query.get(self.workoutId))
+        if commit:
+            db.session.commit()
+        return self
+
+    def delete(self, commit=True):
+        """Remove the record and update the summary of the rated workout."""
+        increment_revisions(self.revised_records())
+        db.session.delete(self)
+        db.session.flush()
+        workout = Workout.query.get(self.workoutId)
+        if workout is not None:
+            WorkoutSummary.refresh(workout)
+        return commit and db.session.commit()
+
+
+newerWorkoutRatings = WorkoutRating.__table__.alias("newerWorkoutRatings")
+
+
+class WorkoutSummary(PkModel):
+    """Precomputed aggregates of a workout, used for overviews without decoding the workout itself"""
+
+    __tablename__ = "workoutSummaries"
+    __table_args__ = (
+        db.Index("ix_workoutSummaries_patientId_startTime", "patientId", "startTime"),
+    )
+    workoutId = reference_col(
+        "workouts", nullable=False, column_kwargs={"unique": True}
+    )
+    patientId = reference_col("patients", nullable=False)
+    type = Column(db.Integer, nullable=False)
+    startTime = Column(db.DateTime, nullable=False)
+    duration = Column(db.Integer, nullable=False)  # In seconds
+    rating = Column(db.Integer, nullable=True)  # Latest rating, None if unrated
+    heartRateZoneTotal = Column(db.Integer, nullable=False, default=0)
+    heartRateZone0 = Column(db.Integer, nullable=False, default=0)
+    heartRateZone1 = Column(db.Integer, nullable=False, default=0)
+    heartRateZone2 = Column(db.Integer, nullable=False, default=0)
+    heartRateZone3 = Column(db.Integer, nullable=False, default=0)
+    heartRateZone4 = Column(db.Integer, nullable=False, default=0)
+
+    def __str__(self):
+        """Represent instance as a unique string."""
+        return f"<WorkoutSummary({self.workoutId})>"
+
+    @classmethod
+    def refresh(cls, workout):
+        """Recalculate the summary of a workout, the caller is responsible for committing"""
+        summary = cls.query.filter_by(workoutId=workout.id).first()
+        if summary is None:
+            summary = cls(workoutId=workout.id)
+        latest_rating = (
+            WorkoutRating.query.filter_by(workoutId=workout.id)
+            .order_by(WorkoutRating.id.desc())
+            .first()
+        )
+        heart_rate_zones = workout.trainingZones_data.get("heartRate") or {}
+        summary.update(
+            commit=False,
+            patientId=workout.patientId,
+            type=workout.type,
+            startTime=workout.startTime,
+            duration=workout.duration,
+            rating=latest_rating.rating if latest_rating is not None else None,
+            heartRateZoneTotal=heart_rate_zones.get("total", 0),
+            heartRateZone0=heart_rate_zones.get("zone0", 0),
+            heartRateZone1=heart_rate_zones.get("zone1", 0),
+            heartRateZone2=heart_rate_zones.get("zone2", 0),
+            heartRateZone3=heart_rate_zones.get("zone3", 0),
+            heartRateZone4=heart_rate_zones.get("zone4", 0),
+        )
+        return summary.save(commit=False)
+
 
 class Steps(PkModel):
     """Steps of an patient on one day"""
 
     __tablename__ = "steps"
+    __table_args__ = (db.Index("ix_steps_patientId_date", "patientId", "date"),)
     patientId = reference_col("patients", nullable=False)
     date = Column(db.Date, nullable=False)
     amount = Column(db.Integer, nullable=False)
@@ -197,6 +353,10 @@ class Steps(PkModel):
         """Create instance."""
         super().__init__(**kwargs)
 
+    def revised_records(self):
+        """The patient changes with this record."""
+        return [self.patient]
+
     def __str__(self):
         """Represent instance as a unique string."""
         return f"<Steps({self.patient.account.full_name} - {self.date.strftime('%d/%m/%Y')})>"
@@ -221,6 +381,13 @@ class RawWorkout(PkModel):
         """Create instance."""
         super().__init__(**kwargs)
 
+    @property
+    def healthKit(self):
+        """The uploaded healthkit object"""
+        data = json.loads(self.healthKitJson)
+        # Older uploads were stored as a JSON encoded healthkit string
+        return json.loads(data) if isinstance(data, str) else data
+
     def __str__(self):
         """Represent instance as a unique string."""
         return f"<RawWorkout({self.appleUUID})>"
@@ -0,0 +1,171 @@
+"""Compact binary encoding of the sample columns stored for a workout
+
+An encoded column starts with a small header (little endian)
+
+    magic "TSS" | version (B) | flags (B) | value type (c) | key length (B) | sample count (I) | value key (utf-8)
+
+followed by the (optionally zlib compressed) times & values of all samples. Times are stored as delta encoded
+microseconds since the start, which is lossless for timestamps parsed from healthkit, otherwise as float64. Values are
+stored as float32 whenever that is lossless, otherwise as float64.
+Columns written before this encoding existed contain a UTF-8 JSON list of sample dicts and are still decoded.
+"""
+import json
+import struct
+import zlib
+
+import numpy as np
+import sqlalchemy as sa
+
+MAGIC = b"TSS"
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_DELTA_TIMES = 0x02
+HEADER = struct.Struct("<3sBBcBI")
+
+# Sample columns of a workout and the value key of their samples
+SAMPLE_COLUMNS = {
+    "heartRateSamples": "heartRate",
+    "speedSamples": "speed",
+    "altitudeSamples": "altitude",
+    "distanceSamples": "distance",
+}
+
+
+class SampleEncodingError(ValueError):
+    """Raised when an encoded sample column can't be decoded"""
+
+
+def is_encoded(blob):
+    """Checks if a stored sample column uses the binary encoding"""
+    return blob is not None and bytes(blob[: len(MAGIC)]) == MAGIC
+
+
+def encode_samples(profile, value_key, compress=True):
+    """Encodes a list of sample dicts, like they are created by the healthkit data processor"""
+    times = np.fromiter(
+        (sample["seconds_since_start"] for sample in profile), float, len(profile)
+    )
+    values = np.fromiter((sample[value_key] for sample in profile), float, len(profile))
+    return encode_sample_columns(times, values, value_key, compress=compress)
+
+
+def encode_sample_columns(times, values, value_key, compress=True):
+    """Encodes the time & value columns of one sample stream"""
+    times = np.asarray(times, dtype="<f8")
+    values = np.asarray(values, dtype="<f8")
+    flags = 0
+
+    microseconds = np.round(times * 1e6).astype("<i8")
+    if np.array_equal(microseconds / 1e6, times):
+        flags |= FLAG_DELTA_TIMES
+        times_bytes = np.diff(microseconds, prepend=0).astype("<i8").tobytes()
+    else:
+        times_bytes = times.tobytes()
+
+    single_values = values.astype("<f4")
+    if np.array_equal(single_values.astype("<f8"), values, equal_nan=True):
+        value_type = b"f"
+        values_bytes = single_values.tobytes()
+    else:
+        value_type = b"d"
+        values_bytes = values.tobytes()
+
+    payload = times_bytes + values_bytes
+    if compress:
+        flags |= FLAG_ZLIB
+        payload = zlib.compress(payload)
+
+    key = value_key.encode()
+    header = HEADER.pack(MAGIC, VERSION, flags, value_type, len(key), len(values))
+    return header + key + payload
+
+
+def decode_sample_columns(blob, value_key):
+    """Decodes a stored sample column into a float64 array of times & one of values"""
+    if blob is None:
+        return np.empty(0), np.empty(0)
+    if not is_encoded(blob):
+        profile = json.loads(bytes(blob).decode())
+        if profile is None:
+            return np.empty(0), np.empty(0)
+        times = np.fromiter(
+            (sample["seconds_since_start"] for sample in profile), float, len(profile)
+        )
+        values = np.fromiter(
+            (sample[value_key] for sample in profile), float, len(profile)
+        )
+        return times, values
+
+    blob = bytes(blob)
+    try:
+        _, version, flags, value_type, key_length, count = HEADER.unpack_from(blob)
+    except struct.error as e:
+        raise SampleEncodingError(f"truncated sample header ({e})")
+    if version != VERSION:
+        raise SampleEncodingError(f"unknown sample encoding version {version}")
+    payload = blob[HEADER.size + key_length :]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+
+    if flags & FLAG_DELTA_TIMES:
+        times = np.cumsum(np.frombuffer(payload, dtype="<i8", count=count)) / 1e6
+    else:
+        times = np.frombuffer(payload, dtype="<f8", count=count).astype(float)
+    values = np.frombuffer(
+        payload,
+        dtype="<f4" if value_type == b"f" else "<f8",
+        count=count,
+        offset=count * 8,
+    ).astype(float)
+    return times, values
+
+
+def decode_samples(blob, value_key):
+    """Decodes a stored sample column into a list of sample dicts"""
+    if blob is not None and not is_encoded(blob):
+        profile = json.loads(bytes(blob).decode())
+        return profile if profile is not None else []
+    times, values = decode_sample_columns(blob, value_key)
+    return [
+        {value_key: value, "seconds_since_start": seconds}
+        for value, seconds in zip(values.tolist(), times.tolist())
+    ]
+
+
+workouts_table = sa.table(
+    "workouts", sa.column("id", sa.Integer), *[sa.column(c) for c in SAMPLE_COLUMNS]
+)
+
+
+def reencode_sample_batch(connection, after_id=0, batch_size=100, binary=True):
+    """Converts the sample columns of the next batch of workouts to the binary (or back to the JSON) encoding
+
+    Uses plain SQL expressions, so it can be used by migrations as well as by the application.
+    Returns the id of the last workout of the batch, or None if there are no more workouts.
+    """
+    rows = connection.execute(
+        sa.select(workouts_table)
+        .where(workouts_table.c.id > after_id)
+        .order_by(workouts_table.c.id)
+        .limit(batch_size)
+    ).fetchall()
+    for row in rows:
+        updated = {}
+        for column, value_key in SAMPLE_COLUMNS.items():
+            blob = row._mapping[column]
+            if blob is None or is_encoded(blob) == binary:
+                continue
+            profile = decode_samples(blob, value_key)
+            if binary:
+                updated[column] = encode_samples(profile, value_key)
+            else:
+                updated[column] = str.encode(json.dumps(profile))
+        if len(updated) > 0:
+            connection.execute(
+                workouts_table.update()
+                .where(workouts_table.c.id == row.id)
+                .values(**updated)
+            )
+    if len(rows) == 0:
+        return None
+    return rows[-1].id
@@ -0,0 +1,200 @@
+"""Indexes over the samples of a workout, answering statistics of arbitrary time windows without a rescan.
+
+Sums, time in zone & elevation changes are answered from prefix sums in O(log n) (a binary search for the window
+bounds), minima & maxima from sparse tables over blocks of samples in O(1) plus a scan of at most two partial blocks.
+"""
+import math
+
+import numpy as np
+
+# Samples per block of the range extrema, the sparse tables only hold one value per block
+BLOCK_SIZE = 32
+
+
+class RangeExtrema:
+    """Minimum & maximum of any index range of an array, without scanning the range"""
+
+    def __init__(self, values):
+        self.values = values
+        block_count = math.ceil(len(values) / BLOCK_SIZE)
+        blocks = np.pad(
+            values, (0, block_count * BLOCK_SIZE - len(values)), constant_values=np.nan
+        ).reshape(block_count, BLOCK_SIZE)
+        # Level k holds the extrema of 2^k blocks starting at each block
+        self.minima = [np.nanmin(blocks, axis=1)] if block_count > 0 else []
+        self.maxima = [np.nanmax(blocks, axis=1)] if block_count > 0 else []
+        width = 1
+        while 2 * width <= block_count:
+            self.minima.append(
+                np.minimum(self.minima[-1][:-width], self.minima[-1][width:])
+            )
+            self.maxima.append(
+                np.maximum(self.maxima[-1][:-width], self.maxima[-1][width:])
+            )
+            width *= 2
+
+    @property
+    def nbytes(self):
+        """Bytes of the sparse tables, the values belong to the caller"""
+        return sum(level.nbytes for level in self.minima + self.maxima)
+
+    def query(self, start, end):
+        """Minimum & maximum of values[start:end], None for an empty range"""
+        if start >= end:
+            return None, None
+        first_block = -(-start // BLOCK_SIZE)
+        last_block = end // BLOCK_SIZE
+        if first_block >= last_block:
+            window = self.values[start:end]
+            return float(window.min()), float(window.max())
+        level = (last_block - first_block).bit_length() - 1
+        minimum = min(
+            self.minima[level][first_block],
+            self.minima[level][last_block - (1 << level)],
+        )
+        maximum = max(
+            self.maxima[level][first_block],
+            self.maxima[level][last_block - (1 << level)],
+        )
+        for partial in (
+            self.values[start : first_block * BLOCK_SIZE],
+            self.values[last_block * BLOCK_SIZE : end],
+        ):
+            if len(partial) > 0:
+                minimum = min(minimum, partial.min())
+                maximum = max(maximum, partial.max())
+        return float(minimum), float(maximum)
+
+
+class SampleIndex:
+    """Prefix sums & range extrema of one sample stream, a sample holds its value until the next sample
+
+    Zones reach from the bound n - 1 (inclusive) to the bound n (exclusive), like the training zones of a workout.
+    """
+
+    def __init__(self, times, values, zoneBounds=None):
+        order = np.argsort(times, kind="stable")
+        self.times = np.asarray(times, dtype=float)[order]
+        self.values = np.asarray(values, dtype=float)[order]
+        self.value_sums = np.concatenate(([0.0], np.cumsum(self.values)))
+        self.extrema = RangeExtrema(self.values)
+        changes = np.diff(self.values)
+        self.rises = np.concatenate(([0.0], np.cumsum(np.maximum(changes, 0))))
+        self.falls = np.concatenate(([0.0], np.cumsum(np.maximum(-changes, 0))))
+        # The last sample holds its value for no time
+        self.holds = np.append(np.diff(self.times), 0.0)
+        self.zones = None
+        if zoneBounds is not None:
+            lower = [-np.inf, *zoneBounds]
+            upper = [*zoneBounds, np.inf]
+            self.zones = np.array(
+                [
+                    (lower[zone] <= self.values) & (self.values < upper[zone])
+                    for zone in range(len(lower))
+                ]
+            ).reshape(len(lower), len(self.values))
+            self.zone_times = np.concatenate(
+                (np.zeros((len(lower), 1)), np.cumsum(self.zones * self.holds, axis=1)),
+                axis=1,
+            )
+
+    @property
+    def nbytes(self):
+        arrays = [
+            self.times,
+            self.values,
+            self.value_sums,
+            self.rises,
+            self.falls,
+            self.holds,
+        ]
+        if self.zones is not None:
+            arrays += [self.zones, self.zone_times]
+        return sum(array.nbytes for array in arrays) + self.extrema.nbytes
+
+    def window(self, start, end):
+        """Index range of the samples in the time window [start, end)"""
+        return (
+            int(np.searchsorted(self.times, start, side="left")),
+            int(np.searchsorted(self.times, end, side="left")),
+        )
+
+    def statistics(self, start, end):
+        """Minimum, maximum & mean of the samples in the time window [start, end)"""
+        first, last = self.window(start, end)
+        minimum, maximum = self.extrema.query(first, last)
+        count = last - first
+        return {
+            "samples": count,
+            "min": minimum,
+            "max": maximum,
+            "mean": float((self.value_sums[last] - self.value_sums[first]) / count)
+            if count > 0
+            else None,
+        }
+
+    def changes(self, start, end):
+        """Sums of the rises & falls between consecutive samples in the time window [start, end)"""
+        first, last = self.window(start, end)
+        if last - first < 2:
+            return 0.0, 0.0
+        return (
+            float(self.rises[last - 1] - self.rises[first]),
+            float(self.falls[last - 1] - self.falls[first]),
+        )
+
+    def zone_times_until(self, time):
+        """Seconds spent in each zone up to a time"""
+        index = int(np.searchsorted(self.times, time, side="right")) - 1
+        if index < 0:
+            return np.zeros(len(self.zones))
+        held = min(time - self.times[index], self.holds[index])
+        return self.zone_times[:, index] + held * self.zones[:, index]
+
+    def time_in_zones(self, start, end):
+        """Seconds spent in each zone in the time window [start, end), None without zones"""
+        if self.zones is None:
+            return None
+        seconds = self.zone_times_until(end) - self.zone_times_until(start)
+        return {f"zone{zone}": float(value) for zone, value in enumerate(seconds)}
+
+
+class SegmentIndex:
+    """Indexes of the heart rate, speed & altitude samples of a workout"""
+
+    def __init__(
+        self,
+        heart_rate_columns,
+        speed_columns,
+        altitude_columns,
+        heartRateZoneBounds=None,
+        speedZoneBounds=None,
+    ):
+        self.heartRate = SampleIndex(*heart_rate_columns, heartRateZoneBounds)
+        self.speed = SampleIndex(*speed_columns, speedZoneBounds)
+        self.altitude = SampleIndex(*altitude_columns)
+
+    @property
+    def nbytes(self):
+        return self.heartRate.nbytes + self.speed.nbytes + self.altitude.nbytes
+
+    def segment(self, start, end):
+        """Statistics of the samples in the time window [start, end) (seconds since start)"""
+        gain, loss = self.altitude.changes(start, end)
+        return {
+            "start": start,
+            "end": end,
+            "heartRate": {
+                **self.heartRate.statistics(start, end),
+                "timeInZones": self.heartRate.time_in_zones(start, end),
+            },
+            "speed": {
+                **self.speed.statistics(start, end),
+                "timeInZones": self.speed.time_in_zones(start, end),
+            },
+            "altitude": {
+                **self.altitude.statistics(start, end),
+                "gain": gain,
+                "loss": loss,
+            },
+        }
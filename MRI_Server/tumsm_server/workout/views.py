@@ -34,7 +34,7 @@ def add():
     """Add workout."""
     form = AddWorkoutForm(request.form)
     if form.validate_on_submit():
-        workout = create_workout(form.healthJsonData.data, form.patientId.data)
+        workout = create_workout(form.payload, form.patientId.data)
         flash(
             f"A new workout has been for patient {form.patientId.data}",
             "success",